@@ -19,10 +19,11 @@ from __future__ import unicode_literals, with_statement
 from ._compat import to_native
 from .environ import __client_version__ as __version__
 
+from ._stream import MatrixWriter
 from .repo import DataSet, Repo
 
 
-__all__ = ['DataSet', 'Repo', ]
+__all__ = ['DataSet', 'MatrixWriter', 'Repo', ]
 __all__ = [to_native(n) for n in __all__]
 
 
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+    datagator.api.client._aio
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Asyncio counterparts of :class:`validated` and ``Entity._cache_getter``
+    (requires Python 3.5+), e.g.,
+
+    .. code-block:: python
+
+        async with AsyncDataGatorService() as service:
+            await asyncio.gather(*[cache_getter(e, service) for e in items])
+
+    :copyright: 2015 by `University of Denver <http://pardee.du.edu/>`_
+    :license: Apache 2.0, see LICENSE for more details.
+
+    :author: `LIU Yu <liuyu@opencps.net>`_
+    :date: 2015/12/14
+"""
+
+from __future__ import unicode_literals, with_statement
+
+import logging
+
+from . import _entity
+from ._backend.aio import AsyncDataGatorService
+from ._compat import to_native
+from ._entity import Entity
+
+
+__all__ = ['AsyncDataGatorService', 'validated', 'cache_getter', ]
+__all__ = [to_native(n) for n in __all__]
+
+
+_log = logging.getLogger(__name__)
+
+
+class _ResponseProxy(object):
+    """
+    Expose an `aiohttp` response through the attributes `validated` expects
+    from a `requests` response
+    """
+
+    __slots__ = ['response', ]
+
+    # `aiohttp` does not keep track of response time
+    elapsed = None
+
+    def __init__(self, response):
+        self.response = response
+        pass
+
+    @property
+    def status_code(self):
+        return self.response.status
+
+    @property
+    def headers(self):
+        return self.response.headers
+
+    @property
+    def url(self):
+        return str(self.response.url)
+
+    pass
+
+
+class validated(_entity.validated):
+    """
+    Asynchronous context manager and proxy to validated response from backend
+    service
+    """
+
+    __slots__ = ['__source', ]
+
+    def __init__(self, response, verify_status=True):
+        """
+        :param response: `aiohttp` response object from the backend service
+        :param exptected: `list` or `tuple` of expected status codes
+        """
+        super(validated, self).__init__(
+            _ResponseProxy(response), verify_status)
+        self.__source = response
+        pass
+
+    async def __aenter__(self):
+        try:
+            self._prepare()
+            buf = bytearray()
+            # `aiohttp` transparently decodes gzip / deflate content
+            async for chunk in self.__source.content.iter_chunked(
+                    self.DEFAULT_CHUNK_SIZE):
+                buf.extend(chunk)
+        except (AssertionError, IOError, ):
+            # re-raise as runtime error
+            raise RuntimeError("invalid response from backend service")
+        finally:
+            # return the connection to the pool for reuse
+            self.__source.release()
+        return self._complete(bytes(buf))
+
+    async def __aexit__(self, ext_type, exc_value, traceback):
+        return self.__exit__(ext_type, exc_value, traceback)
+
+    pass
+
+
+async def cache_getter(entity, service):
+    """
+    Awaitable version of ``entity.cache``.
+
+    :param entity: `Entity` object (e.g. `Repo`, `DataSet`) to look up.
+    :param service: `AsyncDataGatorService` object for cache misses.
+    :returns: JSON-decoded content of the entity.
+    """
+    data = Entity.store.get(entity.uri, None)
+    if data is None:
+        async with validated(await service.get(entity.uri)) as r:
+            data = entity._cache_response(r)
+    return data
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""
+    datagator.api.client._backend.aio
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Asyncio counterpart of :class:`DataGatorService` (requires Python 3.5+).
+
+    :copyright: 2015 by `University of Denver <http://pardee.du.edu/>`_
+    :license: Apache 2.0, see LICENSE for more details.
+
+    :author: `LIU Yu <liuyu@opencps.net>`_
+    :date: 2015/12/14
+"""
+
+from __future__ import unicode_literals, with_statement
+
+import asyncio
+import logging
+import time
+
+from .. import environ
+from .._compat import to_native
+from .ratelimit import get_limiter
+from .service import ThrottleAdapter, make_payload, safe_url
+
+try:
+    import aiohttp
+except ImportError:
+    raise ImportError("""Could not load `aiohttp` dependency.
+        See http://aiohttp.readthedocs.org/""")
+
+
+__all__ = ['AsyncDataGatorService', ]
+__all__ = [to_native(n) for n in __all__]
+
+
+_log = logging.getLogger(__package__)
+
+
+class AsyncDataGatorService(object):
+    """
+    Asynchronous HTTP client for DataGator's backend services.
+
+    All requests share a bounded pool of keep-alive connections, so that a
+    single event loop can keep many requests in flight at the same time.
+    """
+
+    MAX_CONNECTIONS = 32
+
+    __slots__ = ['__auth', '__verify', '__max_connections', '__session',
+                 '__limiter', ]
+
+    def __init__(self, auth=None, verify=not environ.DEBUG,
+                 max_connections=MAX_CONNECTIONS):
+        """
+        Optional arguments:
+
+        :param auth: 2-``tuple`` of ``<username>`` and ``<secret>`` for use
+            in HTTP basic authentication, defaults to ``None``.
+        :param verify: perform SSL verification, defaults to ``False`` in
+            debugging mode and ``True`` otherwise.
+        :param max_connections: maximum number of concurrent connections.
+        """
+        super(AsyncDataGatorService, self).__init__()
+        self.__session = None
+        self.__max_connections = max_connections
+        self.auth = auth
+        # turn off SSL verification in DEBUG mode, i.e. the testbed web server
+        # may not have a domain name matching the official SSL certificate
+        if not verify:
+            _log.warning("disabled SSL verification")
+        self.__verify = bool(verify)
+        pass
+
+    @property
+    def http(self):
+        """
+        underlying HTTP session (created on first use within an event loop)
+        """
+        if self.__session is None or self.__session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.__max_connections,
+                limit_per_host=self.__max_connections,
+                ssl=None if self.__verify else False)
+            # common http headers shared by all requests
+            self.__session = aiohttp.ClientSession(
+                connector=connector,
+                headers={
+                    "User-Agent": environ.DATAGATOR_API_USER_AGENT,
+                    "Accept": "application/json, */*",
+                    "Accept-Encoding": environ.DATAGATOR_API_ACCEPT_ENCODING})
+        return self.__session
+
+    @property
+    def auth(self):
+        if self.__auth is None:
+            return None
+        return (self.__auth.login, self.__auth.password)
+
+    @auth.setter
+    def auth(self, auth):
+        if auth:
+            _log.info("enabled HTTP authentication")
+            self.__auth = aiohttp.BasicAuth(*auth)
+        else:
+            self.__auth = None
+        # authenticated and anonymous clients are subject to different quotas
+        self.__limiter = get_limiter(auth)
+        pass
+
+    @property
+    def limiter(self):
+        """
+        rate limiter accounting for the API calls of this session
+        """
+        return self.__limiter
+
+    async def _acquire(self, timeout):
+        deadline = None if timeout is None else time.time() + timeout
+        delay = self.__limiter.reserve()
+        while delay > 0:
+            if deadline is not None and time.time() + delay > deadline:
+                raise asyncio.TimeoutError(
+                    "request cannot be send within user-specified timeout")
+            _log.debug("entering sleep for rate control")
+            _log.debug("  - {0} seconds".format(delay))
+            await asyncio.sleep(delay)
+            delay = self.__limiter.reserve()
+        pass
+
+    async def request(self, method, path, data=None, headers={},
+                      timeout=environ.DATAGATOR_API_TIMEOUT):
+        """
+        :param method: HTTP method, e.g. ``"GET"``.
+        :param path: relative url w.r.t. ``DATAGATOR_API_URL``.
+        :param data: request body, either ``bytes`` or a file-like object.
+        :param headers: extra HTTP headers to be sent with request.
+        :param timeout: connection timeout in seconds.
+        :returns: HTTP response object.
+        """
+        attempted = 0
+        r = None
+        while attempted < ThrottleAdapter.max_attempts:
+            await self._acquire(timeout)
+            try:
+                r = await self.http.request(
+                    method=method,
+                    url=safe_url(path),
+                    data=data,
+                    headers=headers,
+                    auth=self.__auth,
+                    allow_redirects=environ.DATAGATOR_API_FOLLOW_REDIRECT,
+                    timeout=aiohttp.ClientTimeout(total=timeout))
+            except Exception:
+                # release the reserved API call
+                self.__limiter.update(None, {})
+                raise
+            attempted += 1
+            # same rate control policy as `ThrottleAdapter.send()`
+            self.__limiter.update(r.status, r.headers)
+            if r.status != 429:
+                break
+            if "X-RateLimit-Reset" not in r.headers and \
+                    "Retry-After" not in r.headers:
+                self.__limiter.block(15 * (2 ** attempted))
+            # a file-like request body cannot be replayed
+            if hasattr(data, "read") or attempted == \
+                    ThrottleAdapter.max_attempts:
+                break
+            r.release()
+        return r
+
+    async def delete(self, path, headers={}):
+        """
+        :param path: relative url w.r.t. ``DATAGATOR_API_URL``.
+        :param headers: extra HTTP headers to be sent with request.
+        :returns: HTTP response object.
+        """
+        return await self.request("DELETE", path, headers=headers)
+
+    async def get(self, path, headers={},
+                  timeout=environ.DATAGATOR_API_TIMEOUT):
+        """
+        :param path: relative url w.r.t. ``DATAGATOR_API_URL``.
+        :param headers: extra HTTP headers to be sent with request.
+        :param timeout: connection timeout in seconds.
+        :returns: HTTP response object (body is always streamed).
+        """
+        return await self.request("GET", path, headers=headers,
+                                  timeout=timeout)
+
+    async def head(self, path, headers={}):
+        """
+        :param path: relative url w.r.t. ``DATAGATOR_API_URL``.
+        :param headers: extra HTTP headers to be sent with request.
+        :returns: HTTP response object.
+        """
+        return await self.request("HEAD", path, headers=headers)
+
+    async def options(self, path, headers={}):
+        """
+        :param path: relative url w.r.t. ``DATAGATOR_API_URL``.
+        :param headers: extra HTTP headers to be sent with request.
+        :returns: HTTP response object.
+        """
+        return await self.request("OPTIONS", path, headers=headers)
+
+    async def patch(self, path, data, headers={}):
+        """
+        :param path: relative url w.r.t. ``DATAGATOR_API_URL``.
+        :param data: JSON-serializable data object.
+        :param headers: extra HTTP headers to be sent with request.
+        :returns: HTTP response object.
+        """
+        headers = dict(headers)
+        headers.setdefault('Content-Type', "application/json")
+        return await self.request("PATCH", path, data=make_payload(data),
+                                  headers=headers)
+
+    async def post(self, path, data, files={}, headers={}):
+        """
+        :param path: relative url w.r.t. ``DATAGATOR_API_URL``.
+        :param data: JSON-serializable data object.
+        :param file: dictionary of files ``{<key>: (<filename>, <file>)}``.
+        :param headers: extra HTTP headers to be sent with request.
+        :returns: HTTP response object.
+        """
+        headers = dict(headers)
+        if files:
+            # multipart boundary is chosen by `aiohttp`, so the content type
+            # header cannot be fixed in advance (unlike the `requests` case)
+            form = aiohttp.FormData()
+            for key, value in (data or {}).items():
+                form.add_field(key, value)
+            for key, (filename, f) in files.items():
+                form.add_field(key, f, filename=filename)
+            data = form
+        else:
+            data = make_payload(data)
+            headers.setdefault('Content-Type', "application/json")
+        return await self.request("POST", path, data=data, headers=headers)
+
+    async def put(self, path, data, headers={}):
+        """
+        :param path: relative url w.r.t. ``DATAGATOR_API_URL``.
+        :param data: JSON-serializable data object.
+        :param headers: extra HTTP headers to be sent with request.
+        :returns: HTTP response object.
+        """
+        headers = dict(headers)
+        headers.setdefault('Content-Type', "application/json")
+        return await self.request("PUT", path, data=make_payload(data),
+                                  headers=headers)
+
+    async def _json(self, path):
+        r = await self.get(path)
+        try:
+            return await r.json()
+        finally:
+            r.release()
+        pass
+
+    @property
+    def status(self):
+        """
+        general status of the backend service (awaitable)
+        """
+        return self._json("/")
+
+    @property
+    def schema(self):
+        """
+        JSON schema being used by the backend service (awaitable)
+        """
+        return self._json("/schema")
+
+    async def close(self):
+        # close the underlying HTTP session and its connection pool
+        if self.__session is not None:
+            await self.__session.close()
+            self.__session = None
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, ext_type, exc_value, traceback):
+        await self.close()
+        return False  # re-raise exception
+
+    pass
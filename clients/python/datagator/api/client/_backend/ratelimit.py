@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""
+    datagator.api.client._backend.ratelimit
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Client-side models of the hourly API budget of the backend service, see
+    the *rate limiting* topic in ``docs/api2.rst``.
+
+    :copyright: 2015 by `University of Denver <http://pardee.du.edu/>`_
+    :license: Apache 2.0, see LICENSE for more details.
+
+    :author: `LIU Yu <liuyu@opencps.net>`_
+    :date: 2015/12/15
+"""
+
+from __future__ import unicode_literals, with_statement
+
+import abc
+import fcntl
+import importlib
+import json
+import logging
+import os
+import threading
+import time
+
+from .. import environ
+from .._compat import to_bytes, to_native
+
+
+__all__ = ['RateLimiter', 'TokenBucket', 'SharedTokenBucket',
+           'get_limiter', ]
+__all__ = [to_native(n) for n in __all__]
+
+
+_log = logging.getLogger(__package__)
+
+
+class RateLimiter(object):
+    """
+    Abstract base class of client-side rate limiters
+    """
+
+    @abc.abstractmethod
+    def reserve(self, cost=1):
+        """
+        :param cost: number of API calls to be consumed.
+        :returns: ``0`` if the calls are granted (and accounted for), or the
+            number of seconds to wait before trying again.
+        """
+        pass
+
+    @abc.abstractmethod
+    def update(self, status_code, headers, cost=1):
+        """
+        :param status_code: HTTP status code of a response.
+        :param headers: HTTP message headers of a response.
+        :param cost: number of API calls reserved for the request.
+        """
+        pass
+
+    @abc.abstractmethod
+    def block(self, seconds):
+        """
+        :param seconds: suspend all API calls for a period of time.
+        """
+        pass
+
+    def acquire(self, cost=1, timeout=None):
+        """
+        Wait until the calls are granted.
+
+        :param cost: number of API calls to be consumed.
+        :param timeout: maximum seconds to wait, defaults to ``None``.
+        :returns: ``True`` on success, or ``False`` on timeout.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        delay = self.reserve(cost)
+        while delay > 0:
+            if deadline is not None and time.time() + delay > deadline:
+                return False
+            _log.debug("entering sleep for rate control")
+            _log.debug("  - {0} seconds".format(delay))
+            time.sleep(delay)
+            delay = self.reserve(cost)
+        return True
+
+    pass
+
+
+class TokenBucket(RateLimiter):
+    """
+    Token bucket holding the remaining API calls of the current rate limiting
+    window, re-synchronized by the ``X-RateLimit-*`` headers of responses
+    """
+
+    # length of a rate limiting window (1 hour)
+    WINDOW = 3600
+
+    # minimum gap between two consecutive API calls
+    MIN_INTERVAL = 0.1
+
+    __slots__ = ['__lock', '__state', ]
+
+    def __init__(self, limit):
+        """
+        :param limit: number of API calls allowed per ``WINDOW``.
+        """
+        super(TokenBucket, self).__init__()
+        self.__lock = threading.RLock()
+        self.__state = self._initial_state(limit)
+        pass
+
+    @staticmethod
+    def _initial_state(limit):
+        now = time.time()
+        return {
+            "limit": limit,       # capacity of the bucket
+            "tokens": limit,      # API calls deemed available
+            "pending": 0,         # API calls in flight (sent, not responded)
+            "reset": None,        # UNIX time when the window resets
+            "blocked": now,       # no API calls until this UNIX time
+            "last": 0,            # UNIX time of the last API call
+            "updated": now, }
+
+    def _load(self):
+        return self.__state
+
+    def _save(self, state):
+        self.__state = state
+        pass
+
+    def _transaction(self):
+        return self.__lock
+
+    def _refill(self, state, now):
+        reset = state['reset']
+        if reset is not None and now < reset:
+            # the backend does not return quota until the window resets
+            pass
+        elif reset is not None:
+            _log.debug("rate limiting window reset")
+            state['tokens'] = state['limit']
+            state['pending'] = 0
+            state['reset'] = None
+        else:
+            # without a known window, quota is restored at the average rate
+            rate = float(state['limit']) / self.WINDOW
+            state['tokens'] = min(
+                state['limit'],
+                state['tokens'] + (now - state['updated']) * rate)
+        state['updated'] = now
+        return state
+
+    def reserve(self, cost=1):
+        with self._transaction():
+            now = time.time()
+            state = self._refill(self._load(), now)
+            ready = max(state['blocked'], state['last'] + self.MIN_INTERVAL)
+            if state['tokens'] < cost:
+                if state['reset'] is not None:
+                    ready = max(ready, state['reset'])
+                else:
+                    rate = float(state['limit']) / self.WINDOW
+                    ready = max(ready, now + (cost - state['tokens']) / rate)
+            if ready <= now:
+                state['tokens'] -= cost
+                state['pending'] += cost
+                state['last'] = now
+            self._save(state)
+        return max(0, ready - now)
+
+    def update(self, status_code, headers, cost=1):
+        with self._transaction():
+            now = time.time()
+            state = self._refill(self._load(), now)
+            state['pending'] = max(0, state['pending'] - cost)
+            try:
+                if "X-RateLimit-Limit" in headers:
+                    state['limit'] = int(headers['X-RateLimit-Limit'])
+                if "X-RateLimit-Reset" in headers:
+                    state['reset'] = int(headers['X-RateLimit-Reset'])
+                if "X-RateLimit-Remaining" in headers:
+                    # calls still in flight are yet to be seen by the backend
+                    state['tokens'] = \
+                        int(headers['X-RateLimit-Remaining']) - \
+                        state['pending']
+                if "Retry-After" in headers:
+                    state['blocked'] = max(
+                        state['blocked'], now + int(headers['Retry-After']))
+            except ValueError:
+                _log.warning("malformed rate limiting headers")
+            if status_code == 429:
+                state['tokens'] = min(0, state['tokens'])
+                if state['reset'] is not None:
+                    state['blocked'] = max(state['blocked'], state['reset'])
+            self._save(state)
+        pass
+
+    def block(self, seconds):
+        with self._transaction():
+            state = self._load()
+            state['blocked'] = max(state['blocked'], time.time() + seconds)
+            self._save(state)
+        pass
+
+    @property
+    def remaining(self):
+        """
+        number of API calls deemed available in the current window
+        """
+        with self._transaction():
+            return int(self._refill(self._load(), time.time())['tokens'])
+
+    pass
+
+
+class _FileLock(object):
+    """
+    Exclusive lock on a state file, shared by threads and processes
+    """
+
+    __slots__ = ['__path', '__lock', '__file', '__depth', ]
+
+    def __init__(self, path):
+        self.__path = path
+        self.__lock = threading.RLock()
+        self.__file = None
+        self.__depth = 0
+        pass
+
+    @property
+    def file(self):
+        return self.__file
+
+    def __enter__(self):
+        self.__lock.acquire()
+        try:
+            if self.__depth == 0:
+                f = open(self.__path, "a+b")
+                fcntl.lockf(f, fcntl.LOCK_EX)
+                self.__file = f
+        except Exception:
+            self.__lock.release()
+            raise
+        self.__depth += 1
+        return self
+
+    def __exit__(self, ext_type, exc_value, traceback):
+        self.__depth -= 1
+        try:
+            if self.__depth == 0:
+                self.__file.flush()
+                fcntl.lockf(self.__file, fcntl.LOCK_UN)
+                self.__file.close()
+                self.__file = None
+        finally:
+            self.__lock.release()
+        return False  # re-raise exception
+
+    pass
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    Token bucket persisted to a lock-protected file, such that all processes
+    (on the same host) spending the same quota draw from a single bucket
+    """
+
+    __slots__ = ['__limit', '__lock', ]
+
+    def __init__(self, limit, path):
+        """
+        :param limit: number of API calls allowed per ``WINDOW``.
+        :param path: state file shared by all participating processes.
+        """
+        super(SharedTokenBucket, self).__init__(limit)
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        self.__limit = limit
+        self.__lock = _FileLock(path)
+        pass
+
+    def _transaction(self):
+        return self.__lock
+
+    def _load(self):
+        f = self.__lock.file
+        f.seek(0)
+        try:
+            return json.loads(to_native(f.read()))
+        except ValueError:
+            # fresh (or corrupted) state file
+            return self._initial_state(self.__limit)
+        pass
+
+    def _save(self, state):
+        f = self.__lock.file
+        f.seek(0)
+        f.truncate()
+        f.write(to_bytes(json.dumps(state)))
+        pass
+
+    pass
+
+
+_limiters = dict()
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(auth=None):
+    """
+    Rate limiter shared by all sessions spending the quota of the same client
+    (i.e. the authenticated user, or the anonymous host).
+
+    The implementation is chosen by ``DATAGATOR_RATE_LIMITER``, a class either
+    taking the hourly ``limit``, or taking ``limit`` and a state file ``path``
+    (e.g. ``SharedTokenBucket``).
+
+    :param auth: 2-``tuple`` of ``<username>`` and ``<secret>``.
+    """
+    identity = auth[0] if auth else None
+    with _limiters_lock:
+        if identity not in _limiters:
+            try:
+                mod, sep, cls = environ.DATAGATOR_RATE_LIMITER.rpartition(".")
+                LimiterClass = getattr(importlib.import_module(mod), cls)
+                assert(issubclass(LimiterClass, RateLimiter))
+            except (ImportError, AttributeError, AssertionError):
+                raise AssertionError("invalid rate limiter '{0}'".format(
+                    environ.DATAGATOR_RATE_LIMITER))
+            # authenticated clients can make up to 2,000 API calls per hour,
+            # and 200 calls per hour for unauthorized clients.
+            limit = 2000 if identity else 200
+            if issubclass(LimiterClass, SharedTokenBucket):
+                path = os.path.join(
+                    environ.DATAGATOR_HOME, "ratelimit", "{0}.json".format(
+                        identity or "anonymous"))
+                _limiters[identity] = LimiterClass(limit, path)
+            else:
+                _limiters[identity] = LimiterClass(limit)
+        return _limiters[identity]
+    pass
@@ -12,22 +12,29 @@
 
 from __future__ import unicode_literals, with_statement
 
-import datetime as dt
 import json
 import logging
 import os
 import requests
 import ssl
-import time
+import tempfile
+import zlib
 
 from .. import environ
-from .._compat import to_bytes, to_native
+from .._compat import text_type, to_bytes, to_native
+from .ratelimit import get_limiter
 
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.poolmanager import PoolManager
 from requests.status_codes import codes
 from requests.exceptions import Timeout
 
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    raise ImportError("""Could not load `futures` dependency.
+        See https://pypi.python.org/pypi/futures""")
+
 
 __all__ = ['DataGatorService', ]
 __all__ = [to_native(n) for n in __all__]
@@ -42,8 +49,14 @@ class ThrottleAdapter(HTTPAdapter):
     """
 
     max_attempts = 3
-    min_wait = dt.timedelta(microseconds=100000)  # 0.1 sec
-    scheduled = None
+
+    def __init__(self, limiter, *args, **kwargs):
+        """
+        :param limiter: `RateLimiter` object accounting for the API calls.
+        """
+        self.limiter = limiter
+        super(ThrottleAdapter, self).__init__(*args, **kwargs)
+        pass
 
     def send(self, request, stream=False, timeout=None, verify=True, cert=None,
              proxies=None):
@@ -52,54 +65,56 @@ class ThrottleAdapter(HTTPAdapter):
             timeout = timeout[0]
 
         attempted = 0
-        max_wait = None if timeout is None else dt.timedelta(seconds=timeout)
         response = None
 
-        while attempted < ThrottleAdapter.max_attempts:
-
-            scheduled = ThrottleAdapter.scheduled
-            timestamp = dt.datetime.utcnow()
-            wait_for = dt.timedelta(0)
+        # a file-like request body is rewound before being sent again, and
+        # any other stream (e.g. a generator) cannot be replayed at all
+        body = request.body
+        offset = None
+        replayable = body is None or isinstance(body, (bytes, text_type))
+        if not replayable:
+            try:
+                offset = body.tell()
+                replayable = True
+            except (AttributeError, IOError, ValueError):
+                pass
 
-            if scheduled is not None and scheduled >= timestamp:
-                wait_for = scheduled - timestamp
+        while attempted < ThrottleAdapter.max_attempts:
 
-            if max_wait is not None and wait_for > max_wait:
+            if not self.limiter.acquire(timeout=timeout):
                 raise Timeout(
                     "request cannot be send within user-specified timeout")
 
-            if wait_for > dt.timedelta(0):
-                _log.debug("entering sleep for rate control")
-                # python 2.6 and before do not have `timedelta.total_seconds()`
-                wait_seconds = float(wait_for.microseconds) / 1000000 + \
-                    wait_for.seconds + wait_for.days * 86400
-                _log.debug("  - {0} seconds".format(wait_seconds))
-                time.sleep(wait_seconds)
-
-            response = super(ThrottleAdapter, self).send(
-                request, stream=stream, timeout=timeout, verify=verify,
-                cert=cert, proxies=proxies)
+            try:
+                response = super(ThrottleAdapter, self).send(
+                    request, stream=stream, timeout=timeout, verify=verify,
+                    cert=cert, proxies=proxies)
+            except Exception:
+                # release the reserved API call
+                self.limiter.update(None, {})
+                raise
 
             attempted += 1
 
+            # re-synchronize the rate limiter with `X-RateLimit-*` headers,
+            # and schedule the next send() upon `Retry-After` (if any)
+            self.limiter.update(response.status_code, response.headers)
+
             if response.status_code != codes.too_many_requests:
-                # apply minimum wait time when no over rate
-                ThrottleAdapter.scheduled = \
-                    timestamp + ThrottleAdapter.min_wait
                 break
 
-            # when there is an `X-RateLimit-Reset` header, we know when the
-            # rate-limiting quota resets, so we schedule next send() to that
-            # exact timestamp;
-            if "X-RateLimit-Reset" in response.headers:
-                ThrottleAdapter.scheduled = dt.datetime.utcfromtimestamp(
-                    int(response['X-RateLimit-Reset']))
-                continue
-
-            # otherwise, we apply exponential backoff time to the next send()
+            # when there is neither `X-RateLimit-Reset` nor `Retry-After`
+            # header, we apply exponential backoff time to the next send()
             # according to the # of previous attempts, i.e. 30, 60, 120 sec
-            ThrottleAdapter.scheduled = \
-                timestamp + dt.timedelta(seconds=15 * (2 ** attempted))
+            if "X-RateLimit-Reset" not in response.headers and \
+                    "Retry-After" not in response.headers:
+                self.limiter.block(15 * (2 ** attempted))
+
+            if not replayable or attempted == ThrottleAdapter.max_attempts:
+                break
+            if offset is not None:
+                body.seek(offset)
+            response.close()
 
         return response
 
@@ -149,14 +164,52 @@ def make_payload(data):
     return to_bytes(json.dumps(data, ensure_ascii=False))
 
 
+def gzip_payload(payload, chunk_size=2 ** 16):
+    """
+    :param payload: bytes or file-like object returned by
+        :func:`make_payload`, which is compressed (i.e. read) in chunks.
+    :param chunk_size: bytes read from ``payload`` at a time.
+    :returns: spooled file of the gzip-compressed ``payload``, rewound to the
+        beginning, so that the request keeps its ``Content-Length``.
+    """
+    f = tempfile.SpooledTemporaryFile(max_size=2 ** 21)
+    c = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    if hasattr(payload, "read"):
+        while True:
+            chunk = payload.read(chunk_size)
+            if not chunk:
+                break
+            f.write(c.compress(to_bytes(chunk)))
+    else:
+        f.write(c.compress(payload))
+    f.write(c.flush())
+    f.seek(0)
+    return f
+
+
 class DataGatorService(object):
     """
     HTTP client for DataGator's backend services.
     """
 
-    __slots__ = ['http', ]
+    # size of the pool of keep-alive connections
+    MAX_CONNECTIONS = 16
+
+    # default number of concurrent requests sent by `get_many()`
+    MAX_WORKERS = 8
 
-    def __init__(self, auth=None, verify=not environ.DEBUG):
+    # request bodies smaller than this are not worth compressing
+    MIN_COMPRESS_BYTES = 2 ** 10
+
+    # a compressed request body is sent again uncompressed upon a 415
+    # response, i.e. the backend service does not support the encoding
+    # (unless the uncompressed body fails the same way); other errors,
+    # including 400, are returned as-is
+
+    __slots__ = ['http', '__throttle', '__gzip', ]
+
+    def __init__(self, auth=None, verify=not environ.DEBUG,
+                 gzip=environ.DATAGATOR_API_GZIP):
         """
         Optional arguments:
 
@@ -164,7 +217,10 @@ class DataGatorService(object):
             in HTTP basic authentication, defaults to ``None``.
         :param verify: perform SSL verification, defaults to ``False`` in
             debugging mode and ``True`` otherwise.
+        :param gzip: compress the (JSON) bodies of ``PATCH``, ``POST`` and
+            ``PUT`` requests, defaults to ``DATAGATOR_API_GZIP``.
         """
+        self.__gzip = bool(gzip)
 
         self.http = requests.Session()
 
@@ -173,9 +229,10 @@ class DataGatorService(object):
         self.http.mount('https://', TLSv1Adapter())
 
         # apply rate limitation
-        throttle = ThrottleAdapter()
-        self.http.mount('http://', throttle)
-        self.http.mount('https://', throttle)
+        self.__throttle = ThrottleAdapter(
+            get_limiter(auth), pool_maxsize=self.MAX_CONNECTIONS)
+        self.http.mount('http://', self.__throttle)
+        self.http.mount('https://', self.__throttle)
 
         self.auth = auth
 
@@ -210,8 +267,58 @@ class DataGatorService(object):
             self.http.auth = auth
         else:
             self.http.auth = None
+        # authenticated and anonymous clients are subject to different quotas
+        self.__throttle.limiter = get_limiter(auth)
         pass
 
+    @property
+    def limiter(self):
+        """
+        rate limiter accounting for the API calls of this session
+        """
+        return self.__throttle.limiter
+
+    @property
+    def gzip(self):
+        """
+        ``True`` if request bodies are sent gzip-compressed, which is turned
+        off once the backend service rejects them
+        """
+        return self.__gzip
+
+    def _send(self, method, path, data, headers):
+        # send a JSON-encoded payload, compressed if enabled (and worthwhile)
+        headers = dict(headers)
+        headers.setdefault('Content-Type', "application/json")
+        data = make_payload(data)
+        if not self.__gzip or (
+                not hasattr(data, "read") and
+                len(data) < self.MIN_COMPRESS_BYTES):
+            return self.http.request(
+                method=method, url=safe_url(path), data=data,
+                headers=headers)
+        start = data.tell() if hasattr(data, "read") else None
+        body = gzip_payload(data)
+        try:
+            r = self.http.request(
+                method=method, url=safe_url(path), data=body,
+                headers=dict(headers, **{"Content-Encoding": "gzip"}))
+        finally:
+            body.close()
+        if r.status_code != codes.unsupported_media_type:
+            return r
+        _log.debug("compressed request body rejected, sending it as-is")
+        r.close()
+        if start is not None:
+            data.seek(start)
+        r = self.http.request(
+            method=method, url=safe_url(path), data=data, headers=headers)
+        if r.status_code < 400:
+            _log.warning("backend service does not support compressed "
+                         "request bodies, disabled compression")
+            self.__gzip = False
+        return r
+
     def delete(self, path, headers={}):
         """
         :param path: relative url w.r.t. ``DATAGATOR_API_URL``.
@@ -241,6 +348,37 @@ class DataGatorService(object):
             timeout=timeout)
         return r
 
+    def get_many(self, paths, max_workers=MAX_WORKERS, headers={},
+                 callback=None):
+        """
+        Send concurrent GET requests over the pooled connections, all of
+        which are accounted for by the rate limiter.
+
+        :param paths: relative urls w.r.t. ``DATAGATOR_API_URL``.
+        :param max_workers: maximum number of requests in flight.
+        :param headers: extra HTTP headers to be sent with each request.
+        :param callback: callable of ``(<path>, <response>)`` consuming the
+            streamed response body in the same worker thread, the response
+            is closed afterwards.
+        :returns: ``list`` of HTTP response objects (or return values of
+            ``callback``) in the order of ``paths``.
+        """
+
+        def fetch(path):
+            r = self.get(path, headers=headers, stream=callback is not None)
+            if callback is None:
+                return r
+            try:
+                return callback(path, r)
+            finally:
+                r.close()
+
+        paths = list(paths)
+        if len(paths) < 2 or max_workers < 2:
+            return [fetch(path) for path in paths]
+        with ThreadPoolExecutor(min(max_workers, len(paths))) as executor:
+            return list(executor.map(fetch, paths))
+
     def head(self, path, headers={}):
         """
         :param path: relative url w.r.t. ``DATAGATOR_API_URL``.
@@ -272,13 +410,7 @@ class DataGatorService(object):
         :param headers: extra HTTP headers to be sent with request.
         :returns: HTTP response object.
         """
-        headers.setdefault('Content-Type', "application/json")
-        r = self.http.request(
-            method="PATCH",
-            url=safe_url(path),
-            data=make_payload(data),
-            headers=headers)
-        return r
+        return self._send("PATCH", path, data, headers)
 
     def post(self, path, data, files={}, headers={}):
         """
@@ -289,12 +421,11 @@ class DataGatorService(object):
         :returns: HTTP response object.
         """
 
-        if files:
-            headers.setdefault('Content-Type', "multipart/form-data")
-        else:
-            data = make_payload(data)
-            headers.setdefault('Content-Type', "application/json")
+        if not files:
+            return self._send("POST", path, data, headers)
 
+        headers = dict(headers)
+        headers.setdefault('Content-Type', "multipart/form-data")
         r = self.http.request(
             method="POST",
             url=safe_url(path),
@@ -310,13 +441,7 @@ class DataGatorService(object):
         :param headers: extra HTTP headers to be sent with request.
         :returns: HTTP response object.
         """
-        headers.setdefault('Content-Type', "application/json")
-        r = self.http.request(
-            method="PUT",
-            url=safe_url(path),
-            data=make_payload(data),
-            headers=headers)
-        return r
+        return self._send("PUT", path, data, headers)
 
     @property
     def status(self):
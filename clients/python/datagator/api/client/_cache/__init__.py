@@ -13,14 +13,144 @@
 from __future__ import unicode_literals, with_statement
 
 import abc
+import logging
+import re
+import threading
+import time
 
 from .._compat import to_native
 
 
-__all__ = ['CacheManager', ]
+__all__ = ['CacheManager', 'Evictor', 'SingleFlight', 'expires',
+           'is_immutable', ]
 __all__ = [to_native(n) for n in __all__]
 
 
+_log = logging.getLogger(__name__)
+
+
+# URI's of revision-pinned entities, e.g. `repo/<repo>/<dataset>.<rev>[/..]`
+_IMMUTABLE_URI = re.compile(
+    r"^repo/[^/]+/[A-Za-z][A-Za-z0-9_]{0,29}\.\d+(/|$)")
+
+
+def is_immutable(key):
+    """
+    Content of revision-pinned entities never changes in the backend service
+    """
+    return _IMMUTABLE_URI.match(key) is not None
+
+
+def expires(key, ttl):
+    """
+    UNIX time when a newly cached entry should be revalidated, or ``None`` if
+    the entry never expires
+    """
+    if ttl is None or is_immutable(key):
+        return None
+    return time.time() + ttl
+
+
+class Evictor(object):
+    """
+    Run the eviction routine of a cache manager in a background thread
+    """
+
+    __slots__ = ['__thread', '__lock', ]
+
+    def __init__(self):
+        self.__thread = None
+        self.__lock = threading.Lock()
+        pass
+
+    def _run(self, routine):
+        try:
+            routine()
+        except Exception as e:
+            _log.warning("failed to evict cache entries: {0}".format(e))
+        finally:
+            with self.__lock:
+                self.__thread = None
+        pass
+
+    def trigger(self, routine):
+        """
+        :param routine: callable evicting entries until the cache is under
+            its size limit (ignored if an eviction is already in progress).
+        """
+        with self.__lock:
+            if self.__thread is not None:
+                return
+            self.__thread = threading.Thread(
+                target=self._run, args=(routine, ))
+            self.__thread.daemon = True
+            self.__thread.start()
+        pass
+
+    pass
+
+
+class SingleFlight(object):
+    """
+    Collapse concurrent calls for the same key into a single call
+
+    The first caller of a key runs the call, while the others wait for (and
+    share) its outcome. Calls for different keys do not block each other.
+    """
+
+    class Call(object):
+
+        __slots__ = ['done', 'value', 'error', ]
+
+        def __init__(self):
+            self.done = threading.Event()
+            self.value = None
+            self.error = None
+            pass
+
+        pass
+
+    __slots__ = ['__lock', '__calls', ]
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__calls = {}
+        pass
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__calls)
+
+    def do(self, key, fn):
+        """
+        :param key: hashable key identifying the call.
+        :param fn: callable without arguments.
+        :returns: return value of ``fn()``, from this or a concurrent call.
+        """
+        with self.__lock:
+            call = self.__calls.get(key, None)
+            leader = call is None
+            if leader:
+                call = self.__calls[key] = SingleFlight.Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+        try:
+            call.value = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.__lock:
+                del self.__calls[key]
+            call.done.set()
+        return call.value
+
+    pass
+
+
 class CacheManager(object):
     """
     Abstract base class of disk-persisted cache manager
@@ -31,9 +161,47 @@ class CacheManager(object):
         pass
 
     @abc.abstractmethod
-    def put(self, key, value):
+    def put(self, key, value, meta=None):
+        """
+        :param key: URI of the cached entity.
+        :param value: JSON-serializable object, or bytes-like (or file-like)
+            object of the JSON-encoded content.
+        :param meta: ``dict`` of revalidation metadata (e.g. ``etag`` and
+            ``last_modified``) to be stored along with ``value``, plus the
+            ``codec`` (and ``length``) of a ``value`` compressed already,
+            see :func:`datagator.api.client._cache.codec.pack`.
+        """
+        pass
+
+    @abc.abstractmethod
+    def meta(self, key):
+        """
+        :param key: URI of the cached entity.
+        :returns: ``dict`` of revalidation metadata (as well as ``size``,
+            ``codec``, etc. of the cached value), or ``None``.
+        """
+        pass
+
+    @abc.abstractmethod
+    def touch(self, key):
+        """
+        Renew the expiration time of a cached entry (i.e. upon successful
+        revalidation).
+
+        :param key: URI of the cached entity.
+        """
         pass
 
+    def stale(self, key):
+        """
+        :param key: URI of the cached entity.
+        :returns: ``True`` if the cached entry needs revalidation.
+        """
+        meta = self.meta(key)
+        if meta is None or meta.get("expires") is None:
+            return False
+        return meta['expires'] < time.time()
+
     @abc.abstractmethod
     def delete(self, key):
         pass
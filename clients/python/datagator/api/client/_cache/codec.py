@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+    datagator.api.client._cache.codec
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Compression codecs of cached entries.
+
+    :copyright: 2015 by `University of Denver <http://pardee.du.edu/>`_
+    :license: Apache 2.0, see LICENSE for more details.
+
+    :author: `LIU Yu <liuyu@opencps.net>`_
+    :date: 2015/12/25
+"""
+
+from __future__ import unicode_literals
+
+import bz2
+import codecs
+import hashlib
+import json
+import logging
+import marshal
+import sys
+import zlib
+
+from .. import environ
+from .._compat import to_bytes, to_native
+
+
+__all__ = ['register', 'available', 'compress', 'decompress', 'digest',
+           'pack', 'unpack', 'snapshot', 'SNAPSHOT_VERSION', ]
+__all__ = [to_native(n) for n in __all__]
+
+
+_log = logging.getLogger(__name__)
+
+
+# codec name -> (compress, decompress)
+_CODECS = {}
+
+# snapshots of decoded objects are only valid for the same client version
+# and the same `marshal` format
+SNAPSHOT_VERSION = "{0}.{1}.{2}/py{3}{4}/{5}".format(
+    *(environ.__client_version__ + sys.version_info[:2] +
+      (marshal.version, )))
+
+# JSON-encoded content never starts with a NUL byte
+_SNAPSHOT_MAGIC = b"\x00DGM"
+
+
+def register(name, compress, decompress):
+    """
+    :param name: codec tag stored along with the compressed entries.
+    :param compress: callable taking and returning bytes-like objects.
+    :param decompress: inverse of ``compress``.
+    """
+    _CODECS[name] = (compress, decompress)
+    pass
+
+
+def available():
+    """
+    Names of registered codecs
+    """
+    return sorted(_CODECS.keys())
+
+
+def _gzip(value):
+    # gzip container (i.e. `Content-Encoding: gzip`) around deflated value
+    c = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return c.compress(value) + c.flush()
+
+
+register("identity", lambda value: value, lambda value: value)
+register("zlib", lambda value: zlib.compress(value, 6), zlib.decompress)
+register("gzip", _gzip,
+         lambda value: zlib.decompress(value, 16 + zlib.MAX_WBITS))
+register("bz2", bz2.compress, bz2.decompress)
+
+try:
+    import lzma
+except ImportError:
+    _log.debug("lzma codec not available")
+else:
+    register("lzma", lzma.compress, lzma.decompress)
+
+
+def compress(value, codec):
+    """
+    :param value: bytes-like object.
+    :param codec: name of a registered codec.
+    :returns: compressed bytes-like object.
+    """
+    if codec not in _CODECS:
+        raise ValueError("unsupported cache codec '{0}'".format(codec))
+    return _CODECS[codec][0](value)
+
+
+def decompress(value, codec):
+    """
+    :param value: bytes-like object compressed with ``codec``.
+    :param codec: name of a registered codec, ``None`` for entries cached
+        without a codec tag (i.e. uncompressed).
+    :returns: decompressed bytes-like object.
+    """
+    codec = codec or "identity"
+    if codec not in _CODECS:
+        raise ValueError("unsupported cache codec '{0}'".format(codec))
+    return _CODECS[codec][1](value)
+
+
+def digest(value, codec=None):
+    """
+    :param value: bytes-like object of the JSON-encoded content.
+    :param codec: name of the codec ``value`` is compressed with, if any.
+    :returns: digest addressing the content in the cache, which differs from
+        that of the uncompressed content if ``codec`` is given.
+    """
+    h = hashlib.sha256(value).hexdigest()
+    if codec is not None and codec != "identity":
+        h = "{0}:{1}".format(codec, h)
+    return h
+
+
+def pack(value, codec, meta=None):
+    """
+    Prepare a value to be cached
+
+    :param value: JSON-serializable object, or bytes-like (or file-like)
+        object of the JSON-encoded content.
+    :param codec: name of the codec to compress ``value`` with.
+    :param meta: ``dict`` of metadata to be stored along with ``value``; a
+        ``codec`` item indicates that ``value`` has been compressed already
+        (e.g. ``Content-Encoding`` of a response), so that it is stored
+        as-is, unless ``codec`` is ``identity``; a ``digest`` item (see
+        :func:`digest`) spares hashing ``value``.
+    :returns: tuple of the compressed bytes-like object, and a copy of
+        ``meta`` with ``codec``, ``digest``, ``length`` (of the JSON-encoded
+        content) and ``size`` (of the compressed value) items.
+    """
+    meta = dict(meta or {})
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        _log.debug("  - bytes-like object")
+    elif hasattr(value, "read"):
+        _log.debug("  - file-like object")
+        value = to_bytes(value.read())
+    else:
+        _log.debug("  - JSON-serializable object")
+        value = to_bytes(json.dumps(value))
+    encoding = meta.pop("codec", None)
+    if encoding is not None and codec == "identity":
+        value = decompress(value, encoding)
+        encoding = None
+    if encoding is None:
+        meta['length'] = len(value)
+        meta.setdefault("digest", digest(value))
+        value = compress(value, codec)
+        encoding = codec
+    else:
+        meta.setdefault("digest", digest(value, encoding))
+    _log.debug("  - codec: {0}".format(encoding))
+    meta['codec'] = encoding
+    meta['size'] = len(value)
+    return value, meta
+
+
+def snapshot(data):
+    """
+    :param data: JSON-decoded object.
+    :returns: ``marshal``-serialized ``data`` (of :data:`SNAPSHOT_VERSION`),
+        which can be cached like JSON-encoded content, but loads faster.
+    :raises ValueError: if ``data`` is not serializable.
+    """
+    return _SNAPSHOT_MAGIC + marshal.dumps(data)
+
+
+def unpack(value, meta=None):
+    """
+    :param value: bytes-like object returned by :func:`pack`.
+    :param meta: ``dict`` of metadata stored along with ``value``.
+    :returns: JSON-decoded object, or the object of a :func:`snapshot`.
+    """
+    value = decompress(value, (meta or {}).get("codec"))
+    if value[:len(_SNAPSHOT_MAGIC)] == _SNAPSHOT_MAGIC:
+        value = memoryview(value)[len(_SNAPSHOT_MAGIC):]
+        try:
+            return marshal.loads(value)
+        except TypeError:
+            # py26 / py27 `marshal` does not support the buffer protocol
+            return marshal.loads(value.tobytes())
+    # decoded from the (decompressed) buffer in place, e.g. a memory-mapped
+    # segment, without copying it into a bytes object first
+    return json.loads(codecs.utf_8_decode(value)[0])
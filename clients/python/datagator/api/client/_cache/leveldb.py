@@ -15,11 +15,16 @@ from __future__ import unicode_literals, with_statement
 import io
 import json
 import logging
+import os
 import shutil
 import tempfile
+import threading
+import time
 
-from datagator.api.client._cache import CacheManager
-from datagator.api.client._compat import to_bytes, to_native
+from datagator.api.client import environ
+from datagator.api.client._cache import CacheManager, Evictor, expires
+from datagator.api.client._cache.codec import compress, pack, unpack
+from datagator.api.client._compat import to_bytes, to_native, to_unicode
 
 # this has to be absolute import, otherwise we will be self-importing.
 try:
@@ -40,13 +45,66 @@ class LevelDbCache(CacheManager):
 
     """
     LevelDB backend for disk-persisted cache management
+
+    Values are content-addressed, i.e. URI's of cached entities are mapped
+    to the digests of their content, and identical content (e.g. unchanged
+    items across revisions of a ``DataSet``) is stored once, along with a
+    count of URI's referring to it.
     """
 
-    __slots__ = ['__db', '__fs', ]
+    # `accessed` time of an entry is refreshed at this granularity (seconds)
+    ACCESS_GRANULARITY = 60
+
+    # eviction stops once the cache shrinks below this portion of `max_bytes`
+    EVICTION_RATIO = 0.8
+
+    # metadata of all entries are stored in a separate key range
+    META_PREFIX = "#meta/"
+
+    # content and reference counts by digest, in two more key ranges
+    BLOB_PREFIX = "#blob/"
+    REFS_PREFIX = "#refs/"
+
+    __slots__ = ['__db', '__fs', '__persistent', '__ttl', '__max_bytes',
+                 '__codec', '__size', '__lock', '__write_lock',
+                 '__evictor', ]
 
-    def __init__(self, fs=None):
+    def __init__(self, fs=None, persistent=None, ttl=None, max_bytes=None,
+                 codec=None):
+        """
+        Optional arguments:
+
+        :param fs: path to the LevelDB database, defaults to a temporary
+            directory, or ``<DATAGATOR_HOME>/cache`` if persistent; if the
+            database is locked by another process, a temporary one is used
+            instead.
+        :param persistent: keep the database across runs, defaults to
+            ``DATAGATOR_CACHE_PERSISTENT``.
+        :param ttl: seconds before (non revision-pinned) entries need to be
+            revalidated, defaults to ``DATAGATOR_CACHE_TTL``.
+        :param max_bytes: size limit of cached values, defaults to
+            ``DATAGATOR_CACHE_MAX_BYTES``.
+        :param codec: compression codec of cached values, defaults to
+            ``DATAGATOR_CACHE_CODEC``.
+        """
+        self.__persistent = environ.DATAGATOR_CACHE_PERSISTENT \
+            if persistent is None else persistent
+        self.__ttl = environ.DATAGATOR_CACHE_TTL if ttl is None else ttl
+        self.__max_bytes = environ.DATAGATOR_CACHE_MAX_BYTES \
+            if max_bytes is None else max_bytes
+        self.__codec = environ.DATAGATOR_CACHE_CODEC \
+            if codec is None else codec
+        compress(b"", self.__codec)  # fail early on unsupported codec
+        if fs is None and self.__persistent:
+            fs = os.path.join(environ.DATAGATOR_HOME, "cache")
+            if not os.path.isdir(fs):
+                os.makedirs(fs)
         self.__fs = fs or tempfile.mkdtemp(suffix=".DataGatorCache")
         self.__db = None
+        self.__size = None
+        self.__lock = threading.Lock()
+        self.__write_lock = threading.RLock()
+        self.__evictor = Evictor()
         pass
 
     @property
@@ -54,44 +112,218 @@ class LevelDbCache(CacheManager):
         if self.__db is None:
             _log.debug("initializing local cache")
             _log.debug("  - '{0}'".format(self.__fs))
-            self.__db = _leveldb.LevelDB(filename=to_native(self.__fs))
+            try:
+                self.__db = _leveldb.LevelDB(filename=to_native(self.__fs))
+            except _leveldb.LevelDBError as e:
+                if not self.__persistent:
+                    raise
+                # LevelDB admits a single process at a time, others (e.g.
+                # concurrent jobs sharing `DATAGATOR_HOME`) fall back to a
+                # private cache, which is destroyed at exit
+                _log.warning("persistent cache unavailable: {0}".format(e))
+                self.__persistent = False
+                self.__fs = tempfile.mkdtemp(suffix=".DataGatorCache")
+                _log.debug("  - '{0}'".format(self.__fs))
+                self.__db = _leveldb.LevelDB(filename=to_native(self.__fs))
+            # persistent cache may be populated by previous runs, including
+            # (unshared) entries cached by earlier versions
+            shared = [blob.get("size", 0)
+                      for digest, blob in self._iter(self.REFS_PREFIX)]
+            legacy = [meta.get("size", 0)
+                      for key, meta in self._iter(self.META_PREFIX)
+                      if "digest" not in meta]
+            self.__size = sum(shared) + sum(legacy)
         return self.__db
 
+    @property
+    def size(self):
+        """
+        total bytes of cached values (of distinct content)
+        """
+        return self._resize(0)
+
+    def _resize(self, delta):
+        self.db  # make sure the initial size is known
+        with self.__lock:
+            self.__size += delta
+            size = self.__size
+        if self.__max_bytes is not None and size > self.__max_bytes:
+            self.__evictor.trigger(self._evict)
+        return size
+
+    @classmethod
+    def _meta_key(cls, key):
+        # '#' never appears in URI's of entities, see `docs/model.rst`
+        return to_bytes("{0}{1}".format(cls.META_PREFIX, key))
+
+    @classmethod
+    def _blob_key(cls, digest):
+        return to_bytes("{0}{1}".format(cls.BLOB_PREFIX, digest))
+
+    @classmethod
+    def _refs_key(cls, digest):
+        return to_bytes("{0}{1}".format(cls.REFS_PREFIX, digest))
+
+    def _iter(self, prefix):
+        prefix = to_bytes(prefix)
+        for raw_key, raw in self.db.RangeIter(
+                key_from=prefix, key_to=prefix + b"\xff"):
+            key = to_unicode(bytes(raw_key[len(prefix):]))
+            yield key, json.loads(to_native(bytes(raw)))
+        pass
+
+    def _blob(self, digest):
+        # `dict` of `refs`, `size`, `codec` and `length` of shared content
+        try:
+            raw = self.db.Get(self._refs_key(digest))
+        except KeyError:
+            return None
+        else:
+            return json.loads(to_native(bytes(raw)))
+        return None  # should NOT reach here
+
+    def _release(self, batch, key, meta):
+        # drop a reference to the content of an entry, and return the bytes
+        # freed (if any)
+        if "digest" not in meta:
+            batch.Delete(to_bytes(key))
+            return meta.get("size", 0)
+        blob = self._blob(meta['digest'])
+        if blob is None:
+            return 0
+        blob['refs'] -= 1
+        if blob['refs'] > 0:
+            batch.Put(self._refs_key(meta['digest']),
+                      to_bytes(json.dumps(blob)))
+            return 0
+        batch.Delete(self._blob_key(meta['digest']))
+        batch.Delete(self._refs_key(meta['digest']))
+        return blob.get("size", 0)
+
+    def _evict(self):
+        # discard least recently accessed entries until the cache is under
+        # the low watermark of the size limit
+        entries = sorted([
+            (meta.get("accessed", 0), key)
+            for key, meta in self._iter(self.META_PREFIX)])
+        target = self.__max_bytes * self.EVICTION_RATIO
+        size = self.size
+        for accessed, key in entries:
+            if size <= target:
+                break
+            _log.debug("evicting '{0}' from cache".format(key))
+            # shared content is not freed until all its URI's are evicted
+            size -= self._delete(key)
+        pass
+
+    def _delete(self, key):
+        with self.__write_lock:
+            meta = self.meta(key)
+            if meta is None:
+                return 0
+            batch = _leveldb.WriteBatch()
+            batch.Delete(self._meta_key(key))
+            freed = self._release(batch, key, meta)
+            self.db.Write(batch)
+        self._resize(-freed)
+        return freed
+
     def delete(self, key):
         _log.debug("deleting '{0}' from cache".format(key))
-        return self.db.Delete(to_bytes(key))
+        self._delete(key)
+        pass
 
     def exists(self, key):
         _log.debug("looking up '{0}' in cache".format(key))
-        try:
-            raw = self.db.Get(to_bytes(key))
-        except KeyError:
-            return False
-        else:
-            return True
-        return False  # should NOT reach here
+        return self.meta(key) is not None
 
     def get(self, key, value=None):
         _log.debug("fetching '{0}' from cache".format(key))
+        meta = self.meta(key)
+        if meta is None:
+            return value
+        # entries cached by earlier versions are stored under their URI's,
+        # and have no codec tag in their metadata (i.e. uncompressed)
         try:
-            raw = self.db.Get(to_bytes(key))
+            raw = self.db.Get(self._blob_key(meta['digest'])
+                              if "digest" in meta else to_bytes(key))
         except KeyError:
             return value
         else:
-            return json.loads(to_native(raw))
+            self._accessed(key, meta)
+            return unpack(raw, meta)
         return value  # should NOT reach here
 
-    def put(self, key, value):
-        _log.debug("putting '{0}' to cache".format(key))
-        if hasattr(value, "read"):
-            _log.debug("  - file-like object")
-            value = value.read()
+    def _accessed(self, key, meta):
+        now = time.time()
+        if meta is None or \
+                now - meta.get("accessed", 0) <= self.ACCESS_GRANULARITY:
+            return
+        # metadata is read again under the lock, which may have been updated
+        # (or deleted) by `put()` or `_delete()` since `meta` was read
+        with self.__write_lock:
+            meta = self.meta(key)
+            if meta is None or meta.get("accessed", 0) >= now:
+                return
+            meta['accessed'] = now
+            self.db.Put(self._meta_key(key), to_bytes(json.dumps(meta)))
+        pass
+
+    def meta(self, key):
+        try:
+            raw = self.db.Get(self._meta_key(key))
+        except KeyError:
+            return None
         else:
-            _log.debug("  - JSON-serializable object")
-            value = json.dumps(value)
-        return self.db.Put(to_bytes(key), to_bytes(value))
+            return json.loads(to_native(raw))
+        return None  # should NOT reach here
+
+    def put(self, key, value, meta=None):
+        _log.debug("putting '{0}' to cache".format(key))
+        value, meta = pack(value, self.__codec, meta)
+        meta['accessed'] = time.time()
+        meta['expires'] = expires(key, self.__ttl)
+        digest = meta['digest']
+        delta = 0
+        # value and metadata are updated atomically
+        batch = _leveldb.WriteBatch()
+        with self.__write_lock:
+            old_meta = self.meta(key)
+            blob = self._blob(digest)
+            if blob is None:
+                blob = dict([(k, meta.get(k))
+                             for k in ("size", "codec", "length")])
+                blob['refs'] = 0
+                batch.Put(self._blob_key(digest), value)
+                delta += blob['size']
+            # content already cached (under any URI) is not written again
+            meta.update(dict([(k, blob[k])
+                              for k in ("size", "codec", "length")]))
+            changed = old_meta is None or old_meta.get("digest") != digest
+            if changed or blob['refs'] == 0:
+                blob['refs'] += 1
+                batch.Put(self._refs_key(digest), to_bytes(json.dumps(blob)))
+            if changed and old_meta is not None:
+                delta -= self._release(batch, key, old_meta)
+            batch.Put(self._meta_key(key), to_bytes(json.dumps(meta)))
+            self.db.Write(batch)
+        self._resize(delta)
+        pass
+
+    def touch(self, key):
+        with self.__write_lock:
+            meta = self.meta(key)
+            if meta is not None:
+                meta['accessed'] = time.time()
+                meta['expires'] = expires(key, self.__ttl)
+                self.db.Put(self._meta_key(key), to_bytes(json.dumps(meta)))
+        pass
 
     def __del__(self):
+        if self.__persistent:
+            # closing the database releases its lock for later runs
+            self.__db = None
+            return
         _log.debug("destroying local cache")
         try:
             self.__db = None
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+    datagator.api.client._cache.memory
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    :copyright: 2015 by `University of Denver <http://pardee.du.edu/>`_
+    :license: Apache 2.0, see LICENSE for more details.
+
+    :author: `LIU Yu <liuyu@opencps.net>`_
+    :date: 2015/12/18
+"""
+
+from __future__ import unicode_literals, with_statement
+
+import logging
+import threading
+import time
+
+from datagator.api.client._cache import CacheManager
+from datagator.api.client._cache.codec import SNAPSHOT_VERSION, snapshot
+from datagator.api.client._compat import OrderedDict, to_native
+
+
+__all__ = ['TieredCache', ]
+__all__ = [to_native(n) for n in __all__]
+
+
+_log = logging.getLogger(__name__)
+
+
+def _length(meta):
+    # bytes of JSON-encoded content, i.e. `size` of uncompressed entries
+    return meta.get("length", meta.get("size", 0))
+
+
+class TieredCache(CacheManager):
+
+    """
+    In-process LRU tier of decoded objects in front of a disk-persisted cache
+    manager backend
+
+    Writes go through to the backend, and the memory tier only keeps objects
+    decoded by :meth:`get`. Its budget is measured by the (JSON-encoded) size
+    of the objects as recorded by the backend, regardless of compression.
+
+    Objects returned by :meth:`get` are shared by all callers, and should be
+    treated as read-only.
+
+    Optionally, decoded objects are also persisted to the backend as
+    ``marshal`` snapshots (beside the JSON-encoded content), which spare
+    parsing JSON upon loading them in later runs. A snapshot is keyed by
+    ``<key>#snapshot``, and tagged by :data:`SNAPSHOT_VERSION` and the digest
+    of the JSON-encoded content it was decoded from, such that it is ignored
+    once either of them changes.
+    """
+
+    # JSON-encoded content smaller than this is not worth a snapshot
+    SNAPSHOT_MIN_BYTES = 2 ** 16  # 64KB
+
+    __slots__ = ['__backend', '__max_bytes', '__snapshot', '__size',
+                 '__entries', '__lock', ]
+
+    def __init__(self, backend, max_bytes, snapshot=False):
+        """
+        :param backend: disk-persisted :class:`CacheManager` instance.
+        :param max_bytes: budget of the memory tier.
+        :param snapshot: keep snapshots of decoded objects in the backend.
+        """
+        super(TieredCache, self).__init__()
+        self.__backend = backend
+        self.__max_bytes = max_bytes
+        self.__snapshot = snapshot
+        self.__size = 0
+        # key -> (value, size, expires), ordered from least recently used
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+        pass
+
+    @property
+    def backend(self):
+        """
+        underlying disk-persisted cache manager
+        """
+        return self.__backend
+
+    @property
+    def size(self):
+        """
+        total bytes of objects in the memory tier
+        """
+        return self.__size
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def _lookup(self, key):
+        # mark the entry as most recently used, py26 / py27 `OrderedDict`
+        # does not support `move_to_end()`, so re-insert the entry instead
+        with self.__lock:
+            entry = self.__entries.pop(key, None)
+            if entry is not None:
+                self.__entries[key] = entry
+        return entry
+
+    def _insert(self, key, value, size, expires):
+        with self.__lock:
+            old = self.__entries.pop(key, None)
+            if old is not None:
+                self.__size -= old[1]
+            if size > self.__max_bytes:
+                return
+            self.__entries[key] = (value, size, expires)
+            self.__size += size
+            while self.__size > self.__max_bytes:
+                victim, entry = self.__entries.popitem(last=False)
+                _log.debug("evicting '{0}' from memory".format(victim))
+                self.__size -= entry[1]
+        pass
+
+    def _discard(self, key):
+        with self.__lock:
+            entry = self.__entries.pop(key, None)
+            if entry is not None:
+                self.__size -= entry[1]
+        pass
+
+    def clear(self):
+        """
+        Drop all objects from the memory tier (the backend is untouched)
+        """
+        with self.__lock:
+            self.__entries.clear()
+            self.__size = 0
+        pass
+
+    @classmethod
+    def _snapshot_key(cls, key):
+        # '#' never appears in URI's of entities, see `docs/model.rst`
+        return "{0}#snapshot".format(key)
+
+    @classmethod
+    def _snapshot_tag(cls, meta):
+        # entries cached by earlier versions may have no digest
+        if meta is None or "digest" not in meta:
+            return None
+        return "{0}/{1}".format(SNAPSHOT_VERSION, meta['digest'])
+
+    def _load_snapshot(self, key, meta):
+        tag = self._snapshot_tag(meta)
+        snapshot_meta = self.__backend.meta(self._snapshot_key(key))
+        if tag is None or snapshot_meta is None or \
+                snapshot_meta.get("etag") != tag:
+            return None
+        return self.__backend.get(self._snapshot_key(key), None)
+
+    def _save_snapshot(self, key, data, meta):
+        tag = self._snapshot_tag(meta)
+        if tag is None or _length(meta) < self.SNAPSHOT_MIN_BYTES:
+            return
+        try:
+            value = snapshot(data)
+        except ValueError as e:
+            _log.debug("no snapshot of '{0}': {1}".format(key, e))
+            return
+        # snapshots are stored uncompressed, and validated by their `etag`
+        self.__backend.put(
+            self._snapshot_key(key), value, {"codec": "identity", "etag": tag})
+        pass
+
+    def delete(self, key):
+        self._discard(key)
+        self.__backend.delete(key)
+        if self.__snapshot:
+            self.__backend.delete(self._snapshot_key(key))
+        pass
+
+    def exists(self, key):
+        if key in self.__entries:
+            return True
+        return self.__backend.exists(key)
+
+    def get(self, key, value=None):
+        entry = self._lookup(key)
+        if entry is not None:
+            return entry[0]
+        data = None
+        if self.__snapshot:
+            meta = self.__backend.meta(key)
+            if meta is None:
+                return value
+            data = self._load_snapshot(key, meta)
+        if data is None:
+            data = self.__backend.get(key, None)
+            if data is None:
+                return value
+            meta = self.__backend.meta(key) or {}
+            if self.__snapshot:
+                self._save_snapshot(key, data, meta)
+        self._insert(key, data, _length(meta), meta.get("expires"))
+        return data
+
+    def meta(self, key):
+        return self.__backend.meta(key)
+
+    def put(self, key, value, meta=None, decoded=None):
+        """
+        :param decoded: JSON-decoded counterpart of an encoded ``value``,
+            kept in the memory tier so that it is never decoded again.
+        """
+        # otherwise, the encoded content is not decoded until requested by
+        # `get()`
+        self._discard(key)
+        self.__backend.put(key, value, meta)
+        if decoded is not None:
+            meta = self.__backend.meta(key) or {}
+            self._insert(key, decoded, _length(meta), meta.get("expires"))
+            if self.__snapshot:
+                self._save_snapshot(key, decoded, meta)
+        pass
+
+    def stale(self, key):
+        entry = self._lookup(key)
+        if entry is None:
+            return self.__backend.stale(key)
+        return entry[2] is not None and entry[2] < time.time()
+
+    def touch(self, key):
+        self.__backend.touch(key)
+        # revalidated objects remain in the memory tier with renewed expiry
+        entry = self._lookup(key)
+        if entry is not None:
+            meta = self.__backend.meta(key) or {}
+            self._insert(key, entry[0], entry[1], meta.get("expires"))
+        pass
+
+    pass
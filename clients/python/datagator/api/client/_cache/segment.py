@@ -0,0 +1,516 @@
+# -*- coding: utf-8 -*-
+"""
+    datagator.api.client._cache.segment
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    :copyright: 2015 by `University of Denver <http://pardee.du.edu/>`_
+    :license: Apache 2.0, see LICENSE for more details.
+
+    :author: `LIU Yu <liuyu@opencps.net>`_
+    :date: 2015/12/26
+"""
+
+from __future__ import unicode_literals, with_statement
+
+import binascii
+import contextlib
+import fcntl
+import json
+import logging
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+from datagator.api.client import environ
+from datagator.api.client._cache import CacheManager, Evictor, expires
+from datagator.api.client._cache.codec import compress, pack, unpack
+from datagator.api.client._compat import to_bytes, to_native, to_unicode
+
+
+__all__ = ['SegmentCache', ]
+__all__ = [to_native(n) for n in __all__]
+
+
+_log = logging.getLogger(__name__)
+
+
+# segment file starts with a magic number and a random generation number,
+# which is renewed by every compaction
+_FILE_HEADER = struct.Struct(str("<8s8s"))
+_FILE_MAGIC = b"DGCSEG\x00\x01"
+
+# record header: magic, kind, lengths of key, metadata and value, and crc32
+# of the three
+_RECORD = struct.Struct(str("<4sBIIQI"))
+_RECORD_MAGIC = b"DGCR"
+
+# kinds of records, i.e. content (and the first URI referring to it), one
+# more URI referring to existing content, and deletion of a URI
+_PUT, _LINK, _DELETE = 0, 1, 2
+
+
+class SegmentCache(CacheManager):
+
+    """
+    Memory-mapped, append-only segment file for disk-persisted cache
+    management
+
+    Every write appends a record to the segment file, which is memory-mapped
+    for reading, so that :meth:`view` returns cached values without copying
+    them, and processes mirroring the same data sets share the OS page cache.
+    Values are content-addressed as with the other backends, i.e. identical
+    content is appended once, and referred to by later URI's.
+
+    The index of live entries is kept in memory, and checkpointed to an index
+    file every now and then. Records appended since the last checkpoint are
+    replayed upon loading (or when written by other processes), and a torn
+    record at the end of the segment (e.g. of a crashed process) is dropped.
+    Space of deleted, overwritten, and evicted entries is reclaimed by
+    compaction in a background thread.
+    """
+
+    # eviction stops once the cache shrinks below this portion of `max_bytes`
+    EVICTION_RATIO = 0.8
+
+    # compaction runs once garbage outgrows both live content and this size,
+    # and the segment has doubled since it was loaded (or compacted)
+    COMPACTION_MIN_BYTES = 2 ** 24  # 16MB
+
+    # number of writes between checkpoints of the index
+    CHECKPOINT_INTERVAL = 1024
+
+    __slots__ = ['__fs', '__tmp', '__persistent', '__ttl', '__max_bytes',
+                 '__codec', '__lock', '__lockf', '__depth', '__file',
+                 '__mmap', '__ino', '__generation', '__end', '__index',
+                 '__blobs', '__refs', '__live', '__writes', '__loaded',
+                 '__evictor', ]
+
+    def __init__(self, fs=None, persistent=None, ttl=None, max_bytes=None,
+                 codec=None):
+        """
+        Optional arguments:
+
+        :param fs: directory of the segment and index files, defaults to a
+            temporary directory, or ``<DATAGATOR_HOME>/segments`` if
+            persistent.
+        :param persistent: keep the files across runs, defaults to
+            ``DATAGATOR_CACHE_PERSISTENT``.
+        :param ttl: seconds before (non revision-pinned) entries need to be
+            revalidated, defaults to ``DATAGATOR_CACHE_TTL``.
+        :param max_bytes: size limit of cached values, defaults to
+            ``DATAGATOR_CACHE_MAX_BYTES``.
+        :param codec: compression codec of cached values, defaults to
+            ``DATAGATOR_CACHE_CODEC`` (``identity`` makes :meth:`view`
+            return the JSON-encoded content).
+        """
+        self.__persistent = environ.DATAGATOR_CACHE_PERSISTENT \
+            if persistent is None else persistent
+        self.__ttl = environ.DATAGATOR_CACHE_TTL if ttl is None else ttl
+        self.__max_bytes = environ.DATAGATOR_CACHE_MAX_BYTES \
+            if max_bytes is None else max_bytes
+        self.__codec = environ.DATAGATOR_CACHE_CODEC \
+            if codec is None else codec
+        compress(b"", self.__codec)  # fail early on unsupported codec
+        self.__tmp = None
+        if fs is None and self.__persistent:
+            fs = os.path.join(environ.DATAGATOR_HOME, "segments")
+        elif fs is None:
+            fs = self.__tmp = tempfile.mkdtemp(suffix=".DataGatorCache")
+        if not os.path.isdir(fs):
+            os.makedirs(fs)
+        self.__fs = fs
+        self.__lock = threading.RLock()
+        self.__lockf = None
+        self.__depth = 0
+        self.__file = None
+        self.__mmap = None
+        self.__evictor = Evictor()
+        with self.__lock:
+            self._load()
+        pass
+
+    def _path(self, name):
+        return to_native(os.path.join(self.__fs, name))
+
+    @contextlib.contextmanager
+    def _exclusive(self):
+        # writes are serialized among threads and processes
+        with self.__lock:
+            if self.__depth == 0:
+                self.__lockf = open(self._path("cache.lock"), "a+b")
+                fcntl.lockf(self.__lockf, fcntl.LOCK_EX)
+            self.__depth += 1
+            try:
+                yield self
+            finally:
+                self.__depth -= 1
+                if self.__depth == 0:
+                    fcntl.lockf(self.__lockf, fcntl.LOCK_UN)
+                    self.__lockf.close()
+                    self.__lockf = None
+        pass
+
+    def _open(self):
+        # open (or create) the segment file, and map it into memory
+        path = self._path("cache.seg")
+        if not os.path.exists(path):
+            with self._exclusive():
+                if not os.path.exists(path):
+                    self._create(path)
+        self.__file = open(path, "r+b")
+        self.__ino = os.fstat(self.__file.fileno()).st_ino
+        self._remap()
+        magic, self.__generation = _FILE_HEADER.unpack_from(self.__mmap, 0)
+        if magic != _FILE_MAGIC:
+            raise IOError("invalid cache segment '{0}'".format(path))
+        pass
+
+    def _create(self, path):
+        # new segment file is written aside and renamed into place, such
+        # that it never shows up incomplete
+        with open(path + ".tmp", "wb") as f:
+            f.write(_FILE_HEADER.pack(_FILE_MAGIC, os.urandom(8)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(path + ".tmp", path)
+        return path
+
+    def _remap(self):
+        # views of the former mapping stay valid until released, so it is
+        # dropped rather than closed
+        self.__mmap = mmap.mmap(
+            self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        pass
+
+    def _load(self):
+        if self.__file is not None:
+            self.__file.close()
+        self._open()
+        self.__index = {}  # key -> meta
+        self.__blobs = {}  # digest -> [offset, size, codec, length]
+        self.__refs = {}   # digest -> number of keys
+        self.__live = 0
+        self.__writes = 0
+        self.__end = _FILE_HEADER.size
+        try:
+            with open(self._path("cache.idx"), "rb") as f:
+                checkpoint = json.loads(to_native(f.read()))
+            if checkpoint['generation'] != self._generation() or \
+                    checkpoint['end'] > len(self.__mmap):
+                raise ValueError("stale checkpoint")
+        except (IOError, OSError, ValueError, KeyError) as e:
+            # index is rebuilt from scratch by replaying the whole segment
+            _log.debug("rebuilding cache index: {0}".format(e))
+        else:
+            for digest, blob in checkpoint['blobs'].items():
+                self.__blobs[digest] = blob
+            for key, meta in checkpoint['entries'].items():
+                self._link(key, meta)
+            self.__end = checkpoint['end']
+        self._replay()
+        self.__loaded = self.__end
+        pass
+
+    def _generation(self):
+        return to_unicode(binascii.hexlify(self.__generation))
+
+    def _checkpoint(self):
+        # index file is written aside and renamed into place atomically
+        _log.debug("checkpointing cache index")
+        path = self._path("cache.idx")
+        with open(path + ".tmp", "wb") as f:
+            f.write(to_bytes(json.dumps({
+                "generation": self._generation(),
+                "end": self.__end,
+                "entries": self.__index,
+                "blobs": self.__blobs})))
+        os.rename(path + ".tmp", path)
+        self.__writes = 0
+        pass
+
+    def _refresh(self, truncate=False):
+        # catch up with records appended (or compaction) by other processes
+        if os.stat(self._path("cache.seg")).st_ino != self.__ino:
+            _log.debug("reloading compacted cache segment")
+            self._load()
+            return
+        size = os.fstat(self.__file.fileno()).st_size
+        if size > self.__end:
+            self._replay()
+        if truncate and self.__end < size:
+            # torn record of a crashed writer (as long as the caller holds
+            # the exclusive lock, no other process is writing)
+            _log.warning("dropping {0} bytes of torn record".format(
+                size - self.__end))
+            self.__file.truncate(self.__end)
+        pass
+
+    def _replay(self):
+        # apply records from the end of the index up to the first torn (or
+        # incomplete) one
+        self._remap()
+        mm = memoryview(self.__mmap)
+        end, pos = len(mm), self.__end
+        while pos + _RECORD.size <= end:
+            magic, kind, klen, mlen, vlen, crc = _RECORD.unpack_from(mm, pos)
+            start = pos + _RECORD.size
+            stop = start + klen + mlen + vlen
+            if magic != _RECORD_MAGIC or stop > end or \
+                    zlib.crc32(mm[start:stop]) & 0xffffffff != crc:
+                break
+            key = to_unicode(mm[start:start + klen].tobytes())
+            if kind == _DELETE:
+                self._unlink(key)
+            else:
+                meta = json.loads(to_native(
+                    mm[start + klen:start + klen + mlen].tobytes()))
+                if kind == _PUT:
+                    self.__blobs[meta['digest']] = [
+                        start + klen + mlen, vlen, meta.get("codec"),
+                        meta.get("length")]
+                if meta['digest'] in self.__blobs:
+                    self._link(key, meta)
+            pos = stop
+        self.__end = pos
+        pass
+
+    def _link(self, key, meta):
+        self._unlink(key)
+        digest = meta['digest']
+        offset, size, codec, length = self.__blobs[digest]
+        meta.update({"size": size, "codec": codec, "length": length})
+        self.__index[key] = meta
+        self.__refs[digest] = self.__refs.get(digest, 0) + 1
+        if self.__refs[digest] == 1:
+            self.__live += size
+        pass
+
+    def _unlink(self, key):
+        meta = self.__index.pop(key, None)
+        if meta is None:
+            return
+        digest = meta['digest']
+        self.__refs[digest] -= 1
+        if self.__refs[digest] == 0:
+            # unreferenced content stays in the segment (and may be referred
+            # to again) until compaction
+            del self.__refs[digest]
+            self.__live -= self.__blobs[digest][1]
+        pass
+
+    def _append(self, kind, key, meta=None, value=b""):
+        raw_key = to_bytes(key)
+        raw_meta = to_bytes(json.dumps(meta)) if meta is not None else b""
+        with self._exclusive():
+            self._refresh(truncate=True)
+            # whether the content is in the segment is only settled under
+            # the file lock, i.e. another process may have deleted the entry
+            # or compacted its content away since the caller looked
+            if kind == _PUT and meta['digest'] in self.__blobs:
+                kind, value = _LINK, b""
+            elif kind == _LINK and (self.__index.get(key) or {}).get(
+                    "digest") != meta['digest']:
+                _log.debug("'{0}' no longer cached".format(key))
+                return
+            crc = zlib.crc32(
+                value, zlib.crc32(raw_meta, zlib.crc32(raw_key)))
+            offset = self.__end + _RECORD.size + len(raw_key) + len(raw_meta)
+            self.__file.seek(self.__end)
+            self.__file.write(_RECORD.pack(
+                _RECORD_MAGIC, kind, len(raw_key), len(raw_meta), len(value),
+                crc & 0xffffffff))
+            self.__file.write(raw_key)
+            self.__file.write(raw_meta)
+            self.__file.write(value)
+            self.__file.flush()
+            self.__end = offset + len(value)
+            if kind == _DELETE:
+                self._unlink(key)
+            else:
+                if kind == _PUT:
+                    self.__blobs[meta['digest']] = [
+                        offset, len(value), meta['codec'], meta.get("length")]
+                self._link(key, meta)
+            self.__writes += 1
+            if self.__writes >= self.CHECKPOINT_INTERVAL:
+                self._checkpoint()
+        self._maintain()
+        pass
+
+    @property
+    def size(self):
+        """
+        total bytes of cached values (of distinct content)
+        """
+        return self.__live
+
+    @property
+    def garbage(self):
+        """
+        bytes of the segment file not referred to by live entries (including
+        record headers and metadata)
+        """
+        return self.__end - self.__live
+
+    def _compactable(self):
+        return self.__end > 2 * self.__loaded and \
+            self.garbage > max(self.__live, self.COMPACTION_MIN_BYTES)
+
+    def _maintain(self):
+        if self.__max_bytes is not None and self.__live > self.__max_bytes \
+                or self._compactable():
+            self.__evictor.trigger(self._evict)
+        pass
+
+    def _evict(self):
+        # discard least recently accessed entries until the cache is under
+        # the low watermark of the size limit, and compact the segment
+        if self.__max_bytes is not None and self.__live > self.__max_bytes:
+            target = self.__max_bytes * self.EVICTION_RATIO
+            with self.__lock:
+                entries = sorted([
+                    (meta.get("accessed", 0), key)
+                    for key, meta in self.__index.items()])
+            for accessed, key in entries:
+                if self.__live <= target:
+                    break
+                _log.debug("evicting '{0}' from cache".format(key))
+                self.delete(key)
+        if self._compactable():
+            self.compact()
+        pass
+
+    def compact(self):
+        """
+        Rewrite the segment file with live entries only
+        """
+        with self._exclusive():
+            self._refresh(truncate=True)
+            _log.debug("compacting cache segment")
+            # mapping may predate the latest records
+            self._remap()
+            mm = memoryview(self.__mmap)
+            path = self._create(self._path("cache.seg.compact"))
+            blobs = {}
+            with open(path, "r+b") as f:
+                f.seek(0, os.SEEK_END)
+                for key, meta in sorted(self.__index.items()):
+                    digest = meta['digest']
+                    raw_key = to_bytes(key)
+                    raw_meta = to_bytes(json.dumps(meta))
+                    kind, value = _LINK, b""
+                    if digest not in blobs:
+                        offset, size, codec, length = self.__blobs[digest]
+                        kind, value = _PUT, mm[offset:offset + size]
+                        blobs[digest] = [
+                            f.tell() + _RECORD.size + len(raw_key) +
+                            len(raw_meta), size, codec, length]
+                    crc = zlib.crc32(
+                        value, zlib.crc32(raw_meta, zlib.crc32(raw_key)))
+                    f.write(_RECORD.pack(
+                        _RECORD_MAGIC, kind, len(raw_key), len(raw_meta),
+                        len(value), crc & 0xffffffff))
+                    f.write(raw_key)
+                    f.write(raw_meta)
+                    f.write(value)
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(path, self._path("cache.seg"))
+            # index of the compacted segment is rebuilt as a checkpoint
+            self._load()
+            self._checkpoint()
+        pass
+
+    def delete(self, key):
+        _log.debug("deleting '{0}' from cache".format(key))
+        with self.__lock:
+            if key not in self.__index:
+                return
+            self._append(_DELETE, key)
+        pass
+
+    def exists(self, key):
+        _log.debug("looking up '{0}' in cache".format(key))
+        return self.meta(key) is not None
+
+    def view(self, key):
+        """
+        :param key: URI of the cached entity.
+        :returns: ``memoryview`` of the cached value (compressed by the
+            ``codec`` of its :meth:`meta`) in the memory-mapped segment, or
+            ``None``.
+        """
+        with self.__lock:
+            meta = self.__index.get(key, None)
+            if meta is None:
+                # the entry may have been written by another process
+                self._refresh()
+                meta = self.__index.get(key, None)
+                if meta is None:
+                    return None
+            meta['accessed'] = time.time()
+            offset, size, codec, length = self.__blobs[meta['digest']]
+            if offset + size > len(self.__mmap):
+                self._remap()
+            return memoryview(self.__mmap)[offset:offset + size]
+
+    def get(self, key, value=None):
+        _log.debug("fetching '{0}' from cache".format(key))
+        raw = self.view(key)
+        if raw is None:
+            return value
+        return unpack(raw, self.meta(key))
+
+    def meta(self, key):
+        with self.__lock:
+            meta = self.__index.get(key, None)
+            if meta is None:
+                self._refresh()
+                meta = self.__index.get(key, None)
+            return dict(meta) if meta is not None else None
+
+    def put(self, key, value, meta=None):
+        _log.debug("putting '{0}' to cache".format(key))
+        value, meta = pack(value, self.__codec, meta)
+        meta['accessed'] = time.time()
+        meta['expires'] = expires(key, self.__ttl)
+        with self.__lock:
+            # content already in the segment is linked to, rather than
+            # appended again (see `_append()`)
+            self._append(_PUT, key, meta, value)
+        pass
+
+    def touch(self, key):
+        with self.__lock:
+            meta = self.meta(key)
+            if meta is None:
+                return
+            meta['accessed'] = time.time()
+            meta['expires'] = expires(key, self.__ttl)
+            self._append(_LINK, key, meta)
+        pass
+
+    def __del__(self):
+        try:
+            if self.__persistent and self.__file is not None:
+                with self._exclusive():
+                    self._refresh()
+                    self._checkpoint()
+        except Exception as e:
+            _log.warning("failed to checkpoint cache index: {0}".format(e))
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+        if self.__persistent or self.__tmp is None:
+            return
+        _log.debug("destroying local cache")
+        shutil.rmtree(to_native(self.__tmp), ignore_errors=True)
+        self.__tmp = None
+        pass
+
+    pass
@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+"""
+    datagator.api.client._cache.sqlite
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    :copyright: 2015 by `University of Denver <http://pardee.du.edu/>`_
+    :license: Apache 2.0, see LICENSE for more details.
+
+    :author: `LIU Yu <liuyu@opencps.net>`_
+    :date: 2015/12/17
+"""
+
+from __future__ import unicode_literals, with_statement
+
+import contextlib
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from datagator.api.client import environ
+from datagator.api.client._cache import CacheManager, Evictor, expires
+from datagator.api.client._cache.codec import compress, pack, unpack
+from datagator.api.client._compat import to_native
+
+
+__all__ = ['SqliteCache', ]
+__all__ = [to_native(n) for n in __all__]
+
+
+_log = logging.getLogger(__name__)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS uri (
+    key TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    expires REAL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS uri_accessed ON uri (accessed);
+CREATE INDEX IF NOT EXISTS uri_digest ON uri (digest);
+CREATE TABLE IF NOT EXISTS blob (
+    digest TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    codec TEXT NOT NULL,
+    length INTEGER,
+    refs INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS stats (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO stats (id, size)
+    SELECT 0, COALESCE(SUM(size), 0) FROM blob;
+CREATE TRIGGER IF NOT EXISTS blob_insert AFTER INSERT ON blob BEGIN
+    UPDATE stats SET size = size + NEW.size WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS blob_delete AFTER DELETE ON blob BEGIN
+    UPDATE stats SET size = size - OLD.size WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS uri_insert AFTER INSERT ON uri BEGIN
+    UPDATE blob SET refs = refs + 1 WHERE digest = NEW.digest;
+END;
+CREATE TRIGGER IF NOT EXISTS uri_delete AFTER DELETE ON uri BEGIN
+    UPDATE blob SET refs = refs - 1 WHERE digest = OLD.digest;
+    DELETE FROM blob WHERE digest = OLD.digest AND refs <= 0;
+END;
+CREATE TRIGGER IF NOT EXISTS uri_update AFTER UPDATE OF digest ON uri
+WHEN OLD.digest != NEW.digest BEGIN
+    UPDATE blob SET refs = refs + 1 WHERE digest = NEW.digest;
+    UPDATE blob SET refs = refs - 1 WHERE digest = OLD.digest;
+    DELETE FROM blob WHERE digest = OLD.digest AND refs <= 0;
+END;
+"""
+
+
+class SqliteCache(CacheManager):
+
+    """
+    SQLite backend for disk-persisted cache management
+
+    The database runs in WAL mode, so that many processes can read the cache
+    while one of them is writing. Writes issued within :meth:`batch` are
+    committed in a single transaction.
+
+    Values are content-addressed, i.e. URI's of cached entities are mapped
+    to the digests of their content, and identical content (e.g. unchanged
+    items across revisions of a ``DataSet``) is stored once, until the last
+    URI referring to it is deleted or evicted.
+    """
+
+    # `accessed` time of an entry is refreshed at this granularity (seconds)
+    ACCESS_GRANULARITY = 60
+
+    # eviction stops once the cache shrinks below this portion of `max_bytes`
+    EVICTION_RATIO = 0.8
+
+    # seconds to wait for a lock held by another connection
+    BUSY_TIMEOUT = 30
+
+    __slots__ = ['__fs', '__path', '__persistent', '__ttl', '__max_bytes',
+                 '__codec', '__local', '__evictor', ]
+
+    def __init__(self, fs=None, persistent=None, ttl=None, max_bytes=None,
+                 codec=None):
+        """
+        Optional arguments:
+
+        :param fs: path to the SQLite database, defaults to a file in a
+            temporary directory, or ``<DATAGATOR_HOME>/cache.sqlite`` if
+            persistent.
+        :param persistent: keep the database across runs, defaults to
+            ``DATAGATOR_CACHE_PERSISTENT``.
+        :param ttl: seconds before (non revision-pinned) entries need to be
+            revalidated, defaults to ``DATAGATOR_CACHE_TTL``.
+        :param max_bytes: size limit of cached values, defaults to
+            ``DATAGATOR_CACHE_MAX_BYTES``.
+        :param codec: compression codec of cached values, defaults to
+            ``DATAGATOR_CACHE_CODEC``.
+        """
+        self.__persistent = environ.DATAGATOR_CACHE_PERSISTENT \
+            if persistent is None else persistent
+        self.__ttl = environ.DATAGATOR_CACHE_TTL if ttl is None else ttl
+        self.__max_bytes = environ.DATAGATOR_CACHE_MAX_BYTES \
+            if max_bytes is None else max_bytes
+        self.__codec = environ.DATAGATOR_CACHE_CODEC \
+            if codec is None else codec
+        compress(b"", self.__codec)  # fail early on unsupported codec
+        self.__fs = None
+        if fs is None and self.__persistent:
+            if not os.path.isdir(environ.DATAGATOR_HOME):
+                os.makedirs(environ.DATAGATOR_HOME)
+            fs = os.path.join(environ.DATAGATOR_HOME, "cache.sqlite")
+        elif fs is None:
+            self.__fs = tempfile.mkdtemp(suffix=".DataGatorCache")
+            fs = os.path.join(self.__fs, "cache.sqlite")
+        self.__path = fs
+        self.__local = threading.local()
+        self.__evictor = Evictor()
+        pass
+
+    @property
+    def db(self):
+        """
+        SQLite connection of the calling thread
+        """
+        conn = getattr(self.__local, "conn", None)
+        if conn is None:
+            _log.debug("initializing local cache")
+            _log.debug("  - '{0}'".format(self.__path))
+            # autocommit mode, transactions are managed by `batch()`
+            conn = sqlite3.connect(
+                to_native(self.__path), timeout=self.BUSY_TIMEOUT,
+                isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            # `INSERT OR REPLACE` fires delete triggers only when recursive
+            conn.execute("PRAGMA recursive_triggers = ON")
+            conn.executescript(_SCHEMA)
+            self.__local.conn = conn
+            self.__local.depth = 0
+        return conn
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Group consecutive writes (of the calling thread) in one transaction
+        """
+        db = self.db
+        if self.__local.depth == 0:
+            db.execute("BEGIN IMMEDIATE")
+        self.__local.depth += 1
+        try:
+            yield self
+        except Exception:
+            self.__local.depth -= 1
+            if self.__local.depth == 0:
+                db.execute("ROLLBACK")
+            raise
+        else:
+            self.__local.depth -= 1
+            if self.__local.depth == 0:
+                db.execute("COMMIT")
+                self._check_size()
+        pass
+
+    @property
+    def size(self):
+        """
+        total bytes of cached values (of distinct content)
+        """
+        return self.db.execute(
+            "SELECT size FROM stats WHERE id = 0").fetchone()[0]
+
+    def _check_size(self):
+        if self.__max_bytes is not None and self.size > self.__max_bytes:
+            self.__evictor.trigger(self._evict)
+        pass
+
+    def _evict(self):
+        # discard least recently accessed entries until the cache is under
+        # the low watermark of the size limit
+        target = self.__max_bytes * self.EVICTION_RATIO
+        size = self.size
+        victims = []
+        # shared content is not freed until all its URI's are evicted
+        refs = {}
+        for key, digest, nbytes, count in self.db.execute(
+                "SELECT uri.key, uri.digest, blob.size, blob.refs FROM uri "
+                "JOIN blob ON blob.digest = uri.digest ORDER BY uri.accessed"):
+            if size <= target:
+                break
+            victims.append((key, ))
+            refs[digest] = refs.get(digest, count) - 1
+            if refs[digest] <= 0:
+                size -= nbytes
+        _log.debug("evicting {0} entries from cache".format(len(victims)))
+        try:
+            with self.batch():
+                self.db.executemany(
+                    "DELETE FROM uri WHERE key = ?", victims)
+        finally:
+            # the connection belongs to the (short-lived) eviction thread
+            self.__local.conn.close()
+            self.__local.conn = None
+        pass
+
+    def delete(self, key):
+        _log.debug("deleting '{0}' from cache".format(key))
+        self.db.execute("DELETE FROM uri WHERE key = ?", (key, ))
+        pass
+
+    def exists(self, key):
+        _log.debug("looking up '{0}' in cache".format(key))
+        row = self.db.execute(
+            "SELECT 1 FROM uri WHERE key = ?", (key, )).fetchone()
+        return row is not None
+
+    def get(self, key, value=None):
+        _log.debug("fetching '{0}' from cache".format(key))
+        row = self.db.execute(
+            "SELECT blob.value, uri.accessed, blob.codec FROM uri "
+            "JOIN blob ON blob.digest = uri.digest WHERE uri.key = ?",
+            (key, )).fetchone()
+        if row is None:
+            return value
+        now = time.time()
+        if now - row[1] > self.ACCESS_GRANULARITY:
+            self.db.execute(
+                "UPDATE uri SET accessed = ? WHERE key = ?", (now, key))
+        return unpack(row[0], {"codec": row[2]})
+
+    def meta(self, key):
+        row = self.db.execute(
+            "SELECT uri.etag, uri.last_modified, blob.size, uri.accessed, "
+            "uri.expires, blob.codec, blob.length, uri.digest FROM uri "
+            "JOIN blob ON blob.digest = uri.digest WHERE uri.key = ?",
+            (key, )).fetchone()
+        if row is None:
+            return None
+        meta = dict(zip(
+            ("etag", "last_modified", "size", "accessed", "expires", "codec",
+             "length", "digest"), row))
+        # omit validators not supplied by the backend service, as well as
+        # the length of content cached compressed as-is
+        for name in ("etag", "last_modified", "length"):
+            if meta[name] is None:
+                del meta[name]
+        return meta
+
+    def put(self, key, value, meta=None):
+        _log.debug("putting '{0}' to cache".format(key))
+        value, meta = pack(value, self.__codec, meta)
+        params = (meta['digest'], meta.get("etag"), meta.get("last_modified"),
+                  expires(key, self.__ttl), time.time(), key)
+        with self.batch():
+            # content already cached (under any URI) is not written again
+            self.db.execute(
+                "INSERT OR IGNORE INTO blob (digest, value, size, codec, "
+                "length) VALUES (?, ?, ?, ?, ?)",
+                (meta['digest'], sqlite3.Binary(value), meta['size'],
+                 meta['codec'], meta.get("length")))
+            # `INSERT OR REPLACE` would release the blob (of unchanged
+            # content) before referring to it again
+            if self.db.execute(
+                    "UPDATE uri SET digest = ?, etag = ?, last_modified = ?, "
+                    "expires = ?, accessed = ? WHERE key = ?",
+                    params).rowcount == 0:
+                self.db.execute(
+                    "INSERT INTO uri (digest, etag, last_modified, expires, "
+                    "accessed, key) VALUES (?, ?, ?, ?, ?, ?)", params)
+        pass
+
+    def touch(self, key):
+        self.db.execute(
+            "UPDATE uri SET accessed = ?, expires = ? WHERE key = ?",
+            (time.time(), expires(key, self.__ttl), key))
+        pass
+
+    def __del__(self):
+        conn = getattr(self.__local, "conn", None)
+        if conn is not None:
+            conn.close()
+        if self.__persistent or self.__fs is None:
+            return
+        _log.debug("destroying local cache")
+        shutil.rmtree(to_native(self.__fs), ignore_errors=True)
+        self.__fs = None
+        pass
+
+    pass
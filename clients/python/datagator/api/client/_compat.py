@@ -88,6 +88,7 @@ PY2 = (sys.version_info[0] == 2)
 if PY2:
 
     text_type = unicode
+    integer_types = (int, long)
 
     def to_bytes(x, charset='utf8', errors='strict'):
         if x is None:
@@ -106,6 +107,7 @@ if PY2:
 else:
 
     text_type = str
+    integer_types = (int, )
 
     def to_bytes(x, charset='utf8', errors='strict'):
         if x is None:
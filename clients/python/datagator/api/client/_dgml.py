@@ -0,0 +1,731 @@
+# -*- coding: utf-8 -*-
+"""
+    datagator.api.client._dgml
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Client-side parser and executor of DGML recipes.
+
+    :copyright: 2015 by `University of Denver <http://pardee.du.edu/>`_
+    :license: Apache 2.0, see LICENSE for more details.
+
+    :author: `LIU Yu <liuyu@opencps.net>`_
+    :date: 2015/12/22
+"""
+
+from __future__ import unicode_literals, with_statement
+
+import ast
+import json
+import logging
+import operator
+import re
+
+from ._compat import OrderedDict, to_native, to_unicode
+from ._matrix import ColumnarMatrix, MatrixView, RowIndex
+
+
+__all__ = ['Bakery', 'dependencies', 'parse', 'resolve', ]
+__all__ = [to_native(n) for n in __all__]
+
+
+_log = logging.getLogger(__name__)
+
+
+#
+# parser: DGML text -> JSON-encoded `Recipe` (see `schema.json`)
+#
+
+_NAME = r"[A-Za-z]\w{0,29}"
+
+_STATEMENTS = [
+    ("node", re.compile(r"^node\s+({0})\s*\(\s*\)\s*:$".format(_NAME))),
+    ("load", re.compile(r"^load\s+(.+?)\s+as\s+({0})$".format(_NAME))),
+    ("layout", re.compile(r"^layout\s+(\d+)\s*,\s*(\d+)$")),
+    ("index", re.compile(r"^index\s+({0})\s+by\s+(.+)$".format(_NAME))),
+    ("yield", re.compile(r"^yield\s+(.+)$")),
+    ("for", re.compile(r"^for\s+(.+?)\s+in\s+(.+):$")),
+    ("if", re.compile(r"^if\s+(.+):$")),
+    ("else", re.compile(r"^else\s*:$")),
+    ("continue", re.compile(r"^continue$")),
+    ("break", re.compile(r"^break$")),
+    ("pass", re.compile(r"^pass$")),
+    ("assign", re.compile(
+        r"^({0}(?:\s*,\s*{0})*)\s*=(?!=)\s*(.+)$".format(_NAME))),
+]
+
+# `<repo>.<dataset>[.<rev>][["<key>"]]` or `.<node>()`
+_DATASET_REF = re.compile(
+    r"^({0})\.({0})(?:\.(\d+))?"
+    r"(?:\[\s*(\"(?:[^\"\\]|\\.)*\")\s*\])?$".format(_NAME))
+_ROUTINE_REF = re.compile(r"^\.({0})\s*\(\s*\)$".format(_NAME))
+
+
+def _kind(name):
+    return "datagator#Recipe#{0}".format(name)
+
+
+def _block(kind, items):
+    return OrderedDict([
+        ("kind", _kind(kind)),
+        ("items", items),
+        ("itemsCount", len(items)), ])
+
+
+def _lines(text):
+    # (<lineno>, <indent>, <statement>) of non-empty lines
+    for lineno, line in enumerate(to_unicode(text).splitlines(), 1):
+        line = line.expandtabs(4).rstrip()
+        statement = line.lstrip()
+        if statement:
+            yield lineno, len(line) - len(statement), statement
+    pass
+
+
+def _tree(text):
+    # nest statements by indentation, i.e. `[(<lineno>, <statement>,
+    # <children>), ...]`
+    root = []
+    stack = [(-1, root)]
+    for lineno, indent, statement in _lines(text):
+        while indent <= stack[-1][0]:
+            stack.pop()
+        children = []
+        stack[-1][1].append((lineno, statement, children))
+        stack.append((indent, children))
+    return root
+
+
+def _load_ref(lineno, text):
+    m = _ROUTINE_REF.match(text)
+    if m is not None:
+        return OrderedDict([("$ref", "#/routine/{0}".format(m.group(1)))])
+    m = _DATASET_REF.match(text)
+    if m is None:
+        raise ValueError("invalid reference at line {0}: {1}".format(
+            lineno, text))
+    repo, name, rev, key = m.groups()
+    ref = OrderedDict([
+        ("kind", "datagator#DataSet"),
+        ("name", name),
+        ("repo", OrderedDict([
+            ("kind", "datagator#Repo"),
+            ("name", repo), ])), ])
+    if rev is not None:
+        ref['rev'] = int(rev)
+    if key is not None:
+        ref['items'] = [OrderedDict([
+            ("kind", "datagator#Matrix"),
+            ("name", json.loads(key)), ]), ]
+        ref['itemsCount'] = 1
+    return ref
+
+
+def _statements(nodes, compound=True):
+    # JSON-encoded process items from a list of statement nodes
+    items = []
+    for lineno, statement, children in nodes:
+        if statement.startswith("#"):
+            items.append(OrderedDict([
+                ("kind", _kind("comment")), ("text", statement), ]))
+            continue
+        for kind, regex in _STATEMENTS:
+            m = regex.match(statement)
+            if m is not None:
+                break
+        else:
+            raise ValueError("invalid statement at line {0}: {1}".format(
+                lineno, statement))
+        if kind in ("for", "if", "else") and not children:
+            raise ValueError("expected indented block at line {0}".format(
+                lineno))
+        if kind not in ("for", "if", "else") and children:
+            raise ValueError("unexpected indent at line {0}".format(
+                children[0][0]))
+        if kind in ("node", "load") or \
+                not compound and kind in ("continue", "break", "pass"):
+            raise ValueError("unexpected '{0}' at line {1}".format(
+                kind, lineno))
+        item = OrderedDict([("kind", _kind(kind))])
+        if kind == "layout":
+            item['columnHeaders'] = int(m.group(1))
+            item['rowHeaders'] = int(m.group(2))
+        elif kind == "index":
+            item['on'], item['by'] = m.groups()
+        elif kind == "yield":
+            item['expr'] = m.group(1)
+        elif kind == "assign":
+            item['to'], item['expr'] = m.groups()
+        elif kind == "for":
+            item['cursor'], item['in'] = m.groups()
+            item.update(_block(kind, _statements(children)))
+        elif kind == "if":
+            item['cond'] = m.group(1)
+            item.update(_block(kind, _statements(children)))
+        elif kind == "else":
+            if not items or items[-1]['kind'] != _kind("if") or \
+                    "else" in items[-1]:
+                raise ValueError("unexpected 'else' at line {0}".format(
+                    lineno))
+            items[-1]['else'] = _block(kind, _statements(children))
+            continue
+        items.append(item)
+    return items
+
+
+def _recipe(nodes, routines=None):
+    # JSON-encoded recipe from the statement nodes of a recipe (or node)
+    context, process = [], []
+    for lineno, statement, children in nodes:
+        m = _STATEMENTS[0][1].match(statement)
+        if m is not None:
+            if routines is None:
+                raise ValueError("unexpected 'node' at line {0}".format(
+                    lineno))
+            name = m.group(1)
+            if name in routines:
+                raise ValueError("duplicate node '{0}' at line {1}".format(
+                    name, lineno))
+            routines[name] = _recipe(children)
+            continue
+        m = _STATEMENTS[1][1].match(statement)
+        if m is not None:
+            context.append(OrderedDict([
+                ("kind", _kind("load")),
+                ("from", _load_ref(lineno, m.group(1))),
+                ("as", m.group(2)), ]))
+            continue
+        # comments before the first process item belong to the context
+        if statement.startswith("#") and not process:
+            context.append(OrderedDict([
+                ("kind", _kind("comment")), ("text", statement), ]))
+            continue
+        process.extend(_statements(
+            [(lineno, statement, children)], compound=False))
+    return OrderedDict([
+        ("kind", "datagator#Recipe"),
+        ("context", _block("context", context)),
+        ("process", _block("process", process)), ])
+
+
+def parse(text):
+    """
+    :param text: DGML source of a recipe.
+    :returns: JSON-encoded ``Recipe``, with ``node`` definitions as
+        ``routine`` items.
+    """
+    routines = OrderedDict()
+    recipe = _recipe(_tree(text), routines)
+    if routines:
+        recipe['routine'] = routines
+    return recipe
+
+
+def dependencies(recipe):
+    """
+    :param recipe: JSON-encoded ``Recipe``, or its DGML source.
+    :returns: ``list`` of ``(<repo>, <dataset>, <rev>, <key>)`` tuples
+        loaded by the recipe and its nodes, where ``<rev>`` (or ``<key>``)
+        is ``None`` if the ``load`` statement does not specify one.
+    """
+    if not isinstance(recipe, dict):
+        recipe = parse(recipe)
+    deps = []
+    for routine in [recipe] + list(recipe.get("routine", {}).values()):
+        for item in routine['context']['items']:
+            ref = item.get("from", {})
+            if item['kind'] != _kind("load") or "$ref" in ref:
+                continue
+            items = ref.get("items", [])
+            deps.append((
+                ref['repo']['name'], ref['name'], ref.get("rev", None),
+                items[0]['name'] if items else None))
+    return deps
+
+
+def resolve(recipe, heads=None):
+    """
+    Pin the dependencies of a recipe to concrete revisions
+
+    :param recipe: JSON-encoded ``Recipe``, or its DGML source.
+    :param heads: ``dict`` memoizing the ``HEAD`` revisions of data sets
+        across calls, i.e. ``{(<repo>, <dataset>): <rev>}``.
+    :returns: sorted ``list`` of distinct dependencies (see
+        :func:`dependencies`), where unspecified revisions are resolved to
+        the ``HEAD`` revisions through the cached data set metadata.
+    """
+    from .repo import DataSet, Repo
+    heads = {} if heads is None else heads
+    deps = set()
+    for repo, name, rev, key in dependencies(recipe):
+        if rev is None:
+            if (repo, name) not in heads:
+                heads[(repo, name)] = DataSet(Repo(repo), name, -1).rev
+            rev = heads[(repo, name)]
+        deps.add((repo, name, rev, key))
+    return sorted(deps, key=lambda dep: json.dumps(dep))
+
+
+#
+# executor: JSON-encoded `Recipe` -> JSON-encoded `Matrix`
+#
+
+class _Continue(Exception):
+    pass
+
+
+class _Break(Exception):
+    pass
+
+
+class _Table(object):
+    """
+    Matrix value in DGML expressions, with an optional row index
+    """
+
+    # DGML attributes -> `BlockMatrix` blocks
+    BLOCKS = {
+        "body": "body",
+        "preamble": "preamble",
+        "columnHeaders": "column_headers",
+        "rowHeaders": "row_headers", }
+
+    __slots__ = ['matrix', 'index', ]
+
+    def __init__(self, matrix, index=None):
+        self.matrix = matrix
+        self.index = index
+        pass
+
+    def columns(self, names):
+        # column offsets from column headers, e.g. "Country"
+        offsets = []
+        for name in names:
+            for row in self.matrix.column_headers:
+                if name in row:
+                    offsets.append(row.index(name))
+                    break
+            else:
+                raise ValueError("invalid column '{0}'".format(name))
+        return tuple(offsets)
+
+    def reindex(self, columns):
+        self.index = RowIndex.from_rows(
+            iter(self.matrix), columns,
+            self.matrix.layout['columnHeaders'])
+        pass
+
+    def attribute(self, name):
+        layout = self.matrix.layout
+        if name in self.BLOCKS:
+            return _Table(getattr(self.matrix, self.BLOCKS[name]))
+        elif name == "rows":
+            return _Table(MatrixView(
+                self.matrix, layout['columnHeaders'], layout['rowsCount'],
+                0, layout['columnsCount']))
+        elif name == "T":
+            return _Table(ColumnarMatrix(
+                list(self.matrix), layout['rowHeaders'],
+                layout['columnHeaders']))
+        elif name in ("rowsCount", "columnsCount"):
+            return layout[name]
+        raise ValueError("invalid attribute '{0}'".format(name))
+
+    def __contains__(self, key):
+        if self.index is None:
+            # index all row headers by default
+            self.reindex(tuple(range(self.matrix.layout['rowHeaders'])))
+        return key in self.index
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise ValueError("invalid key '{0}'".format(key))
+        offsets = self.index[key]
+        layout = self.matrix.layout
+        if len(offsets) == 1:
+            return _Table(MatrixView(
+                self.matrix, offsets[0], offsets[0] + 1,
+                0, layout['columnsCount']))
+        return _Table(ColumnarMatrix.from_rows(
+            [self.matrix.row(i) for i in offsets], 0, layout['rowHeaders']))
+
+    def __iter__(self):
+        return iter(self.matrix)
+
+    def __len__(self):
+        return len(self.matrix)
+
+    pass
+
+
+class _Collection(object):
+    """
+    DataSet value in DGML expressions
+    """
+
+    __slots__ = ['dataset', 'bakery', ]
+
+    def __init__(self, dataset, bakery):
+        self.dataset = dataset
+        self.bakery = bakery
+        pass
+
+    def __contains__(self, key):
+        return key in self.dataset
+
+    def __getitem__(self, key):
+        if key not in self.dataset:
+            raise ValueError("invalid key '{0}'".format(key))
+        return self.bakery._load_item(self.dataset[key])
+
+    def __iter__(self):
+        for item in self.dataset.cache.get("items", []):
+            yield item.get("name")
+        pass
+
+    def __len__(self):
+        return len(self.dataset)
+
+    pass
+
+
+def _range(*args):
+    return list(range(*args))
+
+
+# functions callable from DGML expressions
+_FUNCTIONS = {
+    "Range": _range,
+    "len": len,
+    "int": int,
+    "float": float,
+    "str": to_unicode,
+}
+
+_LITERALS = {
+    "None": None, "True": True, "False": False,
+    "null": None, "true": True, "false": False,
+}
+
+_CONSTANTS = tuple([getattr(ast, n) for n in (
+    "Constant", "Num", "Str", "NameConstant", ) if hasattr(ast, n)])
+
+_BINARY = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+
+_UNARY = {
+    ast.Not: operator.not_,
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+}
+
+_COMPARE = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Is: operator.is_,
+    ast.IsNot: operator.is_not,
+    ast.In: lambda a, b: a in b,
+    ast.NotIn: lambda a, b: a not in b,
+}
+
+
+def _cells(value):
+    # flatten a yielded value into the cells of a row
+    if isinstance(value, _Table):
+        for row in value.matrix:
+            for v in row:
+                yield v
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            for cell in _cells(v):
+                yield cell
+    elif isinstance(value, _Collection):
+        raise ValueError("cannot yield a dataset")
+    else:
+        yield value
+    pass
+
+
+class Bakery(object):
+    """
+    Client-side executor of DGML recipes
+
+    Nodes (i.e. ``routine`` items) form a dependency graph through ``load``
+    statements, which is checked for cycles before anything is executed.
+    The output of each node, and the content of each loaded item, is
+    computed at most once per :meth:`bake`.
+    """
+
+    __slots__ = ['__recipe', '__outputs', '__items', '__loads', ]
+
+    def __init__(self, recipe):
+        """
+        :param recipe: JSON-encoded ``Recipe``, or its DGML source.
+        """
+        super(Bakery, self).__init__()
+        if not isinstance(recipe, dict):
+            recipe = parse(recipe)
+        self.__recipe = recipe
+        self.__outputs = {}
+        self.__items = {}
+        self.__loads = {}
+        pass
+
+    @property
+    def recipe(self):
+        return self.__recipe
+
+    def _routine(self, name):
+        if name is None:
+            return self.__recipe
+        routines = self.__recipe.get("routine", {})
+        if name not in routines:
+            raise ValueError("undefined node '{0}'".format(name))
+        return routines[name]
+
+    @staticmethod
+    def _ref_name(ref):
+        # node name from a `{"$ref": "#/routine/<name>"}` reference
+        if "$ref" not in ref:
+            return None
+        return ref['$ref'].rpartition("/")[-1]
+
+    @property
+    def graph(self):
+        """
+        ``dict`` of nodes (``None`` for the recipe itself) to the ``list`` of
+        nodes they load
+        """
+        graph = OrderedDict()
+        for name in [None] + list(self.__recipe.get("routine", {})):
+            graph[name] = [
+                self._ref_name(item['from'])
+                for item in self._routine(name)['context']['items']
+                if item['kind'] == _kind("load") and
+                self._ref_name(item['from']) is not None]
+        return graph
+
+    def check(self):
+        """
+        Validate node references reachable from the recipe
+
+        :raises ValueError: on undefined nodes or cyclic references.
+        """
+        graph = self.graph
+        done = set()
+
+        def visit(name, path):
+            if name in path:
+                cycle = path[path.index(name):] + [name]
+                raise ValueError("cyclic reference among nodes: {0}".format(
+                    " -> ".join([n or "<recipe>" for n in cycle])))
+            if name in done:
+                return
+            if name not in graph:
+                raise ValueError("undefined node '{0}'".format(name))
+            for dep in graph[name]:
+                visit(dep, path + [name])
+            done.add(name)
+            pass
+
+        visit(None, [])
+        pass
+
+    def bake(self):
+        """
+        :returns: JSON-encoded ``Matrix`` produced by the recipe.
+        """
+        self.check()
+        self.__outputs.clear()
+        self.__items.clear()
+        self.__loads.clear()
+        return self._run(None)
+
+    def _run(self, name):
+        if name in self.__outputs:
+            return self.__outputs[name]
+        _log.debug("baking node '{0}'".format(name or "<recipe>"))
+        recipe = self._routine(name)
+        env = {}
+        for item in recipe['context']['items']:
+            if item['kind'] == _kind("load"):
+                env[item['as']] = self._load(item['from'])
+        out = {"rows": [], "columnHeaders": 0, "rowHeaders": 0}
+        try:
+            self._execute(recipe['process']['items'], env, out)
+        except (_Continue, _Break):
+            raise ValueError("'continue' / 'break' outside of a loop")
+        width = max([len(r) for r in out['rows']] or [0])
+        rows = [r + [None] * (width - len(r)) for r in out['rows']]
+        self.__outputs[name] = OrderedDict([
+            ("kind", "datagator#Matrix"),
+            ("columnHeaders", out['columnHeaders']),
+            ("rowHeaders", out['rowHeaders']),
+            ("rows", rows),
+            ("rowsCount", len(rows)),
+            ("columnsCount", width), ])
+        return self.__outputs[name]
+
+    def _load(self, ref):
+        key = json.dumps(ref, sort_keys=True)
+        if key in self.__loads:
+            return self.__loads[key]
+        name = self._ref_name(ref)
+        if name is not None:
+            data = self._run(name)
+            value = _Table(ColumnarMatrix.from_rows(
+                data['rows'], data['columnHeaders'], data['rowHeaders']))
+        else:
+            # resolve data sets (and items) through the cache of `Entity`
+            from .repo import DataSet, Repo
+            dataset = DataSet(
+                Repo(ref['repo']['name']), ref['name'], ref.get("rev", -1))
+            items = ref.get("items", [])
+            if items:
+                value = self._load_item(dataset[items[0]['name']])
+            else:
+                value = _Collection(dataset, self)
+        self.__loads[key] = value
+        return value
+
+    def _load_item(self, item):
+        if item.uri not in self.__items:
+            if item.kind != "Matrix":
+                raise ValueError("cannot load '{0}' item '{1}'".format(
+                    item.kind, item.uri))
+            data = item.cache
+            self.__items[item.uri] = _Table(ColumnarMatrix.from_rows(
+                data['rows'], data['columnHeaders'], data['rowHeaders']))
+        return self.__items[item.uri]
+
+    def _execute(self, items, env, out):
+        for item in items:
+            kind = item['kind'].rpartition("#")[-1]
+            if kind == "comment" or kind == "pass":
+                continue
+            elif kind == "continue":
+                raise _Continue()
+            elif kind == "break":
+                raise _Break()
+            elif kind == "layout":
+                out['columnHeaders'] = item['columnHeaders']
+                out['rowHeaders'] = item['rowHeaders']
+            elif kind == "yield":
+                out['rows'].append(list(_cells(self._eval(
+                    item['expr'], env))))
+            elif kind == "assign":
+                self._assign(item['to'], self._eval(item['expr'], env), env)
+            elif kind == "index":
+                table = self._eval(item['on'], env)
+                if not isinstance(table, _Table):
+                    raise ValueError("cannot index '{0}'".format(item['on']))
+                names = self._eval(item['by'], env)
+                table.reindex(table.columns(
+                    names if isinstance(names, tuple) else (names, )))
+            elif kind == "if":
+                if self._eval(item['cond'], env):
+                    self._execute(item['items'], env, out)
+                elif "else" in item:
+                    self._execute(item['else']['items'], env, out)
+            elif kind == "for":
+                for value in self._eval(item['in'], env):
+                    self._assign(item['cursor'], value, env)
+                    try:
+                        self._execute(item['items'], env, out)
+                    except _Continue:
+                        continue
+                    except _Break:
+                        break
+            else:
+                raise ValueError("unsupported statement '{0}'".format(kind))
+        pass
+
+    def _assign(self, lvalue, value, env):
+        names = [n.strip() for n in lvalue.split(",")]
+        if len(names) == 1:
+            env[names[0]] = value
+            return
+        values = list(value)
+        if len(values) != len(names):
+            raise ValueError("cannot unpack into '{0}'".format(lvalue))
+        env.update(zip(names, values))
+        pass
+
+    def _eval(self, expr, env):
+        try:
+            tree = ast.parse(expr.strip(), mode="eval")
+        except SyntaxError:
+            raise ValueError("invalid expression '{0}'".format(expr))
+        try:
+            return self._eval_node(tree.body, env)
+        except (KeyError, IndexError, TypeError) as e:
+            raise ValueError("failed to evaluate '{0}': {1}".format(expr, e))
+        pass
+
+    def _eval_node(self, node, env):
+        if isinstance(node, (ast.Tuple, ast.List)):
+            return tuple([self._eval_node(n, env) for n in node.elts])
+        elif isinstance(node, _CONSTANTS):
+            for attr in ("value", "n", "s"):
+                if hasattr(node, attr):
+                    return getattr(node, attr)
+        elif isinstance(node, ast.Name):
+            if node.id in env:
+                return env[node.id]
+            elif node.id in _LITERALS:
+                return _LITERALS[node.id]
+            raise ValueError("undefined name '{0}'".format(node.id))
+        elif isinstance(node, ast.Subscript):
+            index = node.slice
+            # py39 drops the `ast.Index` wrapper
+            if hasattr(ast, "Index") and isinstance(index, ast.Index):
+                index = index.value
+            return self._eval_node(node.value, env)[
+                self._eval_node(index, env)]
+        elif isinstance(node, ast.Attribute):
+            value = self._eval_node(node.value, env)
+            if not isinstance(value, _Table):
+                raise ValueError("invalid attribute '{0}'".format(node.attr))
+            return value.attribute(node.attr)
+        elif isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or \
+                    node.func.id not in _FUNCTIONS or node.keywords:
+                raise ValueError("unsupported function call")
+            return _FUNCTIONS[node.func.id](
+                *[self._eval_node(n, env) for n in node.args])
+        elif isinstance(node, ast.Compare):
+            left = self._eval_node(node.left, env)
+            for op, n in zip(node.ops, node.comparators):
+                right = self._eval_node(n, env)
+                if type(op) not in _COMPARE or \
+                        not _COMPARE[type(op)](left, right):
+                    return False
+                left = right
+            return True
+        elif isinstance(node, ast.BoolOp):
+            value = None
+            for n in node.values:
+                value = self._eval_node(n, env)
+                if bool(value) != isinstance(node.op, ast.And):
+                    break
+            return value
+        elif isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY:
+            return _UNARY[type(node.op)](self._eval_node(node.operand, env))
+        elif isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+            return _BINARY[type(node.op)](
+                self._eval_node(node.left, env),
+                self._eval_node(node.right, env))
+        raise ValueError("unsupported expression '{0}'".format(
+            type(node).__name__))
+
+    pass
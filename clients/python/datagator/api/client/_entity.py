@@ -14,6 +14,7 @@ from __future__ import unicode_literals, with_statement
 
 import abc
 import atexit
+import codecs
 import importlib
 import io
 import itertools
@@ -22,13 +23,17 @@ import jsonschema
 import logging
 import os
 import re
-import tempfile
+import zlib
 
 from . import environ
 from ._backend import DataGatorService
-from ._cache import CacheManager
+from ._cache import CacheManager, SingleFlight
+from ._cache.codec import decompress, digest
+from ._cache.memory import TieredCache
 from ._compat import OrderedDict, with_metaclass
 from ._compat import to_bytes, to_native, to_unicode
+from ._records import RecordStore
+from ._task import TaskWatcher
 
 
 __all__ = ['Entity', 'validated', 'normalized', ]
@@ -55,8 +60,16 @@ class validated(object):
 
     DEFAULT_CHUNK_SIZE = 2 ** 21  # 2MB
 
-    __slots__ = ['__response', '__expected_status', '__raw_body',
-                 '__decoded_body', '__size', ]
+    # initial buffer of a message body without `Content-Length`, which is
+    # doubled whenever filled up
+    MIN_BUFFER_SIZE = 2 ** 14  # 16KB
+
+    # content-encodings kept as-is (along with the decoded message body),
+    # mapped to the corresponding cache codecs
+    PASSTHROUGH_ENCODINGS = {"gzip": "gzip", "x-gzip": "gzip", }
+
+    __slots__ = ['__response', '__expected_status', '__content',
+                 '__encoded', '__decoded_body', ]
 
     def __init__(self, response, verify_status=True):
         """
@@ -69,9 +82,9 @@ class validated(object):
         self.__expected_status = tuple(verify_status) \
             if isinstance(verify_status, (list, tuple)) else (200, ) \
             if verify_status else None
-        self.__raw_body = None
+        self.__content = None
+        self.__encoded = None
         self.__decoded_body = None
-        self.__size = 0
         pass
 
     @property
@@ -99,24 +112,39 @@ class validated(object):
         return dict([(k, v) for v, k in re.findall(
             regex, self.headers['Link'])])
 
+    @property
+    def content(self):
+        """
+        HTTP message body as a bytes-like object (without copying)
+        """
+        return self.__content
+
     @property
     def body(self):
         """
-        HTTP message body stored as a file-like object
+        HTTP message body as a file-like object (a copy of :attr:`content`)
+        """
+        if self.__content is None:
+            return None
+        return io.BytesIO(self.__content)
+
+    @property
+    def encoded(self):
+        """
+        Tuple of cache codec and HTTP message body as transferred (i.e. prior
+        to content-decoding), or ``None`` unless compressed by one of
+        :attr:`PASSTHROUGH_ENCODINGS`
         """
-        if self.__raw_body is not None:
-            self.__raw_body.seek(0)
-        return self.__raw_body
+        return self.__encoded
 
     def json(self, validate_schema=True):
         """
-        JSON-decoded message body of the underlying response
+        JSON-decoded message body of the underlying response (decoded once,
+        upon the first call)
         """
         if self.__decoded_body is None:
             try:
-                # py3k cannot `json.load()` binary files directly, it needs a
-                # text IO wrapper to handle decoding (to unicode / str)
-                data = json.load(io.TextIOWrapper(self.body))
+                data = json.loads(codecs.utf_8_decode(self.__content)[0])
                 if validate_schema:
                     Entity.schema.validate(data)
             except (jsonschema.ValidationError, AssertionError, IOError, ):
@@ -126,59 +154,100 @@ class validated(object):
         return self.__decoded_body
 
     def __len__(self):
-        return self.__size
+        return len(self.__content or b"")
 
-    def __enter__(self):
-        # validate content-type and body data
+    def _prepare(self):
+        # validate content-type of the message body
         _log.debug("validating response")
         _log.debug("  - from: {0}".format(self.__response.url))
-        _log.debug("  - status code: {0}".format(self.__response.status_code))
+        _log.debug("  - status code: {0}".format(self.status_code))
         _log.debug("  - response time: {0}".format(self.__response.elapsed))
+        # response body should be a valid JSON object (except for a 304
+        # response to a conditional request, which does not have a body)
+        assert(self.status_code == 304 or
+               self.headers['Content-Type'] == "application/json")
+        pass
+
+    def _read(self):
+        # read the (content-decoded) message body into a single buffer,
+        # which is filled in place by `readinto()`, rather than collecting
+        # chunks and joining them into yet another copy
+        r = self.__response
+        raw = getattr(r, "raw", None)
+        if not hasattr(raw, "readinto") or getattr(raw, "closed", False):
+            # the body has been read already (i.e. a non-streamed request)
+            return r.content or b""
+        # `Content-Length` is exact for the body as transferred, which is
+        # read as-is and decoded here, since `readinto()` of a decoding
+        # response may return more (decoded) bytes than the buffer holds
+        size = int(r.headers.get("Content-Length") or 0)
+        encoding = r.headers.get("Content-Encoding", "").strip().lower()
+        raw.decode_content = False
+        buf = self._readinto(raw, size)
+        if encoding in ("", "identity"):
+            return buf
+        codec = self.PASSTHROUGH_ENCODINGS.get(encoding, None)
+        try:
+            if codec is not None:
+                content = decompress(buf, codec)
+                # keep the compressed body for caching
+                self.__encoded = (codec, buf)
+                return content
+            elif encoding == "deflate":
+                # zlib-wrapped as specified, or raw deflate by some servers
+                try:
+                    return zlib.decompress(buf)
+                except zlib.error:
+                    return zlib.decompress(buf, -zlib.MAX_WBITS)
+        except zlib.error as e:
+            raise IOError("malformed message body: {0}".format(e))
+        raise IOError("unsupported content encoding '{0}'".format(encoding))
+
+    def _readinto(self, raw, size):
+        # one extra byte spares growing the buffer only to find out EOF
+        buf = bytearray(size + 1 if size else self.MIN_BUFFER_SIZE)
+        pos = 0
+        while True:
+            if pos == len(buf):
+                buf.extend(bytearray(len(buf)))
+            n = raw.readinto(memoryview(buf)[pos:])
+            if not n:
+                break
+            pos += n
+        del buf[pos:]
+        return buf
+
+    def _complete(self, content):
+        # adopt the fully-read message body, and validate status code
+        self.__content = content
+        _log.debug("  - decoded size: {0}".format(len(self)))
+        if self.__expected_status is not None and \
+                self.status_code not in self.__expected_status:
+            # error responses always come with code and message
+            data = self.json()
+            msg = "unexpected response from backend service"
+            if data.get("kind") == "datagator#Error":
+                msg = "{0} ({1}): {2}".format(
+                    msg, data.get("code", "N/A"), data.get("message", ""))
+            # re-raise as runtime error
+            raise RuntimeError(msg)
+        return self
+
+    def __enter__(self):
         try:
-            # response body should be a valid JSON object
-            assert(self.headers['Content-Type'] == "application/json")
-            f = tempfile.SpooledTemporaryFile(
-                max_size=self.DEFAULT_CHUNK_SIZE, mode="w+b",
-                suffix=".DataGatorEntity")
-            # make sure f conforms to the prototype of `io.IOBase`
-            for attr in ("readable", "writable", "seekable"):
-                if not hasattr(f, attr):
-                    setattr(f, attr, lambda: True)
-            # wrie decoded response body
-            for chunk in self.__response.iter_content(
-                    chunk_size=self.DEFAULT_CHUNK_SIZE,
-                    decode_unicode=True):
-                if not chunk:
-                    continue
-                f.write(chunk)
-            self.__raw_body = f
-            self.__size = f.tell()
-            _log.debug("  - decoded size: {0}".format(len(self)))
+            self._prepare()
+            content = self._read()
         except (AssertionError, IOError, ):
             # re-raise as runtime error
             raise RuntimeError("invalid response from backend service")
-        else:
-            # validate status code
-            if self.__expected_status is not None and \
-                    self.status_code not in self.__expected_status:
-                # error responses always come with code and message
-                data = self.json()
-                msg = "unexpected response from backend service"
-                if data.get("kind") == "datagator#Error":
-                    msg = "{0} ({1}): {2}".format(
-                        msg, data.get("code", "N/A"), data.get("message", ""))
-                # re-raise as runtime error
-                raise RuntimeError(msg)
-            pass
-        return self
+        return self._complete(content)
 
     def __exit__(self, ext_type, exc_value, traceback):
         if isinstance(exc_value, Exception):
             _log.error("failed response validation")
-        # discard temporary file
-        if self.__raw_body is not None:
-            self.__raw_body.close()
-            self.__raw_body = None
+        # release the message body (but not the decoded content)
+        self.__content = None
+        self.__encoded = None
         return False  # re-raise exception
 
     pass
@@ -200,7 +269,19 @@ class EntityType(type):
             raise AssertionError("invalid cache backend '{0}'".format(
                 environ.DATAGATOR_CACHE_BACKEND))
         else:
-            prop['store'] = CacheManagerBackend()
+            store = CacheManagerBackend()
+            # decoded entities are kept in memory for repeated access (and
+            # possibly, on disk as snapshots for later runs)
+            if environ.DATAGATOR_CACHE_MEMORY_BYTES > 0 or \
+                    environ.DATAGATOR_CACHE_SNAPSHOT:
+                store = TieredCache(
+                    store, environ.DATAGATOR_CACHE_MEMORY_BYTES,
+                    snapshot=environ.DATAGATOR_CACHE_SNAPSHOT)
+            prop['store'] = store
+            # concurrent cache misses of the same entity share one request
+            prop['flights'] = SingleFlight()
+            # durable records outliving (non-persistent) cached entities
+            prop['records'] = RecordStore()
 
         # initialize backend service shared by all entities
         try:
@@ -209,6 +290,8 @@ class EntityType(type):
             raise RuntimeError("failed to initialize backend service")
         else:
             prop['service'] = service
+            # asynchronous tasks are polled through the same service
+            prop['watcher'] = TaskWatcher(service)
 
         # initialize schema validator shared by all entities
         try:
@@ -252,6 +335,18 @@ class Entity(with_metaclass(EntityType, object)):
 
         pass
 
+    @staticmethod
+    def record_key(name):
+        """
+        :param name: name of a durable record, e.g. ``<uri>#fingerprint``.
+        :returns: key of the record in ``Entity.records``, scoped by the
+            authenticated user and the backend service, which may hold other
+            entities of the same name (e.g. staging and production portals).
+        """
+        auth = Entity.service.auth
+        user = auth[0] if isinstance(auth, tuple) else ""
+        return "{0}@{1}/{2}".format(user, environ.DATAGATOR_API_URL, name)
+
     @classmethod
     def cleanup(cls):
         # decref triggers garbage collection of the cache manager backend
@@ -284,24 +379,83 @@ class Entity(with_metaclass(EntityType, object)):
     # `._cache_deleter()` to extend / override the default caching behaviour.
 
     def _cache_getter(self):
+        if Entity.store.stale(self.uri):
+            return self._cache_revalidate()
+        data = Entity.store.get(self.uri, None)
+        if data is None:
+            data = Entity.flights.do((self.uri, ), self._cache_fetch)
+        return data
+
+    def _cache_fetch(self):
+        # the data may have been cached by a flight that just landed
         data = Entity.store.get(self.uri, None)
         if data is None:
             with validated(Entity.service.get(self.uri, stream=True)) as r:
-                # valid response should bear a matching entity kind
-                kind = normalized(r.headers.get("X-DataGator-Entity", None))
-                assert(kind == self.kind), \
-                    "unexpected entity kind '{0}'".format(kind)
-                # cache data for reuse (iff. advised by the backend)
-                if r.headers.get("Cache-Control", "private") != "no-cache":
-                    # cache backend typically only support byte-string values,
-                    # so passing `r.body` (file-like object) instead of `data`
-                    # (dictionary) can save an extra round of JSON-encoding.
-                    Entity.store.put(self.uri, r.body)
-                # this should come last since calling `r.json()` will close the
-                # temporary file under `r.body` implicitly (observed in py27).
-                data = r.json()
+                data = self._cache_response(r)
         return data
 
+    def _cache_revalidate(self):
+        # refresh the cached data with a conditional request, so that the
+        # (unmodified) content is not transmitted again.
+        meta = Entity.store.meta(self.uri) or {}
+        headers = {}
+        if meta.get("etag"):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get("last_modified"):
+            headers['If-Modified-Since'] = meta['last_modified']
+        key = (self.uri, meta.get("etag"), meta.get("last_modified"))
+        return Entity.flights.do(
+            key, lambda: self._cache_conditional_fetch(headers))
+
+    def _cache_conditional_fetch(self, headers):
+        with validated(Entity.service.get(
+                self.uri, headers=headers, stream=True), (200, 304)) as r:
+            if r.status_code == 304:
+                _log.debug("  - reusing cached '{0}'".format(self.uri))
+                data = Entity.store.get(self.uri, None)
+                if data is not None:
+                    Entity.store.touch(self.uri)
+                    return data
+            else:
+                return self._cache_response(r)
+        # cached data has gone since the request was sent
+        Entity.store.delete(self.uri)
+        return self._cache_getter()
+
+    def _cache_response(self, r):
+        data = r.json()
+        self._cache_store(r, data)
+        return data
+
+    def _cache_store(self, r, data=None):
+        # valid response should bear a matching entity kind
+        kind = normalized(r.headers.get("X-DataGator-Entity", None))
+        assert(kind == self.kind), \
+            "unexpected entity kind '{0}'".format(kind)
+        # cache data for reuse (iff. advised by the backend)
+        if r.headers.get("Cache-Control", "private") != "no-cache":
+            # keep validators for revalidating the cached data later on
+            meta = dict([(k, r.headers[h]) for k, h in (
+                ("etag", "ETag"),
+                ("last_modified", "Last-Modified"), ) if h in r.headers])
+            # cache backend typically only support byte-string values,
+            # so passing `r.content` (raw bytes) instead of `data` saves
+            # an extra round of JSON-encoding, and the decoded `data` (if
+            # any) is kept in memory to save decoding it again.
+            value = r.content
+            if r.encoded is not None:
+                # compressed body is cached as-is, without recompressing,
+                # but addressed by its content (gzip headers carry varying
+                # timestamps) for deduplication
+                meta['codec'], value = r.encoded
+                meta['length'] = len(r.content)
+                meta['digest'] = digest(r.content)
+            if data is not None and isinstance(Entity.store, TieredCache):
+                Entity.store.put(self.uri, value, meta, decoded=data)
+            else:
+                Entity.store.put(self.uri, value, meta)
+        pass
+
     def _cache_deleter(self):
         Entity.store.delete(self.uri)
         pass
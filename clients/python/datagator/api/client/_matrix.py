@@ -0,0 +1,758 @@
+# -*- coding: utf-8 -*-
+"""
+    datagator.api.client._matrix
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    In-memory representations of ``Matrix`` content, with the four-block
+    layout (``preamble``, ``columnHeaders``, ``rowHeaders`` and ``body``)
+    defined in ``docs/model.rst``.
+
+    :copyright: 2015 by `University of Denver <http://pardee.du.edu/>`_
+    :license: Apache 2.0, see LICENSE for more details.
+
+    :author: `LIU Yu <liuyu@opencps.net>`_
+    :date: 2015/12/21
+"""
+
+from __future__ import unicode_literals, with_statement
+
+import abc
+import array
+import bisect
+import logging
+import sys
+
+from ._compat import integer_types, text_type, to_native
+
+# NumPy is optional, typed columns are exposed as `ndarray` views if present
+try:
+    _numpy = __import__("numpy", level=0)
+except ImportError:
+    _numpy = None
+
+
+__all__ = ['BlockMatrix', 'MatrixView', 'Column', 'ColumnView',
+           'ColumnarMatrix', 'SparseMatrix', 'RowIndex', 'transpose', ]
+__all__ = [to_native(n) for n in __all__]
+
+
+_log = logging.getLogger(__name__)
+
+
+def _int_typecodes():
+    # signed integer typecodes available to `array`, from the most compact
+    for typecode in "bhilq":
+        try:
+            itemsize = array.array(to_native(typecode)).itemsize
+        except ValueError:
+            continue  # `q` is not supported by py2
+        bound = 2 ** (8 * itemsize - 1)
+        yield typecode, -bound, bound - 1
+    pass
+
+
+_INT_TYPECODES = list(_int_typecodes())
+
+
+def _typecode(values):
+    # most compact `array` typecode for the non-null values of a column, or
+    # `None` if the values have to be kept as python objects
+    kinds = set()
+    lo = hi = 0
+    for v in values:
+        if v is None:
+            continue
+        if isinstance(v, bool):
+            return None
+        elif isinstance(v, integer_types):
+            kinds.add(int)
+            lo, hi = min(lo, v), max(hi, v)
+        elif isinstance(v, float):
+            kinds.add(float)
+        else:
+            return None
+    if float in kinds:
+        return "d"
+    for typecode, min_value, max_value in _INT_TYPECODES:
+        if min_value <= lo and hi <= max_value:
+            return typecode
+    return None
+
+
+def transpose(rows):
+    """
+    ``list`` of columns (each as a ``list`` of values) from an iterable of
+    rows, ragged rows are padded with ``None``
+    """
+    columns = []
+    height = 0
+    for row in rows:
+        while len(columns) < len(row):
+            columns.append([None] * height)
+        for j, column in enumerate(columns):
+            column.append(row[j] if j < len(row) else None)
+        height += 1
+    return columns
+
+
+class Column(object):
+    """
+    Typed storage of a column of values with a validity bitmap
+
+    Numeric columns are packed into an ``array`` of the most compact type,
+    where ``null`` values are stored as zeros and flagged in the bitmap. All
+    other columns (i.e. strings, ISO 8601 datetimes and mixed values) are
+    kept as a ``tuple`` of python objects.
+    """
+
+    __slots__ = ['__values', '__mask', '__size', ]
+
+    def __init__(self, values, interned=None):
+        """
+        :param values: ``list`` of primitive values (or ``None``).
+        :param interned: ``dict`` for sharing equal strings among columns.
+        """
+        super(Column, self).__init__()
+        self.__size = len(values)
+        self.__mask = bytearray((self.__size + 7) // 8)
+        for i, v in enumerate(values):
+            if v is not None:
+                self.__mask[i >> 3] |= 1 << (i & 7)
+        typecode = _typecode(values)
+        if typecode is None:
+            if interned is not None:
+                values = [interned.setdefault(v, v)
+                          if isinstance(v, text_type) else v for v in values]
+            self.__values = tuple(values)
+        else:
+            self.__values = array.array(
+                to_native(typecode), [0 if v is None else v for v in values])
+        pass
+
+    @property
+    def typecode(self):
+        """
+        ``array`` typecode of the values, or ``None`` for python objects
+        """
+        if isinstance(self.__values, array.array):
+            return to_native(self.__values.typecode)
+        return None
+
+    @property
+    def mask(self):
+        """
+        validity bitmap, where bit ``i & 7`` of byte ``i >> 3`` is set iff.
+        the ``i``-th value is not ``null``
+        """
+        return self.__mask
+
+    @property
+    def nbytes(self):
+        """
+        bytes allocated for the values and the validity bitmap
+        """
+        if self.typecode is None:
+            size = sys.getsizeof(self.__values)
+        else:
+            size = self.__values.itemsize * len(self.__values)
+        return size + len(self.__mask)
+
+    def valid(self, i):
+        return bool(self.__mask[i >> 3] & (1 << (i & 7)))
+
+    def view(self, start=0, stop=None):
+        """
+        :returns: :class:`ColumnView` of the values in ``[start:stop]``.
+        """
+        return ColumnView(self, start, stop)
+
+    def values(self, start=0, stop=None):
+        """
+        Raw values in ``[start:stop]`` (with ``null`` stored as zeros),
+        which is a zero-copy ``ndarray`` (if NumPy is available) or
+        ``memoryview`` of typed columns.
+        """
+        stop = self.__size if stop is None else stop
+        if self.typecode is None:
+            return self.__values[start:stop]
+        if _numpy is not None:
+            return _numpy.frombuffer(
+                self.__values, dtype=self.typecode)[start:stop]
+        try:
+            return memoryview(self.__values)[start:stop]
+        except TypeError:
+            # py2 `array` does not support the new buffer protocol
+            return self.__values[start:stop]
+        pass
+
+    def valid_mask(self, start=0, stop=None):
+        """
+        ``ndarray`` of ``bool`` flags of non-null values in ``[start:stop]``
+        (requires NumPy)
+        """
+        if _numpy is None:
+            raise ImportError("""Could not load `numpy` dependency.
+                See http://www.numpy.org/""")
+        stop = self.__size if stop is None else stop
+        bits = _numpy.unpackbits(
+            _numpy.frombuffer(bytes(self.__mask), dtype=_numpy.uint8),
+            bitorder="little")
+        return bits[start:stop].astype(bool)
+
+    def __len__(self):
+        return self.__size
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.__size
+        if not 0 <= i < self.__size:
+            raise IndexError("column index out of range")
+        if not self.valid(i):
+            return None
+        return self.__values[i]
+
+    def __iter__(self):
+        for i in range(self.__size):
+            yield self[i]
+        pass
+
+    pass
+
+
+class ColumnView(object):
+    """
+    Zero-copy view of a range of values from a :class:`Column`
+    """
+
+    __slots__ = ['__column', '__start', '__stop', ]
+
+    def __init__(self, column, start=0, stop=None):
+        super(ColumnView, self).__init__()
+        self.__column = column
+        self.__start = start
+        self.__stop = len(column) if stop is None else stop
+        pass
+
+    @property
+    def typecode(self):
+        return self.__column.typecode
+
+    def values(self):
+        return self.__column.values(self.__start, self.__stop)
+
+    def valid_mask(self):
+        return self.__column.valid_mask(self.__start, self.__stop)
+
+    def __len__(self):
+        return max(self.__stop - self.__start, 0)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("column index out of range")
+        return self.__column[self.__start + i]
+
+    def __iter__(self):
+        for i in range(self.__start, self.__stop):
+            yield self.__column[i]
+        pass
+
+    pass
+
+
+class BlockMatrix(object):
+    """
+    Abstract base class of in-memory ``Matrix`` representations
+
+    Subclasses only need to implement :attr:`shape`, :meth:`cell` and
+    :meth:`column`, while the four blocks of the layout are exposed as
+    :class:`MatrixView` objects sharing the same underlying storage.
+    """
+
+    __slots__ = ['__layout', ]
+
+    def __init__(self, column_headers=0, row_headers=0):
+        """
+        :param column_headers: number of leading rows as column headers.
+        :param row_headers: number of leading columns as row headers.
+        """
+        super(BlockMatrix, self).__init__()
+        self.__layout = (column_headers, row_headers)
+        pass
+
+    @property
+    @abc.abstractmethod
+    def shape(self):
+        """
+        ``(<rowsCount>, <columnsCount>)`` tuple
+        """
+        return (0, 0)
+
+    @abc.abstractmethod
+    def cell(self, i, j):
+        """
+        :returns: value at row ``i`` and column ``j``, or ``None``.
+        """
+        return None
+
+    @abc.abstractmethod
+    def column(self, j, start=0, stop=None):
+        """
+        :returns: sequence of values of column ``j`` in rows
+            ``[start:stop]``.
+        """
+        return []
+
+    @property
+    def layout(self):
+        """
+        ``dict`` of ``columnHeaders``, ``rowHeaders``, ``rowsCount`` and
+        ``columnsCount`` of the matrix
+        """
+        return dict(zip(
+            ("columnHeaders", "rowHeaders", "rowsCount", "columnsCount", ),
+            self.__layout + tuple(self.shape)))
+
+    def row(self, i):
+        return [self.cell(i, j) for j in range(self.shape[1])]
+
+    def __getitem__(self, index):
+        if isinstance(index, tuple):
+            return self.cell(*index)
+        return self.row(index)
+
+    def __iter__(self):
+        for i in range(self.shape[0]):
+            yield self.row(i)
+        pass
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def preamble(self):
+        ch, rh = self.__layout
+        return MatrixView(self, 0, ch, 0, rh)
+
+    @property
+    def column_headers(self):
+        ch, rh = self.__layout
+        return MatrixView(self, 0, ch, 0, self.shape[1])
+
+    @property
+    def row_headers(self):
+        ch, rh = self.__layout
+        return MatrixView(self, 0, self.shape[0], 0, rh)
+
+    @property
+    def body(self):
+        ch, rh = self.__layout
+        return MatrixView(self, ch, self.shape[0], rh, self.shape[1])
+
+    def to_rows(self):
+        """
+        ``list`` of rows as in the ``rows`` of a JSON-encoded ``Matrix``
+        """
+        return list(self)
+
+    pass
+
+
+class MatrixView(BlockMatrix):
+    """
+    Rectangular block of a :class:`BlockMatrix` without copying values
+    """
+
+    __slots__ = ['__matrix', '__rows', '__columns', ]
+
+    def __init__(self, matrix, row_start, row_stop, col_start, col_stop):
+        self.__matrix = matrix
+        self.__rows = (row_start, max(row_start, row_stop))
+        self.__columns = (col_start, max(col_start, col_stop))
+        # the block layout is self-similar, i.e. the `preamble` of a matrix
+        # is the `rowHeaders` of its `columnHeaders`, see `docs/model.rst`
+        layout = matrix.layout
+        super(MatrixView, self).__init__(
+            min(max(layout['columnHeaders'] - row_start, 0),
+                self.__rows[1] - row_start),
+            min(max(layout['rowHeaders'] - col_start, 0),
+                self.__columns[1] - col_start))
+        pass
+
+    @property
+    def shape(self):
+        return (self.__rows[1] - self.__rows[0],
+                self.__columns[1] - self.__columns[0])
+
+    def _offset(self, i, j):
+        rows, columns = self.shape
+        if not (0 <= i < rows and 0 <= j < columns):
+            raise IndexError("matrix index out of range")
+        return self.__rows[0] + i, self.__columns[0] + j
+
+    def cell(self, i, j):
+        return self.__matrix.cell(*self._offset(i, j))
+
+    def column(self, j, start=0, stop=None):
+        stop = self.shape[0] if stop is None else min(stop, self.shape[0])
+        return self.__matrix.column(
+            self._offset(0, j)[1], self.__rows[0] + start,
+            self.__rows[0] + stop)
+
+    pass
+
+
+class ColumnarMatrix(BlockMatrix):
+    """
+    Column-oriented ``Matrix`` with typed columns
+
+    Rows of the column headers are kept as tuples of (interned) values. The
+    remaining rows are stored column by column in :class:`Column` objects,
+    so that a column of the ``body`` can be accessed as a typed array.
+    """
+
+    __slots__ = ['__head', '__columns', '__shape', ]
+
+    @classmethod
+    def from_rows(cls, rows, column_headers=0, row_headers=0):
+        """
+        :param rows: iterable of rows, i.e. ``rows`` of a ``Matrix``.
+        """
+        return cls(transpose(rows), column_headers, row_headers)
+
+    def __init__(self, columns, column_headers=0, row_headers=0):
+        """
+        :param columns: ``list`` of columns, each as a ``list`` of values.
+        :param column_headers: number of leading rows as column headers.
+        :param row_headers: number of leading columns as row headers.
+        """
+        super(ColumnarMatrix, self).__init__(column_headers, row_headers)
+        height = max([len(c) for c in columns] or [0])
+        interned = {}
+        self.__head = tuple([
+            tuple([interned.setdefault(c[i], c[i])
+                   if isinstance(c[i], text_type) else c[i]
+                   for c in columns])
+            for i in range(min(column_headers, height))])
+        self.__columns = [
+            Column(c[column_headers:], interned) for c in columns]
+        self.__shape = (height, len(columns))
+        pass
+
+    @property
+    def shape(self):
+        return self.__shape
+
+    @property
+    def nbytes(self):
+        """
+        approximated bytes allocated for the values (excluding the values of
+        shared strings)
+        """
+        return sum([c.nbytes for c in self.__columns]) + sum(
+            [sys.getsizeof(r) for r in self.__head])
+
+    def cell(self, i, j):
+        if not (0 <= i < self.__shape[0] and 0 <= j < self.__shape[1]):
+            raise IndexError("matrix index out of range")
+        if i < len(self.__head):
+            return self.__head[i][j]
+        return self.__columns[j][i - len(self.__head)]
+
+    def column(self, j, start=0, stop=None):
+        """
+        :returns: :class:`ColumnView` of column ``j`` in rows
+            ``[start:stop]``, or a ``list`` if the range overlaps the column
+            headers.
+        """
+        stop = self.__shape[0] if stop is None else stop
+        offset = len(self.__head)
+        if start >= offset:
+            return self.__columns[j].view(start - offset, stop - offset)
+        return [self.cell(i, j) for i in range(start, stop)]
+
+    def row(self, i):
+        if i < len(self.__head):
+            return list(self.__head[i])
+        return [c[i - len(self.__head)] for c in self.__columns]
+
+    pass
+
+
+class SparseMatrix(BlockMatrix):
+    """
+    Run-length encoded ``Matrix`` for null-heavy content
+
+    Each row is stored as runs of equal non-null values, i.e. ``(<start>,
+    <length>, <value>)`` triples, in CSR-style arrays (``offsets`` of the
+    first run of each row, and ``starts`` / ``lengths`` / ``values`` of all
+    runs), so that the memory footprint is proportional to the number of
+    runs instead of the number of cells.
+    """
+
+    __slots__ = ['__shape', '__offsets', '__starts', '__lengths',
+                 '__values', '__row_keys', '__column_keys', ]
+
+    @staticmethod
+    def encode(rows):
+        """
+        :param rows: iterable of rows, i.e. ``rows`` of a ``Matrix``.
+        :returns: 2-``tuple`` of the ``(offsets, starts, lengths, values)``
+            runs and the ``(<rowsCount>, <columnsCount>)`` shape.
+        """
+        offsets, starts, lengths, values = [0], [], [], []
+        interned = {}
+        height = width = 0
+        for row in rows:
+            for j, v in enumerate(row):
+                if v is None:
+                    continue
+                # `1`, `1.0` and `true` are equal, but not the same value
+                if len(starts) > offsets[-1] and \
+                        starts[-1] + lengths[-1] == j and \
+                        type(values[-1]) is type(v) and values[-1] == v:
+                    lengths[-1] += 1
+                    continue
+                if isinstance(v, text_type):
+                    v = interned.setdefault(v, v)
+                starts.append(j)
+                lengths.append(1)
+                values.append(v)
+            offsets.append(len(starts))
+            height += 1
+            width = max(width, len(row))
+        return (offsets, starts, lengths, values), (height, width)
+
+    @classmethod
+    def from_rows(cls, rows, column_headers=0, row_headers=0):
+        """
+        :param rows: iterable of rows, i.e. ``rows`` of a ``Matrix``.
+        """
+        runs, shape = cls.encode(rows)
+        return cls(runs, shape, column_headers, row_headers)
+
+    @classmethod
+    def from_json(cls, data):
+        """
+        :param data: ``dict`` produced by :meth:`to_json`.
+        """
+        return cls(
+            (data['offsets'], data['starts'], data['lengths'],
+             data['values']),
+            (data['rowsCount'], data['columnsCount']),
+            data['columnHeaders'], data['rowHeaders'])
+
+    def __init__(self, runs, shape, column_headers=0, row_headers=0):
+        """
+        :param runs: ``(offsets, starts, lengths, values)`` from
+            :meth:`encode`.
+        :param shape: ``(<rowsCount>, <columnsCount>)`` tuple.
+        :param column_headers: number of leading rows as column headers.
+        :param row_headers: number of leading columns as row headers.
+        """
+        super(SparseMatrix, self).__init__(column_headers, row_headers)
+        offsets, starts, lengths, values = runs
+        self.__shape = tuple(shape)
+        typecode = to_native(_typecode(
+            [max(offsets or [0]), max(starts or [0]), max(lengths or [0])]))
+        self.__offsets = array.array(typecode, offsets)
+        self.__starts = array.array(typecode, starts)
+        self.__lengths = array.array(typecode, lengths)
+        self.__values = tuple(values)
+        self.__row_keys = None
+        self.__column_keys = None
+        pass
+
+    @property
+    def shape(self):
+        return self.__shape
+
+    @property
+    def density(self):
+        """
+        ratio of runs to cells
+        """
+        return float(len(self.__values)) / max(
+            self.__shape[0] * self.__shape[1], 1)
+
+    @property
+    def nbytes(self):
+        """
+        approximated bytes allocated for the runs (excluding the values of
+        shared strings)
+        """
+        return sum([a.itemsize * len(a) for a in (
+            self.__offsets, self.__starts, self.__lengths)]) + \
+            sys.getsizeof(self.__values)
+
+    def to_json(self):
+        """
+        JSON-serializable ``dict`` of the runs and the layout
+        """
+        data = self.layout
+        data.update([
+            ("offsets", self.__offsets.tolist()),
+            ("starts", self.__starts.tolist()),
+            ("lengths", self.__lengths.tolist()),
+            ("values", list(self.__values)), ])
+        return data
+
+    def _runs(self, i):
+        if not 0 <= i < self.__shape[0]:
+            raise IndexError("matrix index out of range")
+        return self.__offsets[i], self.__offsets[i + 1]
+
+    def cell(self, i, j):
+        lo, hi = self._runs(i)
+        if not 0 <= j < self.__shape[1]:
+            raise IndexError("matrix index out of range")
+        k = bisect.bisect_right(self.__starts, j, lo, hi) - 1
+        if k >= lo and j < self.__starts[k] + self.__lengths[k]:
+            return self.__values[k]
+        return None
+
+    def row(self, i):
+        lo, hi = self._runs(i)
+        row = [None] * self.__shape[1]
+        for k in range(lo, hi):
+            start = self.__starts[k]
+            row[start:start + self.__lengths[k]] = \
+                [self.__values[k]] * self.__lengths[k]
+        return row
+
+    def column(self, j, start=0, stop=None):
+        stop = self.__shape[0] if stop is None else stop
+        return [self.cell(i, j) for i in range(start, stop)]
+
+    def _key(self, cells):
+        return cells[0] if len(cells) == 1 else tuple(cells)
+
+    def get(self, row_key, column_key, default=None):
+        """
+        Look up a cell of the ``body`` by its row and column headers, e.g.
+        ``m.get("United States", 1945)`` on a membership matrix.
+
+        :param row_key: value of the row headers (or ``tuple`` of values if
+            there are more than one header column).
+        :param column_key: value of the column headers (or ``tuple`` of
+            values if there are more than one header row).
+        :returns: value of the (first) matching cell, or ``default``.
+        """
+        layout = self.layout
+        ch, rh = layout['columnHeaders'], layout['rowHeaders']
+        if self.__row_keys is None:
+            keys = {}
+            for i in range(ch, self.__shape[0]):
+                keys.setdefault(self._key(
+                    [self.cell(i, j) for j in range(rh)]), i)
+            self.__row_keys = keys
+        if self.__column_keys is None:
+            keys = {}
+            for j in range(rh, self.__shape[1]):
+                keys.setdefault(self._key(
+                    [self.cell(i, j) for i in range(ch)]), j)
+            self.__column_keys = keys
+        i = self.__row_keys.get(row_key)
+        j = self.__column_keys.get(column_key)
+        if i is None or j is None:
+            return default
+        value = self.cell(i, j)
+        return default if value is None else value
+
+    pass
+
+
+class RowIndex(object):
+    """
+    Hash index from the values of (row header) columns to row offsets
+
+    Keys are single values, or tuples of values if the index spans multiple
+    columns. Each key maps to the ascending ``list`` of offsets (w.r.t. the
+    ``rows`` of the matrix) of all rows bearing the key.
+    """
+
+    __slots__ = ['__columns', '__offsets', ]
+
+    @classmethod
+    def from_rows(cls, rows, columns, start=0):
+        """
+        :param rows: iterable of rows, i.e. ``rows`` of a ``Matrix``.
+        :param columns: ``tuple`` of offsets of the indexed columns.
+        :param start: offset of the first row to be indexed (i.e. the number
+            of column header rows).
+        """
+        offsets = {}
+        for i, row in enumerate(rows):
+            if i < start:
+                continue
+            key = tuple([row[j] if j < len(row) else None for j in columns])
+            offsets.setdefault(key, []).append(i)
+        return cls(columns, offsets)
+
+    @classmethod
+    def from_json(cls, data):
+        """
+        :param data: ``dict`` produced by :meth:`to_json`.
+        """
+        return cls(tuple(data['columns']), dict([
+            (tuple(key), offsets) for key, offsets in data['offsets']]))
+
+    def __init__(self, columns, offsets):
+        """
+        :param columns: ``tuple`` of offsets of the indexed columns.
+        :param offsets: ``dict`` from ``tuple`` keys to ``list`` of offsets.
+        """
+        super(RowIndex, self).__init__()
+        self.__columns = tuple(columns)
+        self.__offsets = offsets
+        pass
+
+    @property
+    def columns(self):
+        """
+        ``tuple`` of offsets of the indexed columns
+        """
+        return self.__columns
+
+    def _key(self, key):
+        if len(self.__columns) == 1 and not isinstance(key, tuple):
+            return (key, )
+        return tuple(key)
+
+    def to_json(self):
+        """
+        JSON-serializable ``dict`` of the index
+        """
+        return {
+            "columns": list(self.__columns),
+            "offsets": [[list(key), offsets]
+                        for key, offsets in self.__offsets.items()], }
+
+    def get(self, key, default=None):
+        """
+        :returns: ``list`` of row offsets of ``key``, or ``default``.
+        """
+        return self.__offsets.get(self._key(key), default)
+
+    def keys(self):
+        for key in self.__offsets:
+            yield key[0] if len(self.__columns) == 1 else key
+        pass
+
+    def __contains__(self, key):
+        return self._key(key) in self.__offsets
+
+    def __getitem__(self, key):
+        offsets = self.get(key)
+        if offsets is None:
+            raise KeyError(key)
+        return offsets
+
+    def __iter__(self):
+        return self.keys()
+
+    def __len__(self):
+        return len(self.__offsets)
+
+    pass
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+    datagator.api.client._records
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Durable records of the client, e.g. fingerprints of baked recipes.
+
+    :copyright: 2015 by `University of Denver <http://pardee.du.edu/>`_
+    :license: Apache 2.0, see LICENSE for more details.
+
+    :author: `LIU Yu <liuyu@opencps.net>`_
+    :date: 2015/12/27
+"""
+
+from __future__ import unicode_literals, with_statement
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from . import environ
+from ._compat import to_native
+
+
+__all__ = ['RecordStore', ]
+__all__ = [to_native(n) for n in __all__]
+
+
+_log = logging.getLogger(__name__)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS record (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+
+class RecordStore(object):
+    """
+    SQLite database of JSON-serializable records under ``DATAGATOR_HOME``
+
+    Unlike cached entities, records are neither evicted, nor discarded at
+    exit (regardless of ``DATAGATOR_CACHE_PERSISTENT``), so that they outlive
+    the process writing them, e.g. a nightly job skipping the work done by
+    its previous run. The database runs in WAL mode, and is shared by
+    concurrent processes.
+    """
+
+    # seconds to wait for a lock held by another connection
+    BUSY_TIMEOUT = 30
+
+    __slots__ = ['__path', '__local', ]
+
+    def __init__(self, path=None):
+        """
+        :param path: path to the SQLite database, defaults to
+            ``<DATAGATOR_HOME>/records.sqlite``, which is created upon the
+            first access.
+        """
+        super(RecordStore, self).__init__()
+        self.__path = path or os.path.join(
+            environ.DATAGATOR_HOME, "records.sqlite")
+        self.__local = threading.local()
+        pass
+
+    @property
+    def path(self):
+        return self.__path
+
+    @property
+    def db(self):
+        """
+        SQLite connection of the calling thread
+        """
+        conn = getattr(self.__local, "conn", None)
+        if conn is None:
+            _log.debug("initializing client records")
+            _log.debug("  - '{0}'".format(self.__path))
+            dirname = os.path.dirname(self.__path)
+            if dirname and not os.path.isdir(dirname):
+                try:
+                    os.makedirs(dirname)
+                except OSError:
+                    # created by another thread (or process) meanwhile
+                    if not os.path.isdir(dirname):
+                        raise
+            conn = sqlite3.connect(
+                to_native(self.__path), timeout=self.BUSY_TIMEOUT,
+                isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.executescript(_SCHEMA)
+            self.__local.conn = conn
+        return conn
+
+    def get(self, key, value=None):
+        """
+        :param key: name of the record.
+        :param value: default value of a missing record.
+        :returns: JSON-decoded record.
+        """
+        row = self.db.execute(
+            "SELECT value FROM record WHERE key = ?", (key, )).fetchone()
+        if row is None:
+            return value
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        """
+        :param key: name of the record.
+        :param value: JSON-serializable object.
+        """
+        self.db.execute(
+            "INSERT OR REPLACE INTO record (key, value, updated) "
+            "VALUES (?, ?, ?)", (key, json.dumps(value), time.time()))
+        pass
+
+    def put_many(self, records):
+        """
+        :param records: ``dict`` of JSON-serializable objects by names, which
+            are written in a single transaction.
+        """
+        now = time.time()
+        db = self.db
+        db.execute("BEGIN")
+        try:
+            db.executemany(
+                "INSERT OR REPLACE INTO record (key, value, updated) "
+                "VALUES (?, ?, ?)", [(key, json.dumps(value), now)
+                                     for key, value in records.items()])
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+        pass
+
+    def delete(self, key):
+        self.db.execute("DELETE FROM record WHERE key = ?", (key, ))
+        pass
+
+    pass
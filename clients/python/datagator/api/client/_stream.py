@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+    datagator.api.client._stream
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    :copyright: 2015 by `University of Denver <http://pardee.du.edu/>`_
+    :license: Apache 2.0, see LICENSE for more details.
+
+    :author: `LIU Yu <liuyu@opencps.net>`_
+    :date: 2015/12/19
+"""
+
+from __future__ import unicode_literals, with_statement
+
+import codecs
+import json
+import logging
+import re
+
+from ._compat import to_bytes, to_native
+
+
+__all__ = ['ObjectReader', 'MatrixWriter', ]
+__all__ = [to_native(n) for n in __all__]
+
+
+_log = logging.getLogger(__name__)
+
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+_decoder = json.JSONDecoder()
+
+
+class ObjectReader(object):
+    """
+    Incremental reader of a JSON-encoded object from a stream of chunks
+
+    Elements of one array-valued member (i.e. ``rows`` of a ``Matrix``) are
+    decoded and yielded one at a time while iterating over the reader. All
+    other members are decoded as a whole, and collected in :attr:`members`.
+    Only the element being decoded is kept in memory, and the stream is not
+    consumed beyond what the iteration needs.
+    """
+
+    __slots__ = ['__chunks', '__key', '__members', '__buffer', '__pos',
+                 '__eof', '__charset', ]
+
+    def __init__(self, chunks, key="rows", charset="utf-8"):
+        """
+        :param chunks: iterable of ``bytes`` (or ``unicode``) chunks.
+        :param key: name of the array-valued member to be streamed.
+        :param charset: encoding of ``bytes`` chunks.
+        """
+        super(ObjectReader, self).__init__()
+        self.__chunks = iter(chunks)
+        self.__key = key
+        self.__members = {}
+        self.__buffer = ""
+        self.__pos = 0
+        self.__eof = False
+        # multi-byte characters may be split across chunks
+        self.__charset = codecs.getincrementaldecoder(charset)()
+        pass
+
+    @property
+    def members(self):
+        """
+        ``dict`` of the (non-streamed) members decoded so far
+        """
+        return self.__members
+
+    def _fill(self):
+        # append the next chunk to the buffer, returns `False` at EOF
+        if self.__eof:
+            return False
+        try:
+            chunk = next(self.__chunks)
+        except StopIteration:
+            self.__eof = True
+            chunk = self.__charset.decode(b"", True)
+        else:
+            if isinstance(chunk, bytes):
+                chunk = self.__charset.decode(chunk)
+        # discard the consumed part of the buffer
+        self.__buffer = self.__buffer[self.__pos:] + chunk
+        self.__pos = 0
+        return True
+
+    def _peek(self):
+        # next non-whitespace character (which is not consumed)
+        while True:
+            self.__pos = _WHITESPACE.match(self.__buffer, self.__pos).end()
+            if self.__pos < len(self.__buffer):
+                return self.__buffer[self.__pos]
+            if not self._fill():
+                raise ValueError("unexpected end of JSON stream")
+        pass
+
+    def _expect(self, delimiters):
+        c = self._peek()
+        if c not in delimiters:
+            raise ValueError("unexpected '{0}' in JSON stream".format(c))
+        self.__pos += 1
+        return c
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.__buffer, self.__pos)
+            except ValueError:
+                end = None
+            # a value must be followed by a delimiter, otherwise it may be
+            # truncated by the end of buffer (i.e. `12` out of `123`)
+            if end is not None and (end < len(self.__buffer) or self.__eof):
+                self.__pos = end
+                return value
+            # at least double the pending part of the buffer before decoding
+            # again, so that a value split into many small chunks is decoded
+            # in (amortized) linear time
+            pending = len(self.__buffer) - self.__pos
+            if not self._fill():
+                raise ValueError("malformed JSON stream")
+            while len(self.__buffer) - self.__pos < 2 * pending:
+                if not self._fill():
+                    break
+        pass
+
+    def _iter_array(self):
+        self._expect("[")
+        if self._peek() == "]":
+            self.__pos += 1
+            return
+        while True:
+            yield self._value()
+            if self._expect(",]") == "]":
+                break
+        pass
+
+    def __iter__(self):
+        self._expect("{")
+        if self._peek() == "}":
+            self.__pos += 1
+            return
+        while True:
+            key = self._value()
+            if not isinstance(key, type("")):
+                raise ValueError("malformed JSON stream")
+            self._expect(":")
+            if key == self.__key:
+                for item in self._iter_array():
+                    yield item
+            else:
+                self.__members[key] = self._value()
+            if self._expect(",}") == "}":
+                break
+        pass
+
+    pass
+
+
+class MatrixWriter(object):
+    """
+    Incremental writer of a JSON-encoded ``Matrix`` from an iterable of rows
+
+    Rows are encoded one at a time while iterating over the writer (or
+    writing it to a file-like object), so that a ``Matrix`` produced by a
+    generator is never held in memory as a whole. ``rowsCount`` and
+    ``columnsCount`` are counted along the way, and appended after ``rows``.
+    """
+
+    __slots__ = ['__rows', '__column_headers', '__row_headers', '__shape', ]
+
+    def __init__(self, rows, columnHeaders=0, rowHeaders=0):
+        """
+        :param rows: iterable of rows, each being a sequence of JSON-encodable
+            values of the same length.
+        :param columnHeaders: number of leading rows of column headers.
+        :param rowHeaders: number of leading columns of row headers.
+        """
+        super(MatrixWriter, self).__init__()
+        for n in (columnHeaders, rowHeaders):
+            if not isinstance(n, int) or n < 0:
+                raise ValueError("invalid number of headers '{0}'".format(n))
+        self.__rows = iter(rows)
+        self.__column_headers = columnHeaders
+        self.__row_headers = rowHeaders
+        self.__shape = None
+        pass
+
+    @property
+    def shape(self):
+        """
+        ``(<rowsCount>, <columnsCount>)`` tuple, or ``None`` until all rows
+        have been written
+        """
+        return self.__shape
+
+    def write(self, f):
+        """
+        :param f: file-like object opened for writing ``bytes``.
+        :returns: number of bytes written.
+        """
+        size = 0
+        for chunk in self:
+            chunk = to_bytes(chunk)
+            f.write(chunk)
+            size += len(chunk)
+        return size
+
+    def __iter__(self):
+        if self.__rows is None:
+            raise ValueError("rows of the matrix have been written already")
+        rows, self.__rows = self.__rows, None
+        yield "{{\"kind\": \"datagator#Matrix\", \"columnHeaders\": {0}, " \
+            "\"rowHeaders\": {1}, \"rows\": [".format(
+                self.__column_headers, self.__row_headers)
+        rows_count, columns_count = 0, 0
+        for row in rows:
+            row = list(row)
+            if rows_count == 0:
+                columns_count = len(row)
+            elif len(row) != columns_count:
+                raise ValueError(
+                    "row {0} has {1} columns instead of {2}".format(
+                        rows_count, len(row), columns_count))
+            yield (", " if rows_count else "") + json.dumps(row)
+            rows_count += 1
+        if self.__column_headers > rows_count or \
+                self.__row_headers > columns_count:
+            raise ValueError("more headers than the {0}x{1} matrix".format(
+                rows_count, columns_count))
+        yield "], \"rowsCount\": {0}, \"columnsCount\": {1}}}".format(
+            rows_count, columns_count)
+        self.__shape = (rows_count, columns_count)
+        pass
+
+    pass
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+    datagator.api.client._task
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Completion tracking of asynchronous ``Task`` objects.
+
+    :copyright: 2015 by `University of Denver <http://pardee.du.edu/>`_
+    :license: Apache 2.0, see LICENSE for more details.
+
+    :author: `LIU Yu <liuyu@opencps.net>`_
+    :date: 2015/12/23
+"""
+
+from __future__ import unicode_literals, with_statement
+
+import logging
+import threading
+import time
+
+from ._compat import to_native, to_unicode
+
+try:
+    from concurrent.futures import Future
+except ImportError:
+    raise ImportError("""Could not load `futures` dependency.
+        See https://pypi.python.org/pypi/futures""")
+
+
+__all__ = ['TaskWatcher', ]
+__all__ = [to_native(n) for n in __all__]
+
+
+_log = logging.getLogger(__name__)
+
+
+class _Pending(object):
+
+    __slots__ = ['future', 'url', 'repo', 'deadline', ]
+
+    def __init__(self, url, repo, timeout):
+        self.future = Future()
+        self.url = url
+        self.repo = repo
+        self.deadline = None if timeout is None else time.time() + timeout
+        pass
+
+    pass
+
+
+class TaskWatcher(object):
+    """
+    Track outstanding ``Task`` objects until they complete
+
+    Tasks are polled in rounds by a background thread, which exits once no
+    task is left. Tasks of the same ``Repo`` are polled as a batch through
+    the task listing endpoint (i.e. ``task/<repo>``), so that one API call
+    accounts for up to a page of tasks. The interval between rounds is
+    doubled (up to :attr:`MAX_INTERVAL`) while no task completes, and reset
+    whenever a task completes or a new task is watched. All polls are sent
+    through the backend service, thus accounted for by its rate limiter.
+    """
+
+    MIN_INTERVAL = 1.0
+    MAX_INTERVAL = 30.0
+
+    # final states of `Task.status`
+    COMPLETED = ("SUC", "ERR", )
+
+    __slots__ = ['__service', '__lock', '__wakeup', '__pending', '__thread',
+                 '__interval', '__polls', ]
+
+    def __init__(self, service):
+        """
+        :param service: :class:`DataGatorService` sending the polls.
+        """
+        super(TaskWatcher, self).__init__()
+        self.__service = service
+        self.__lock = threading.Lock()
+        self.__wakeup = threading.Condition(self.__lock)
+        self.__pending = {}
+        self.__thread = None
+        self.__interval = self.MIN_INTERVAL
+        self.__polls = 0
+        pass
+
+    @property
+    def polls(self):
+        """
+        number of API calls sent for polling so far
+        """
+        return self.__polls
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__pending)
+
+    def watch(self, url, repo=None, timeout=None):
+        """
+        :param url: URL of the ``Task`` (i.e. the ``Location`` header of a
+            202 response).
+        :param repo: name of the ``Repo`` the task operates on, enables
+            batch polling through the task listing endpoint.
+        :param timeout: maximum seconds to watch the task, defaults to
+            ``None`` (forever).
+        :returns: ``Future`` of the completed ``Task`` object, whose
+            ``status`` is either ``SUC`` or ``ERR``.
+        """
+        task_id = to_unicode(url).rstrip("/").rpartition("/")[-1]
+        with self.__lock:
+            if task_id not in self.__pending:
+                self.__pending[task_id] = _Pending(url, repo, timeout)
+            # poll new tasks soon, regardless of earlier backoff
+            self.__interval = self.MIN_INTERVAL
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self._run)
+                self.__thread.daemon = True
+                self.__thread.start()
+            else:
+                self.__wakeup.notify()
+            return self.__pending[task_id].future
+
+    def _run(self):
+        while True:
+            with self.__lock:
+                if not self.__pending:
+                    self.__thread = None
+                    return
+                self.__wakeup.wait(self.__interval)
+                pending = dict(self.__pending)
+            completed, failed = self._poll(pending)
+            now = time.time()
+            with self.__lock:
+                for task_id, p in pending.items():
+                    if task_id in completed:
+                        p.future.set_result(completed[task_id])
+                    elif task_id in failed:
+                        p.future.set_exception(failed[task_id])
+                    elif p.deadline is not None and now > p.deadline:
+                        p.future.set_exception(RuntimeError(
+                            "timeout watching task '{0}'".format(task_id)))
+                    else:
+                        continue
+                    del self.__pending[task_id]
+                if completed:
+                    self.__interval = self.MIN_INTERVAL
+                else:
+                    self.__interval = min(
+                        self.__interval * 2, self.MAX_INTERVAL)
+        pass
+
+    def _get(self, path):
+        self.__polls += 1
+        r = self.__service.get(path)
+        if r.status_code != 200:
+            raise RuntimeError("unexpected response from backend service")
+        return r.json()
+
+    def _poll(self, pending):
+        # `dict` of completed tasks out of the pending ones, and `dict` of
+        # exceptions of the tasks failed to be polled (each of which only
+        # fails the future of its own task)
+        completed = {}
+        failed = {}
+        found = set()
+        batches = {}
+        for task_id, p in pending.items():
+            batches.setdefault(p.repo, []).append(task_id)
+        for repo, ids in batches.items():
+            if repo is None or len(ids) == 1:
+                continue
+            try:
+                self._list(repo, ids, pending, completed, found)
+            except Exception as e:
+                # tasks not found so far are polled one at a time
+                _log.warning("failed to list tasks of '{0}': {1}".format(
+                    repo, e))
+        # tasks not covered by a listing are polled one at a time
+        for task_id, p in pending.items():
+            if task_id in found:
+                continue
+            try:
+                task = self._get(p.url)
+                if task.get("kind") != "datagator#Task":
+                    raise RuntimeError("invalid response from backend service")
+            except Exception as e:
+                _log.warning("failed to poll task '{0}': {1}".format(
+                    task_id, e))
+                failed[task_id] = e
+                continue
+            if task.get("status") in self.COMPLETED:
+                completed[task_id] = task
+        return completed, failed
+
+    def _list(self, repo, ids, pending, completed, found):
+        # walk through the pages of the task listing of `repo` (from the most
+        # recent) until all of `ids` are found, or the listing is exhausted;
+        # the pending tasks are expected in the first few pages
+        start = 0
+        while len(found.intersection(ids)) < len(ids):
+            page = self._get("task/{0}/{1}".format(repo, start))
+            items = page.get("items", [])
+            for task in items:
+                task_id = task.get("id") if isinstance(task, dict) else None
+                if task_id not in pending:
+                    continue
+                found.add(task_id)
+                if task.get("status") in self.COMPLETED:
+                    completed[task_id] = task
+            start = page.get("startIndex", start) + len(items)
+            if not items or start >= page.get("itemsCount", start):
+                break
+        pass
+
+    pass
@@ -12,14 +12,28 @@
 
 from __future__ import unicode_literals, with_statement
 
-from ._compat import OrderedDict, with_metaclass, to_native, to_unicode
-from ._entity import Entity, normalized
+import contextlib
+import hashlib
+import itertools
+import json
+import logging
+
+from ._compat import OrderedDict, with_metaclass
+from ._compat import to_bytes, to_native, to_unicode
+from ._cache import is_immutable
+from ._dgml import Bakery, resolve
+from ._entity import Entity, normalized, validated
+from ._matrix import ColumnarMatrix, RowIndex, SparseMatrix, transpose
+from ._stream import ObjectReader
 
 
 __all__ = ['Matrix', 'Recipe', ]
 __all__ = [to_native(n) for n in __all__]
 
 
+_log = logging.getLogger(__name__)
+
+
 class DataItem(Entity):
 
     @staticmethod
@@ -79,11 +93,242 @@ class DataItem(Entity):
 
 class Matrix(DataItem):
 
+    # size of chunks read from a streamed response body
+    STREAM_CHUNK_SIZE = 2 ** 16  # 64KB
+
+    # counters of the matrix layout, see `docs/model.rst`
+    LAYOUT = ("columnHeaders", "rowHeaders", "rowsCount", "columnsCount", )
+
+    __slots__ = ['__layout', '__columns', '__indexes', ]
+
+    def __init__(self, kind, dataset, key):
+        super(Matrix, self).__init__(kind, dataset, key)
+        self.__layout = None
+        self.__columns = {}
+        self.__indexes = {}
+        pass
+
+    @contextlib.contextmanager
+    def _reader(self):
+        # stream the content from the backend service without spooling the
+        # response body, and close the connection once the reader is done
+        r = Entity.service.get(self.uri, stream=True)
+        try:
+            if r.status_code != 200:
+                # raises with the error message from the backend service
+                with validated(r):
+                    pass
+            if r.headers.get("Content-Type") != "application/json":
+                raise RuntimeError("invalid response from backend service")
+            kind = normalized(r.headers.get("X-DataGator-Entity", None))
+            assert(kind == self.kind), \
+                "unexpected entity kind '{0}'".format(kind)
+            _log.debug("streaming '{0}'".format(self.uri))
+            yield ObjectReader(r.iter_content(
+                chunk_size=self.STREAM_CHUNK_SIZE, decode_unicode=False))
+        finally:
+            r.close()
+        pass
+
+    def _update_layout(self, data):
+        if all([k in data for k in self.LAYOUT]):
+            self.__layout = dict([(k, data[k]) for k in self.LAYOUT])
+        pass
+
+    @property
+    def layout(self):
+        """
+        ``dict`` of ``columnHeaders``, ``rowHeaders``, ``rowsCount`` and
+        ``columnsCount`` of the matrix
+        """
+        if self.__layout is None:
+            if Entity.store.exists(self.uri):
+                self._update_layout(self.cache)
+            else:
+                # counters may come after `rows` in the response body, then
+                # the rows have to be scanned (but not retained) to reach them
+                with self._reader() as reader:
+                    for row in reader:
+                        self._update_layout(reader.members)
+                        if self.__layout is not None:
+                            break
+                    else:
+                        self._update_layout(reader.members)
+            if self.__layout is None:
+                raise RuntimeError("invalid response from backend service")
+        return self.__layout
+
+    def iter_rows(self):
+        """
+        Iterate over ``rows`` of the matrix (including the column headers)
+
+        Cached content is reused if available. Otherwise, the rows are decoded
+        from the response body one at a time, so that memory usage does not
+        grow with the size of the matrix. The connection is closed as soon as
+        the iteration stops.
+        """
+        if Entity.store.exists(self.uri):
+            for row in self.cache.get("rows", []):
+                yield row
+            return
+        with self._reader() as reader:
+            for row in reader:
+                yield row
+            self._update_layout(reader.members)
+        pass
+
+    @property
+    def column_headers(self):
+        """
+        ``list`` of the leading ``columnHeaders`` rows
+        """
+        rows = self.iter_rows()
+        try:
+            return list(itertools.islice(rows, self.layout['columnHeaders']))
+        finally:
+            rows.close()
+        pass
+
+    @property
+    def row_headers(self):
+        """
+        ``list`` of the leading ``rowHeaders`` cells from each row
+        """
+        n = self.layout['rowHeaders']
+        return [row[:n] for row in self.iter_rows()]
+
+    def to_columnar(self):
+        """
+        Load the matrix into a compact :class:`ColumnarMatrix`, where the
+        columns of the body are stored as typed arrays.
+        """
+        # the layout becomes available once all rows are read
+        columns = transpose(self.iter_rows())
+        layout = self.layout
+        return ColumnarMatrix(
+            columns, layout['columnHeaders'], layout['rowHeaders'])
+
+    def to_sparse(self):
+        """
+        Load the matrix into a run-length encoded :class:`SparseMatrix`.
+
+        The encoded runs of a revision-pinned matrix are cached separately
+        (under ``<uri>#sparse``), so that the next call reads neither the
+        full content from the cache nor the backend service.
+        """
+        key = "{0}#sparse".format(self.uri)
+        if is_immutable(self.uri):
+            data = Entity.store.get(key, None)
+            if data is not None:
+                return SparseMatrix.from_json(data)
+        runs, shape = SparseMatrix.encode(self.iter_rows())
+        layout = self.layout
+        m = SparseMatrix(
+            runs, shape, layout['columnHeaders'], layout['rowHeaders'])
+        if is_immutable(self.uri):
+            Entity.store.put(key, m.to_json())
+        return m
+
+    def _resolve_column(self, column):
+        # column offset from a column header, e.g. "Country"
+        for row in self.column_headers:
+            if column in row:
+                return row.index(column)
+        if isinstance(column, int) and not isinstance(column, bool):
+            return column
+        raise KeyError("invalid column '{0}'".format(column))
+
+    def index_by(self, column):
+        """
+        Hash index from the values of row header(s) to row offsets, i.e. the
+        DGML statement ``index M by "Country"``.
+
+        The index is memoized by the matrix, and cached under
+        ``<uri>#index/<columns>`` if the matrix is revision-pinned.
+
+        :param column: column header (or offset) of the indexed column, or a
+            ``tuple`` of them for multi-column row headers.
+        :returns: :class:`RowIndex` of the body rows.
+        """
+        # resolving column headers reads the leading rows, which is done
+        # once for each (distinct) argument
+        columns = self.__columns.get(column, None)
+        if columns is None:
+            columns = tuple([self._resolve_column(c) for c in (
+                column if isinstance(column, tuple) else (column, ))])
+            self.__columns[column] = columns
+        index = self.__indexes.get(columns, None)
+        if index is not None:
+            return index
+        key = "{0}#index/{1}".format(
+            self.uri, ",".join(["{0}".format(c) for c in columns]))
+        data = Entity.store.get(key, None) if is_immutable(self.uri) \
+            else None
+        if data is not None:
+            index = RowIndex.from_json(data)
+        else:
+            index = RowIndex.from_rows(
+                self.iter_rows(), columns, self.layout['columnHeaders'])
+            if is_immutable(self.uri):
+                Entity.store.put(key, index.to_json())
+        self.__indexes[columns] = index
+        return index
+
     pass
 
 
 class Recipe(DataItem):
 
+    @property
+    def _fingerprint_key(self):
+        # not pinned to the revision of the data set, which changes with
+        # every bake; recorded in `Entity.records` (rather than the cache),
+        # so that it outlives the process baking the recipe
+        return Entity.record_key("{0}/{1}/{2}#fingerprint".format(
+            self.dataset.repo.uri, self.dataset.name, self.key))
+
+    def fingerprint(self, heads=None):
+        """
+        Digest of the recipe and the concrete revisions of its inputs
+
+        :param heads: ``dict`` memoizing ``HEAD`` revisions, see
+            :func:`resolve`.
+        :returns: SHA-256 hex digest.
+        """
+        data = json.dumps([self.cache, resolve(self.cache, heads)],
+                          sort_keys=True, ensure_ascii=True)
+        return hashlib.sha256(to_bytes(data)).hexdigest()
+
+    def is_stale(self, heads=None):
+        """
+        :param heads: ``dict`` memoizing ``HEAD`` revisions, see
+            :func:`resolve`.
+        :returns: ``True`` if the recipe (or any of its inputs) has changed
+            since the last successful :meth:`bake_local` from this client.
+        """
+        baked = Entity.records.get(self._fingerprint_key, None) or {}
+        return baked.get("fingerprint") != self.fingerprint(heads)
+
+    def bake_local(self, dgml=None):
+        """
+        Bake the recipe on the client side, without submitting a ``Task`` to
+        the backend service
+
+        Baking the stored recipe records its fingerprint (under
+        ``DATAGATOR_HOME``), against which :meth:`is_stale` is checked.
+
+        :param dgml: DGML source to be baked in place of the stored recipe
+            (i.e. a draft under development).
+        :returns: JSON-encoded ``Matrix`` produced by the recipe.
+        :raises ValueError: on malformed recipes or cyclic node references.
+        """
+        if dgml is not None:
+            return Bakery(dgml).bake()
+        fingerprint = self.fingerprint()
+        data = Bakery(self.cache).bake()
+        Entity.records.put(self._fingerprint_key, {"fingerprint": fingerprint})
+        return data
+
     pass
 
 
@@ -22,6 +22,7 @@ class EnvironModule(types.ModuleType):
 
     __all__ = [to_native(n) for n in [
         'DATAGATOR_API_ACCEPT_ENCODING',
+        'DATAGATOR_API_GZIP',
         'DATAGATOR_API_FOLLOW_REDIRECT',
         'DATAGATOR_API_TIMEOUT',
         'DATAGATOR_API_HOST',
@@ -32,12 +33,20 @@ class EnvironModule(types.ModuleType):
         'DATAGATOR_API_USER_AGENT',
         'DATAGATOR_HOME',
         'DATAGATOR_CACHE_BACKEND',
+        'DATAGATOR_CACHE_CODEC',
+        'DATAGATOR_CACHE_MAX_BYTES',
+        'DATAGATOR_CACHE_MEMORY_BYTES',
+        'DATAGATOR_CACHE_PERSISTENT',
+        'DATAGATOR_CACHE_SNAPSHOT',
+        'DATAGATOR_CACHE_TTL',
+        'DATAGATOR_RATE_LIMITER',
         'DEBUG', ]]
 
     # version tuple of the pythonic HTTP client library
     __client_version__ = (0, 1, 7)
 
     __slots__ = ["DATAGATOR_API_ACCEPT_ENCODING",
+                 "DATAGATOR_API_GZIP",
                  "DATAGATOR_API_FOLLOW_REDIRECT",
                  "DATAGATOR_API_HOST",
                  "DATAGATOR_API_ROOT",
@@ -45,6 +54,13 @@ class EnvironModule(types.ModuleType):
                  "DATAGATOR_API_VERSION",
                  "DATAGATOR_HOME",
                  "DATAGATOR_CACHE_BACKEND",
+                 "DATAGATOR_CACHE_CODEC",
+                 "DATAGATOR_CACHE_MAX_BYTES",
+                 "DATAGATOR_CACHE_MEMORY_BYTES",
+                 "DATAGATOR_CACHE_PERSISTENT",
+                 "DATAGATOR_CACHE_SNAPSHOT",
+                 "DATAGATOR_CACHE_TTL",
+                 "DATAGATOR_RATE_LIMITER",
                  "DEBUG", ]
 
     def __init__(self, name, docs):
@@ -61,6 +77,9 @@ class EnvironModule(types.ModuleType):
         # API version (reserved for future extension)
         self.DATAGATOR_API_VERSION = os.environ.get(
             "DATAGATOR_API_VERSION", "v2")
+        # send gzip-compressed request bodies (i.e. uploaded data)
+        self.DATAGATOR_API_GZIP = bool(int(os.environ.get(
+            "DATAGATOR_API_GZIP", 0)))
         #
         self.DATAGATOR_HOME = os.environ.get(
             "DATAGATOR_HOME",
@@ -69,6 +88,30 @@ class EnvironModule(types.ModuleType):
         self.DATAGATOR_CACHE_BACKEND = os.environ.get(
             "DATAGATOR_CACHE_BACKEND",
             "datagator.api.client._cache.leveldb.LevelDbCache")
+        # compression codec of cached entities (``identity`` to disable)
+        self.DATAGATOR_CACHE_CODEC = os.environ.get(
+            "DATAGATOR_CACHE_CODEC", "zlib")
+        # keep cached entities under ``DATAGATOR_HOME`` across runs
+        self.DATAGATOR_CACHE_PERSISTENT = bool(int(os.environ.get(
+            "DATAGATOR_CACHE_PERSISTENT", 0)))
+        # seconds before cached HEAD revisions need to be revalidated
+        self.DATAGATOR_CACHE_TTL = int(os.environ.get(
+            "DATAGATOR_CACHE_TTL", 3600))
+        # size limit of the cache manager backend (1GB)
+        self.DATAGATOR_CACHE_MAX_BYTES = int(os.environ.get(
+            "DATAGATOR_CACHE_MAX_BYTES", 2 ** 30))
+        # budget of decoded entities kept in memory (64MB), ``0`` to disable
+        self.DATAGATOR_CACHE_MEMORY_BYTES = int(os.environ.get(
+            "DATAGATOR_CACHE_MEMORY_BYTES", 2 ** 26))
+        # keep snapshots of decoded entities beside the JSON-encoded ones,
+        # which load faster than parsing JSON in later runs
+        self.DATAGATOR_CACHE_SNAPSHOT = bool(int(os.environ.get(
+            "DATAGATOR_CACHE_SNAPSHOT", 0)))
+        # client-side rate limiter (``SharedTokenBucket`` to share the quota
+        # among multiple processes through a file under ``DATAGATOR_HOME``)
+        self.DATAGATOR_RATE_LIMITER = os.environ.get(
+            "DATAGATOR_RATE_LIMITER",
+            "datagator.api.client._backend.ratelimit.TokenBucket")
         # debugging mode (``NDEBUG=1`` takes precedence over ``DEBUG=1``)
         self.DEBUG = int(os.environ.get("DEBUG", 0)) and \
             not int(os.environ.get("NDEBUG", 0))
@@ -13,18 +13,29 @@
 from __future__ import unicode_literals, with_statement
 
 import fcntl
+import hashlib
 import io
 import json
 import jsonschema
 import logging
 import tempfile
+import threading
+import time
+import types
 
 from . import environ
-from ._compat import to_native, to_unicode, to_bytes, _thread
+from ._compat import OrderedDict, to_native, to_unicode, to_bytes, _thread
 from ._entity import Entity, validated
+from ._stream import MatrixWriter
 
 from .data import DataItem
 
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    raise ImportError("""Could not load `futures` dependency.
+        See https://pypi.python.org/pypi/futures""")
+
 
 __all__ = ['DataSet', 'Repo', ]
 __all__ = [to_native(n) for n in __all__]
@@ -39,29 +50,189 @@ _log = logging.getLogger(__name__)
 
 
 class ChangeSet(object):
+    """
+    Buffered writer of (consecutive) revisions of a ``DataSet``
+
+    Entries are serialized into a spooled payload, which is committed once
+    it reaches the size committed in about :attr:`TARGET_COMMIT_SECONDS` at
+    the throughput of earlier commits, between the bounds passed to the
+    constructor (:attr:`MIN_PAYLOAD_BYTES` and :attr:`MAX_PAYLOAD_BYTES` by
+    default). Payloads are uploaded in order by a
+    background thread while the next one is being written, with up to
+    :attr:`MAX_PENDING_PAYLOADS` of them queued (or in flight) before the
+    writer blocks. A failed upload aborts the ones queued after it, and is
+    re-raised to the writer by the next write or commit.
+
+    Values identical to the ones last committed (from this client) are
+    dropped from the payload, as long as the HEAD revision of the data set
+    is still the one holding them, see :attr:`SKIP_UNCHANGED`.
+    """
+
+    class Stats(object):
+        """
+        Counts of items (and bytes of their serialized entries) sent to, or
+        skipped as unchanged from, the backend service, along with the size
+        threshold of payloads, and the timings of their commits
+        """
 
-    MAX_PAYLOAD_BYTES = 2 ** 24  # 16 MB
-    MAX_BUFFER_BYTES = 2 ** 21   # 2 MB
+        __slots__ = ['items_sent', 'items_skipped', 'bytes_sent',
+                     'bytes_skipped', 'payload_bytes', 'commits', ]
+
+        def __init__(self, payload_bytes):
+            self.items_sent = 0
+            self.items_skipped = 0
+            self.bytes_sent = 0
+            self.bytes_skipped = 0
+            # current threshold of committing a payload
+            self.payload_bytes = payload_bytes
+            # `(<entries count>, <payload bytes>, <seconds>)` of each commit
+            self.commits = []
+            pass
 
-    __slots__ = ['__uri', '__lock', '__tmp', '__cnt', ]
+        pass
 
-    def __init__(self, dataset):
+    # defaults of the size limits, see :meth:`__init__`
+    MIN_PAYLOAD_BYTES = 2 ** 20  # 1 MB
+    MAX_PAYLOAD_BYTES = 2 ** 24  # 16 MB
+    MAX_BUFFER_BYTES = 2 ** 21   # 2 MB
+    MAX_PENDING_PAYLOADS = 2
+
+    # payloads are sized to be committed in a fraction of the timeout of
+    # HTTP connections, starting from `INITIAL_PAYLOAD_BYTES`; the chosen
+    # size is carried over to later change sets (of the same process), thus
+    # guarded by a lock shared among their upload threads
+    TARGET_COMMIT_SECONDS = environ.DATAGATOR_API_TIMEOUT / 6.0
+    INITIAL_PAYLOAD_BYTES = 2 ** 22  # 4 MB
+    _payload_bytes = None
+    _payload_lock = _thread.allocate_lock()
+
+    # the backend service ignores trivial updates anyway, so an item whose
+    # serialized value has the same digest as the one recorded (in durable
+    # `Entity.records`) after its last successful commit is not sent at all,
+    # unless the HEAD revision of the data set has moved on since then
+    SKIP_UNCHANGED = True
+
+    __slots__ = ['__uri', '__repo', '__head', '__head_ref', '__head_rev',
+                 '__lock', '__tmp', '__cnt', '__tasks', '__executor',
+                 '__uploads', '__digests', '__sent', '__stats', '__limits',
+                 '__recorders', '__recorded', '__entered', ]
+
+    def __init__(self, dataset, min_payload_bytes=None,
+                 max_payload_bytes=None, initial_payload_bytes=None,
+                 max_buffer_bytes=None):
+        """
+        :param dataset: ``DataSet`` to be written.
+
+        Optional arguments:
+
+        :param min_payload_bytes: lower bound of the size threshold of
+            payloads, defaults to :attr:`MIN_PAYLOAD_BYTES`.
+        :param max_payload_bytes: upper bound of the size threshold of
+            payloads, defaults to :attr:`MAX_PAYLOAD_BYTES`.
+        :param initial_payload_bytes: size threshold of the first payload,
+            defaults to the one carried over from earlier change sets, or
+            :attr:`INITIAL_PAYLOAD_BYTES`.
+        :param max_buffer_bytes: size of a payload kept in memory before
+            spilling to disk, defaults to :attr:`MAX_BUFFER_BYTES`.
+        """
         if not isinstance(dataset, DataSet):
             raise TypeError("invalid dataset")
         self.__uri = dataset.uri
+        self.__repo = dataset.repo.name
+        # not pinned to the revision of the data set
+        self.__head = "{0}/{1}".format(dataset.repo.uri, dataset.name)
+        self.__head_ref = (dataset.repo, dataset.name)
+        # HEAD revision number prior to the commits of this change set (or
+        # of its current `with` block), which is looked up upon the first
+        # digest to compare with
+        self.__head_rev = -1
+        self.__entered = 0
         super(ChangeSet, self).__init__()
         self.__lock = _thread.allocate_lock()
         self.__tmp = None
         self.__cnt = 0
+        self.__tasks = []
+        self.__executor = None
+        self.__uploads = []
+        self.__digests = {}
+        self.__sent = {}
+        self.__recorders = []
+        self.__recorded = 0
+        self.__limits = (
+            min_payload_bytes or self.MIN_PAYLOAD_BYTES,
+            max_payload_bytes or self.MAX_PAYLOAD_BYTES,
+            max_buffer_bytes or self.MAX_BUFFER_BYTES, )
+        if self.__limits[0] > self.__limits[1]:
+            raise ValueError("invalid bounds of payload size")
+        self.__stats = ChangeSet.Stats(self._clamp(
+            initial_payload_bytes or ChangeSet._payload_bytes or
+            self.INITIAL_PAYLOAD_BYTES))
         self._rewind()
         pass
 
+    @property
+    def tasks(self):
+        """
+        ``list`` of ``Future`` objects of the ``Task`` committing each
+        revision (uploaded so far), see :class:`TaskWatcher`
+        """
+        return self.__tasks
+
+    @property
+    def stats(self):
+        """
+        :class:`ChangeSet.Stats` of the items written so far
+        """
+        return self.__stats
+
     def commit(self):
         """
-        commit all pending revisions to the backend service
+        commit all pending revisions to the backend service, and wait for
+        their uploads to complete; the ``Task`` of each revision goes on in
+        the backend service, see :meth:`wait`
         """
         if len(self) > 0 and self.__tmp is not None:
             self._commit()
+        self._wait()
+        if self.SKIP_UNCHANGED and len(self.__tasks) > self.__recorded:
+            # digests are recorded once the tasks have completed, by a daemon
+            # thread, which never blocks the exit of the interpreter
+            self.__recorded = len(self.__tasks)
+            recorder = threading.Thread(target=self._record, args=(
+                list(self.__tasks), dict(self.__sent)))
+            recorder.daemon = True
+            recorder.start()
+            self.__recorders.append(recorder)
+        if self.__stats.items_skipped > 0:
+            _log.info("skipped {0} unchanged items ({1} bytes)".format(
+                self.__stats.items_skipped, self.__stats.bytes_skipped))
+        pass
+
+    def stale_recipes(self, timeout=None):
+        """
+        Wait for the committed revisions, and find out the recipes to be
+        baked again in the repo
+
+        :param timeout: maximum seconds to wait for each ``Task``.
+        :returns: ``list`` of stale ``Recipe`` items, see
+            :meth:`Repo.stale_recipes`.
+        """
+        self.wait(timeout)
+        return Repo(self.__repo).stale_recipes()
+
+    def wait(self, timeout=None):
+        """
+        Block until the committed revisions are uploaded, their ``Task``
+        objects have completed, and the digests of committed values are
+        recorded (see :attr:`SKIP_UNCHANGED`), e.g. before a script exits
+
+        :param timeout: maximum seconds to wait for each ``Task``.
+        """
+        self._wait()
+        for future in self.__tasks:
+            future.result(timeout)
+        for recorder in self.__recorders:
+            recorder.join(timeout)
         pass
 
     def _rewind(self):
@@ -79,9 +250,10 @@ class ChangeSet(object):
 
         _log.debug("creating new revision for '{0}'".format(self.__uri))
         self.__tmp = tempfile.SpooledTemporaryFile(
-            max_size=ChangeSet.MAX_BUFFER_BYTES, suffix=".DataGatorCache")
+            max_size=self.__limits[2], suffix=".DataGatorCache")
         fcntl.lockf(self.__tmp, fcntl.LOCK_EX | fcntl.LOCK_NB)
         self.__cnt = 0
+        self.__digests = {}
         self.__tmp.write(to_bytes("{"))
 
         pass
@@ -97,50 +269,204 @@ class ChangeSet(object):
         elif self.__tmp is None:
             raise AssertionError("cannot commit an uninitialized revision")
 
+        # backpressure, keep a slot for the payload to be queued
+        self._wait(self.MAX_PENDING_PAYLOADS - 1)
+
         self.__tmp.write(to_bytes("}"))
         self.__tmp.flush()
         self.__tmp.seek(0, SEEK_END)
+        size = self.__tmp.tell()
 
         _log.debug("committing revision")
         _log.debug("  - entries count: {0}".format(len(self)))
-        _log.debug("  - payload size: {0}".format(self.__tmp.tell()))
+        _log.debug("  - payload size: {0}".format(size))
+
+        if self.__executor is None:
+            # a single worker uploads the payloads in the order of commits
+            self.__executor = ThreadPoolExecutor(1)
+        previous = self.__uploads[-1][0] if self.__uploads else None
+        self.__uploads.append((self.__executor.submit(
+            self._upload, self.__tmp, self.__digests, len(self), size,
+            previous), self.__digests))
+
+        # prepare for consecutive revisions, the payload is now owned (and
+        # closed) by the upload
+        self.__tmp = None
+        self.__cnt = 0
+        self.__lock.release()
+        self._rewind()
+
+        pass
+
+    def _upload(self, f, digests, count, size, previous):
 
         try:
-            self.__tmp.seek(0, SEEK_SET)
+            if previous is not None and previous.exception() is not None:
+                raise RuntimeError("revision aborted by a failed commit")
+            f.seek(0, SEEK_SET)
             endpoint = "{0}/data/".format(self.__uri)
+            t0 = time.time()
             with validated(Entity.service.patch(
-                    endpoint, data=self.__tmp), (202, )) as r:
-                # TODO watch task for completion
-                pass
+                    endpoint, data=f), (202, )) as r:
+                self.__tasks.append(Entity.watcher.watch(
+                    r.headers['Location'], self.__repo))
+            elapsed = time.time() - t0
         except Exception as e:
             _log.error(e)
             raise
-        else:
-            # prepare for consecutive revisions
-            fcntl.lockf(self.__tmp, fcntl.LOCK_UN)
-            self.__tmp.close()
-            self.__tmp = None
-            self.__cnt = 0
-            self.__lock.release()
-            self._rewind()
+        finally:
+            fcntl.lockf(f, fcntl.LOCK_UN)
+            f.close()
+
+        with ChangeSet._payload_lock:
+            self.__stats.commits.append((count, size, elapsed))
+            self._adapt(size, elapsed)
+
+        pass
 
+    def _clamp(self, size):
+        return int(min(max(size, self.__limits[0]), self.__limits[1]))
+
+    def _adapt(self, size, elapsed):
+        # scale the threshold to the size committed in `TARGET_COMMIT_SECONDS`
+        # at the throughput of the last commit, which includes the response
+        # time of the backend service; it is at most doubled (or halved) at a
+        # time, and never shrinks after a commit completing in time (i.e. a
+        # small payload, whose throughput is dominated by the response time);
+        # called with `_payload_lock` held
+        threshold = self.__stats.payload_bytes
+        estimate = size * self.TARGET_COMMIT_SECONDS / max(elapsed, 1e-3)
+        estimate = min(max(estimate, threshold / 2.0), threshold * 2.0)
+        if elapsed <= self.TARGET_COMMIT_SECONDS:
+            estimate = max(estimate, threshold)
+        threshold = self._clamp(estimate)
+        if threshold != self.__stats.payload_bytes:
+            _log.debug("payload size threshold: {0}".format(threshold))
+        self.__stats.payload_bytes = ChangeSet._payload_bytes = threshold
         pass
 
+    def _wait(self, limit=0):
+        # collect finished uploads in the order of commits, and block until
+        # no more than `limit` are left in flight; the earliest failure is
+        # re-raised (and the uploads aborted by it are dropped)
+        while self.__uploads:
+            future, digests = self.__uploads[0]
+            if len(self.__uploads) <= limit and not future.done():
+                break
+            try:
+                future.result()
+            except Exception:
+                # values of the failed upload (and of the ones aborted by it)
+                # have not reached the backend service
+                for future, digests in self.__uploads:
+                    for key, digest in digests.items():
+                        if self.__sent.get(key) == digest:
+                            del self.__sent[key]
+                del self.__uploads[:]
+                raise
+            self.__uploads.pop(0)
+        if limit == 0 and self.__executor is not None:
+            self.__executor.shutdown(wait=False)
+            self.__executor = None
+        pass
+
+    def _record(self, tasks, digests):
+        # record the digests of committed values, along with the HEAD
+        # revision holding them, once all the tasks have succeeded
+        try:
+            for future in tasks:
+                if future.result().get("status") != "SUC":
+                    return
+            rev = self._head_rev()
+            if rev is None:
+                return
+            Entity.records.put_many(dict([
+                (self._digest_key(key), {"digest": digest, "rev": rev})
+                for key, digest in digests.items()]))
+        except Exception as e:
+            _log.warning("failed to record committed values: {0}".format(e))
+        pass
+
+    def _head_rev(self):
+        # revision number of the HEAD content of the data set (`None` if it
+        # does not exist), revalidated against the backend service
+        repo, name = self.__head_ref
+        try:
+            return DataSet(repo, name, -1).rev
+        except RuntimeError:
+            return None
+
+    def _digest_key(self, key):
+        return Entity.record_key("{0}/{1}#digest".format(self.__head, key))
+
+    def _unchanged(self, key, digest):
+        if not self.SKIP_UNCHANGED:
+            return False
+        # values sent by this change set are compared with the latest one,
+        # whose commit may be in progress
+        if key in self.__sent:
+            return self.__sent[key] == digest
+        record = Entity.records.get(self._digest_key(key), None) or {}
+        if record.get("digest") != digest:
+            return False
+        # the recorded value (or deletion) holds as long as no revision has
+        # been committed since; the HEAD revision is looked up only once,
+        # and after commits of this change set (or `with` block), recorded
+        # values (of earlier ones) are not taken as unchanged
+        if self.__head_rev == -1:
+            self.__head_rev = self._head_rev() if not self.__uploads and \
+                len(self.__tasks) == self.__entered else None
+        return self.__head_rev is not None and \
+            record.get("rev") == self.__head_rev
+
     def __setitem__(self, key, value):
+        # surface failed uploads of earlier revisions early
+        self._wait(self.MAX_PENDING_PAYLOADS)
         _log.debug("appending to revision")
-        key = json.dumps(key)
-        value = value.read() if hasattr(value, "read") else json.dumps(value)
+        name, key = key, json.dumps(key)
         _log.debug("  - key: {0}".format(key))
-        _log.debug("  - size: {0}".format(len(value)))
-        # write serialized value to temporary file
+        # a generator of rows is serialized as a `Matrix` incrementally
+        if isinstance(value, types.GeneratorType):
+            value = MatrixWriter(value)
+        elif hasattr(value, "read"):
+            value = [value.read()]
+        elif not isinstance(value, MatrixWriter):
+            value = [json.dumps(value)]
+        # write serialized value to temporary file, and hash it on the fly
         f = self.__tmp
-        if len(self):
-            f.write(to_bytes(", "))
-        f.write(to_bytes(key))
-        f.write(to_bytes(": "))
-        f.write(to_bytes(value))
+        start = f.tell()
+        h = hashlib.sha256()
+        try:
+            if len(self):
+                f.write(to_bytes(", "))
+            f.write(to_bytes(key))
+            f.write(to_bytes(": "))
+            for chunk in value:
+                chunk = to_bytes(chunk)
+                h.update(chunk)
+                f.write(chunk)
+        except Exception:
+            # discard the partially serialized value (i.e. malformed rows)
+            f.seek(start, SEEK_SET)
+            f.truncate()
+            raise
+        size = f.tell() - start
+        _log.debug("  - size: {0}".format(size))
+        digest = h.hexdigest()
+        if self._unchanged(name, digest):
+            _log.debug("  - unchanged, skipped")
+            f.seek(start, SEEK_SET)
+            f.truncate()
+            # which still holds after the commits of this change set
+            self.__sent[name] = digest
+            self.__stats.items_skipped += 1
+            self.__stats.bytes_skipped += size
+            return
+        self.__digests[name] = self.__sent[name] = digest
+        self.__stats.items_sent += 1
+        self.__stats.bytes_sent += size
         self.__cnt += 1
-        if f.tell() < ChangeSet.MAX_PAYLOAD_BYTES:
+        if f.tell() < self.__stats.payload_bytes:
             return
         self._commit()
 
@@ -148,6 +474,12 @@ class ChangeSet(object):
         return self.__cnt
 
     def __enter__(self):
+        # values sent by earlier `with` blocks (of a reused change set) may
+        # have been changed by other clients since then, so they are checked
+        # against the records and the HEAD revision again
+        self.__sent = {}
+        self.__head_rev = -1
+        self.__entered = len(self.__tasks)
         self._rewind()
         return self
 
@@ -155,14 +487,14 @@ class ChangeSet(object):
         if isinstance(exc_value, Exception):
             pass
         else:
-            self._commit()
+            self.commit()
         return False  # re-raise exception
 
     def __del__(self):
         try:
             if len(self) > 0:
                 _log.warning("pending revision left until garbage collection")
-                self._commit()
+                self.commit()
         except:
             _log.error("failed to commit pending revisions")
             raise
@@ -228,11 +560,15 @@ class DataSet(Entity):
         # when `rev` is not `None`, the dataset is SHOULD exist in the backend
         # service (i.e. we are pulling remote data for use).
         else:
-            # when `rev` is -1, we always invalidate the cached dataset, and
-            # pull the remote revision from the backend service.
+            # when `rev` is -1, we always revalidate the cached dataset against
+            # the remote revision from the backend service.
             if rev == -1:
-                del self.cache
-            remote_rev = self.cache.get("rev", None)
+                content = self._cache_revalidate()
+                if self.__rev is None:
+                    self._synchronize(content)
+            else:
+                content = self.cache
+            remote_rev = content.get("rev", None)
             assert(rev == remote_rev or rev == -1), \
                 "inconsistent revision '{0}' != '{1}'".format(remote_rev, rev)
             # when invoking `self.cache`, `self.rev` is already synchronized,
@@ -268,12 +604,21 @@ class DataSet(Entity):
     def rev(self):
         return self.__rev
 
+    def _synchronize(self, content):
+        # synchronize with the remote revision of the HEAD content
+        self.__rev = content.get("rev", None)
+        # the same content also belongs to the (immutable) revision-pinned
+        # entry, which saves another round trip for `self.cache`
+        if self.__rev is not None and not Entity.store.exists(self.uri):
+            Entity.store.put(self.uri, content)
+        pass
+
     @property
     def cache(self):
         content = super(DataSet, self)._cache_getter()
         # synchronize with the remote revision upon cache overwrite
         if self.__rev is None:
-            self.__rev = content.get("rev", None)
+            self._synchronize(content)
         return content
 
     @cache.deleter
@@ -332,10 +677,37 @@ class DataSet(Entity):
     def __len__(self):
         return len(self.items_dict)
 
+    def prefetch(self, keys=None, max_workers=None):
+        """
+        Load the content of data items into the cache concurrently
+
+        :param keys: keys of the data items, defaults to all items.
+        :param max_workers: maximum number of requests in flight, see
+            :meth:`DataGatorService.get_many`.
+        :returns: ``list`` of keys fetched from the backend service, i.e.
+            excluding the items already cached.
+        """
+        items = OrderedDict()
+        for key in (list(self) if keys is None else keys):
+            item = self[key]
+            if not Entity.store.exists(item.uri):
+                items[item.uri] = item
+
+        def store(uri, r):
+            with validated(r) as v:
+                items[uri]._cache_store(v)
+            return items[uri].key
+
+        return Entity.service.get_many(
+            list(items), callback=store,
+            max_workers=max_workers or Entity.service.MAX_WORKERS)
+
     def patch(self, changes):
         """
         :param items: `dict` or sequence of key-value pairs, representing
-            create / update / delete operations to be committed.
+            create / update / delete operations to be committed; values of
+            ``Matrix`` items may be :class:`MatrixWriter` objects (or
+            generators of rows), which are serialized incrementally.
         """
         if not isinstance(changes, dict):
             changes = dict(changes)
@@ -447,4 +819,20 @@ class Repo(Entity):
     def __len__(self):
         return self.cache.get("itemsCount", 0)
 
+    def stale_recipes(self):
+        """
+        :returns: ``list`` of ``Recipe`` items in the repo that have changed
+            (or whose inputs have changed) since their last successful bake
+            from this client, see :meth:`Recipe.is_stale`.
+        """
+        heads = {}
+        stale = []
+        for dsname in self:
+            ds = self[dsname]
+            for key in sorted(ds.items_dict):
+                item = ds[key]
+                if item.kind == "Recipe" and item.is_stale(heads):
+                    stale.append(item)
+        return stale
+
     pass
@@ -63,7 +63,8 @@ pkg = __import__('datagator.api.client', fromlist=["datagator.api"])
 
 setup(
     name=PACKAGE,
-    packages=["datagator.api.client", "datagator.api.client._backend"],
+    packages=["datagator.api.client", "datagator.api.client._backend",
+              "datagator.api.client._cache", ],
     package_dir={
         "datagator": join(".", "datagator", ),
         "datagator.api": join(".", "datagator", "api"),
@@ -96,6 +97,6 @@ setup(
     keywords=["DataGator", "client", "data science", "HTTP", "Pardee"],
     platforms="All",
     provides=["datagator.api.client", ],
-    requires=["ordereddict", "requests", "jsonschema", "leveldb", ],
+    requires=["ordereddict", "futures", "requests", "jsonschema", "leveldb", ],
     url="https://github.com/DataGator/",
 )
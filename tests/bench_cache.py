@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    tests.bench_cache
+    ~~~~~~~~~~~~~~~~~
+
+    Benchmark of cache manager backends on the JSON fixtures in ``data/json``.
+
+    .. code-block:: bash
+
+        $ python -m tests.bench_cache
+
+    :copyright: 2015 by `University of Denver <http://pardee.du.edu/>`_
+    :license: Apache 2.0, see LICENSE for more details.
+
+    :author: `LIU Yu <liuyu@opencps.net>`_
+    :date: 2015/12/17
+"""
+
+from __future__ import unicode_literals, print_function
+
+import importlib
+import io
+import os
+import time
+
+try:
+    from . import config
+    from .config import *
+except (ValueError, ImportError):
+    import config
+    from config import *
+
+
+__all__ = ['BACKENDS', 'load_fixtures', 'bench', ]
+__all__ = [to_native(n) for n in __all__]
+
+
+BACKENDS = [
+    "datagator.api.client._cache.leveldb.LevelDbCache",
+    "datagator.api.client._cache.sqlite.SqliteCache",
+    "datagator.api.client._cache.segment.SegmentCache",
+]
+
+
+def load_fixtures():
+    """
+    All JSON fixtures as ``(<key>, <bytes>)`` tuples
+    """
+    root = os.path.join(config.DATA_DIR, "json")
+    fixtures = []
+    for dirname, subdirs, filenames in os.walk(root):
+        for filename in sorted(filenames):
+            if not filename.endswith(".json"):
+                continue
+            path = os.path.join(dirname, filename)
+            key = "repo/Bench/{0}".format(
+                os.path.relpath(path, root)[:-len(".json")].replace(
+                    os.path.sep, "/"))
+            fixtures.append(
+                (key, load_data(os.path.relpath(path, config.DATA_DIR))))
+    return fixtures
+
+
+def get_backend(name):
+    mod, sep, cls = name.rpartition(".")
+    try:
+        return getattr(importlib.import_module(mod), cls)
+    except ImportError:
+        return None
+    pass
+
+
+def timed(func, *args):
+    t0 = time.time()
+    func(*args)
+    return time.time() - t0
+
+
+def bench(backend, fixtures, rounds=10):
+    """
+    Seconds spent by ``backend`` on putting, getting, and probing fixtures
+    """
+    store = backend(persistent=False, max_bytes=None)
+
+    def put_all():
+        for key, value in fixtures:
+            store.put(key, io.BytesIO(value))
+        pass
+
+    def get_all():
+        for i in range(rounds):
+            for key, value in fixtures:
+                store.get(key)
+        pass
+
+    def exists_all():
+        for i in range(rounds):
+            for key, value in fixtures:
+                store.exists(key)
+        pass
+
+    return timed(put_all), timed(get_all), timed(exists_all)
+
+
+if __name__ == '__main__':
+    fixtures = load_fixtures()
+    total = sum([len(value) for key, value in fixtures])
+    print("{0} fixtures, {1} bytes".format(len(fixtures), total))
+    print("{0:<16}{1:>12}{2:>12}{3:>12}".format(
+        "backend", "put (s)", "get (s)", "exists (s)"))
+    for name in BACKENDS:
+        backend = get_backend(name)
+        if backend is None:
+            print("{0:<16}{1:>12}".format(name.rpartition(".")[-1], "N/A"))
+            continue
+        print("{0:<16}{1:>12.4f}{2:>12.4f}{3:>12.4f}".format(
+            backend.__name__, *bench(backend, fixtures)))
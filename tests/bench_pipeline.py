@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    tests.bench_pipeline
+    ~~~~~~~~~~~~~~~~~~~~
+
+    Benchmark of the response-to-cache pipeline on a 1 MB ``Matrix``, i.e.
+    reading the message body, caching it, and decoding it for use.
+
+    .. code-block:: bash
+
+        $ python -m tests.bench_pipeline
+
+    :copyright: 2015 by `University of Denver <http://pardee.du.edu/>`_
+    :license: Apache 2.0, see LICENSE for more details.
+
+    :author: `LIU Yu <liuyu@opencps.net>`_
+    :date: 2015/12/24
+"""
+
+from __future__ import unicode_literals, print_function
+
+import datetime
+import io
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+try:
+    from . import config
+    from .config import *
+except (ValueError, ImportError):
+    import config
+    from config import *
+
+import requests
+import urllib3
+
+from datagator.api.client._cache.memory import TieredCache
+from datagator.api.client._cache.sqlite import SqliteCache
+from datagator.api.client._entity import validated
+
+
+__all__ = ['make_matrix', 'make_response', 'bench', ]
+__all__ = [to_native(n) for n in __all__]
+
+
+def make_matrix(size=2 ** 20):
+    """
+    JSON-encoded ``Matrix`` of (at least) ``size`` bytes
+    """
+    row = ["Country"] + list(range(1816, 2014))
+    rows = [row]
+    body = ["Atlantis"] + [1] * (len(row) - 1)
+    rows.extend([body] * (size // len(json.dumps(body)) + 1))
+    return to_bytes(json.dumps({
+        "kind": "datagator#Matrix",
+        "columnHeaders": 1,
+        "rowHeaders": 1,
+        "rows": rows,
+        "rowsCount": len(rows),
+        "columnsCount": len(row)}))
+
+
+def make_response(body):
+    """
+    Streamed response of ``body`` (without network I/O)
+    """
+    headers = {
+        "Content-Type": "application/json",
+        "Content-Length": "{0}".format(len(body)),
+        "X-DataGator-Entity": "Matrix"}
+    r = requests.Response()
+    r.raw = urllib3.HTTPResponse(
+        body=io.BytesIO(body), headers=headers, preload_content=False,
+        decode_content=False)
+    r.headers = requests.structures.CaseInsensitiveDict(headers)
+    r.status_code = 200
+    r.url = "repo/Bench/Matrix.1/Matrix"
+    r.elapsed = datetime.timedelta(0)
+    return r
+
+
+def spooled(store, key, r, accesses):
+    # the former pipeline: chunks are spooled to a temporary file, which is
+    # read back for caching, and every access decodes the cached bytes
+    f = tempfile.SpooledTemporaryFile(max_size=2 ** 21, mode="w+b")
+    for chunk in r.iter_content(chunk_size=2 ** 21):
+        f.write(chunk)
+    f.seek(0)
+    store.put(key, f)
+    f.seek(0)
+    data = json.load(io.TextIOWrapper(f))
+    for i in range(accesses):
+        data = store.backend.get(key)
+    return data
+
+
+def buffered(store, key, r, accesses):
+    # body read in place, cached as-is, and decoded once
+    with validated(r) as v:
+        data = v.json(validate_schema=False)
+        store.put(key, v.content, None, decoded=data)
+    for i in range(accesses):
+        data = store.get(key)
+    return data
+
+
+def bench(pipeline, body, accesses=10):
+    """
+    Peak bytes allocated and seconds spent by ``pipeline`` on ``body``
+    """
+    store = TieredCache(SqliteCache(persistent=False, max_bytes=None), 2 ** 26)
+    r = make_response(body)
+    tracemalloc.start()
+    t0 = time.time()
+    pipeline(store, "repo/Bench/Matrix.1/Matrix", r, accesses)
+    elapsed = time.time() - t0
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed
+
+
+if __name__ == '__main__':
+    body = make_matrix()
+    print("{0} bytes of JSON-encoded Matrix".format(len(body)))
+    print("{0:<16}{1:>16}{2:>12}".format(
+        "pipeline", "peak (bytes)", "time (s)"))
+    for pipeline in (spooled, buffered):
+        print("{0:<16}{1:>16}{2:>12.4f}".format(
+            pipeline.__name__, *bench(pipeline, body)))
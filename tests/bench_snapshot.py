@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    tests.bench_snapshot
+    ~~~~~~~~~~~~~~~~~~~~
+
+    Benchmark of warm loads (i.e. the first access in a new process) of the
+    JSON fixtures in ``data/json``, from JSON-encoded cache entries versus
+    ``marshal`` snapshots of the decoded objects.
+
+    .. code-block:: bash
+
+        $ python -m tests.bench_snapshot
+
+    :copyright: 2015 by `University of Denver <http://pardee.du.edu/>`_
+    :license: Apache 2.0, see LICENSE for more details.
+
+    :author: `LIU Yu <liuyu@opencps.net>`_
+    :date: 2015/12/26
+"""
+
+from __future__ import unicode_literals, print_function
+
+import json
+import marshal
+import time
+
+try:
+    from . import config
+    from .config import *
+    from .bench_cache import BACKENDS, get_backend, load_fixtures
+except (ValueError, ImportError):
+    import config
+    from config import *
+    from bench_cache import BACKENDS, get_backend, load_fixtures
+
+from datagator.api.client._cache.codec import snapshot, unpack
+from datagator.api.client._cache.memory import TieredCache
+
+
+__all__ = ['bench_decode', 'bench_startup', ]
+__all__ = [to_native(n) for n in __all__]
+
+
+def timed(func, *args):
+    t0 = time.time()
+    func(*args)
+    return time.time() - t0
+
+
+def bench_decode(fixtures, rounds=10):
+    """
+    Seconds spent on decoding all fixtures from either representation
+    """
+    texts = [value for key, value in fixtures]
+    snapshots = [snapshot(json.loads(to_unicode(v))) for v in texts]
+
+    def from_json():
+        for i in range(rounds):
+            for value in texts:
+                unpack(value)
+        pass
+
+    def from_snapshot():
+        for i in range(rounds):
+            for value in snapshots:
+                unpack(value)
+        pass
+
+    return timed(from_json), timed(from_snapshot)
+
+
+def bench_startup(backend, fixtures):
+    """
+    Seconds spent by ``backend`` on loading all fixtures into a new (empty)
+    memory tier, without and with snapshots
+    """
+    store = backend(persistent=False, max_bytes=None)
+    for key, value in fixtures:
+        store.put(key, value)
+    # the first run decodes JSON, and leaves snapshots behind
+    warmup = TieredCache(store, 2 ** 30, snapshot=True)
+    for key, value in fixtures:
+        warmup.get(key)
+
+    def load_all(tier):
+        for key, value in fixtures:
+            tier.get(key)
+        pass
+
+    return (timed(load_all, TieredCache(store, 2 ** 30)),
+            timed(load_all, TieredCache(store, 2 ** 30, snapshot=True)))
+
+
+if __name__ == '__main__':
+    fixtures = load_fixtures()
+    total = sum([len(value) for key, value in fixtures])
+    print("{0} fixtures, {1} bytes".format(len(fixtures), total))
+    print("{0:<16}{1:>12}{2:>16}".format(
+        "decode", "json (s)", "snapshot (s)"))
+    print("{0:<16}{1:>12.4f}{2:>16.4f}".format(
+        "(in memory)", *bench_decode(fixtures)))
+    print("{0:<16}{1:>12}{2:>16}".format(
+        "startup", "json (s)", "snapshot (s)"))
+    for name in BACKENDS:
+        backend = get_backend(name)
+        if backend is None:
+            print("{0:<16}{1:>12}".format(name.rpartition(".")[-1], "N/A"))
+            continue
+        print("{0:<16}{1:>12.4f}{2:>16.4f}".format(
+            backend.__name__, *bench_startup(backend, fixtures)))
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    tests.test_backend_aio
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    :copyright: 2015 by `University of Denver <http://pardee.du.edu/>`_
+    :license: Apache 2.0, see LICENSE for more details.
+
+    :author: `LIU Yu <liuyu@opencps.net>`_
+    :date: 2015/12/14
+"""
+
+from __future__ import unicode_literals
+
+import json
+import logging
+import os
+import sys
+
+try:
+    from . import config
+    from .config import *
+except (ValueError, ImportError):
+    import config
+    from config import *
+
+from datagator.api.client import environ
+from datagator.api.client import Repo
+
+try:
+    import asyncio
+    from datagator.api.client._aio import AsyncDataGatorService, \
+        cache_getter, validated
+except (ImportError, SyntaxError):
+    AsyncDataGatorService = None
+
+
+__all__ = ['TestAsyncValidated',
+           'TestAsyncRoot',
+           'TestAsyncEntity', ]
+__all__ = [to_native(n) for n in __all__]
+
+
+_log = logging.getLogger("datagator.{0}".format(__name__))
+
+
+def run(coro):
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+
+class StreamReader(object):
+    """
+    Stand-in of ``aiohttp.StreamReader`` yielding the given chunks
+    """
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        pass
+
+    def iter_chunked(self, n):
+        return self
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        # awaitable of the next chunk (without `async def`, which does not
+        # compile in Python 2)
+        future = asyncio.get_event_loop().create_future()
+        if self.chunks:
+            future.set_result(self.chunks.pop(0))
+        else:
+            future.set_exception(StopAsyncIteration())
+        return future
+
+    pass
+
+
+class ClientResponse(object):
+    """
+    Stand-in of ``aiohttp.ClientResponse`` (without network I/O)
+    """
+
+    def __init__(self, status, data, chunk_size=7):
+        body = to_bytes(json.dumps(data))
+        self.status = status
+        self.headers = {"Content-Type": "application/json"}
+        self.url = "repo/Pardee"
+        self.content = StreamReader([
+            body[i:i + chunk_size] for i in range(0, len(body), chunk_size)])
+        self.released = False
+        pass
+
+    def release(self):
+        self.released = True
+        pass
+
+    pass
+
+
+@unittest.skipIf(
+    AsyncDataGatorService is None, "asyncio / aiohttp not available")
+class TestAsyncValidated(unittest.TestCase):
+
+    def enter(self, r, *args):
+        v = validated(r, *args)
+        return run(v.__aenter__())
+
+    def test_validated(self):
+        data = {"kind": "datagator#Repo", "name": "Pardee"}
+        r = ClientResponse(200, data)
+        v = self.enter(r)
+        self.assertEqual(v.json(), data)
+        self.assertEqual(bytes(v.content), to_bytes(json.dumps(data)))
+        self.assertTrue(r.released)
+        pass  # void return
+
+    def test_validated_status(self):
+        r = ClientResponse(404, {
+            "kind": "datagator#Error", "code": 404, "message": "n/a"})
+        self.assertRaises(RuntimeError, self.enter, r)
+        self.assertTrue(r.released)
+        v = self.enter(ClientResponse(404, {
+            "kind": "datagator#Error", "code": 404}), (200, 404))
+        self.assertEqual(v.status_code, 404)
+        pass  # void return
+
+    pass
+
+
+@unittest.skipIf(
+    AsyncDataGatorService is None, "asyncio / aiohttp not available")
+class TestAsyncRoot(unittest.TestCase):
+    """
+    Endpoint:
+        ``^/``
+        ``^/schema``
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        environ.DATAGATOR_API_VERSION = "v2"
+        cls.service = AsyncDataGatorService()
+        pass  # void return
+
+    @classmethod
+    def tearDownClass(cls):
+        run(cls.service.close())
+        del cls.service
+        pass  # void return
+
+    def test_ROOT_status(self):
+        msg = run(self.service.status)
+        self.assertEqual(msg.get("kind"), "datagator#Status")
+        self.assertEqual(msg.get("code"), 200)
+        self.assertEqual(msg.get("version"), environ.DATAGATOR_API_VERSION)
+        pass  # void return
+
+    def test_ROOT_concurrent_GET(self):
+        responses = run(asyncio.gather(
+            *[self.service.get("/") for i in range(8)]))
+        self.assertEqual([r.status for r in responses], [200] * 8)
+        for r in responses:
+            r.release()
+        pass  # void return
+
+    pass
+
+
+@unittest.skipIf(
+    AsyncDataGatorService is None, "asyncio / aiohttp not available")
+@unittest.skipIf(
+    not os.environ.get('DATAGATOR_CREDENTIALS', None) and
+    os.environ.get('TRAVIS', False),
+    "credentials required for unsupervised testing")
+class TestAsyncEntity(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        environ.DATAGATOR_API_VERSION = "v2"
+        cls.repo, cls.secret = get_credentials()
+        cls.service = AsyncDataGatorService(auth=(cls.repo, cls.secret))
+        pass  # void return
+
+    @classmethod
+    def tearDownClass(cls):
+        run(cls.service.close())
+        del cls.service
+        pass  # void return
+
+    def test_cache_getter(self):
+        repo = Repo(self.repo)
+        ds = repo["IGO_Members"]
+        del repo.cache
+        del ds.cache
+        repo_data, ds_data = run(asyncio.gather(
+            cache_getter(repo, self.service),
+            cache_getter(ds, self.service)))
+        self.assertEqual(repo_data.get("kind"), "datagator#Repo")
+        self.assertEqual(ds_data.get("kind"), "datagator#DataSet")
+        # the awaited lookups warm up the shared cache for synced access
+        self.assertEqual(ds.cache, ds_data)
+        pass  # void return
+
+    pass
+
+
+def test_suite():
+    return unittest.TestSuite([
+        unittest.TestLoader().loadTestsFromTestCase(eval(c)) for c in __all__])
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest=to_native("test_suite"))
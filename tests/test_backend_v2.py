@@ -978,6 +978,16 @@ class TestHttpRateLimit(unittest.TestCase):
 
         pass
 
+    def test_HTTP_ratelimit_sync(self):
+
+        r = self.service.get("/")
+        remain = int(r.headers["X-RateLimit-Remaining"])
+
+        # the client-side limiter is re-synchronized by every response
+        self.assertEqual(self.service.limiter.remaining, remain)
+
+        pass
+
     pass
 
 
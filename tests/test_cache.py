@@ -0,0 +1,498 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    tests.test_cache
+    ~~~~~~~~~~~~~~~~
+
+    :copyright: 2015 by `University of Denver <http://pardee.du.edu/>`_
+    :license: Apache 2.0, see LICENSE for more details.
+
+    :author: `LIU Yu <liuyu@opencps.net>`_
+    :date: 2015/12/17
+"""
+
+from __future__ import unicode_literals
+
+import io
+import logging
+import os
+import sys
+import threading
+import time
+import zlib
+
+try:
+    from . import config
+    from .config import *
+except (ValueError, ImportError):
+    import config
+    from config import *
+
+from datagator.api.client._cache import SingleFlight
+from datagator.api.client._cache.codec import available, pack, unpack
+from datagator.api.client._cache.memory import TieredCache
+from datagator.api.client._cache.segment import SegmentCache
+from datagator.api.client._cache.sqlite import SqliteCache
+
+try:
+    from datagator.api.client._cache.leveldb import LevelDbCache
+except ImportError:
+    LevelDbCache = None
+
+
+__all__ = ['TestCodec',
+           'TestSqliteCache',
+           'TestLevelDbCache',
+           'TestSegmentCache',
+           'TestTieredCache',
+           'TestSingleFlight', ]
+__all__ = [to_native(n) for n in __all__]
+
+
+_log = logging.getLogger("datagator.{0}".format(__name__))
+
+
+class TestCodec(unittest.TestCase):
+
+    def test_Codec_roundtrip(self):
+        data = {"kind": "datagator#Matrix", "rows": [["Atlantis", 1]] * 10}
+        for codec in available():
+            value, meta = pack(data, codec, {"etag": "\"abc\""})
+            self.assertEqual(meta['codec'], codec)
+            self.assertEqual(meta['etag'], "\"abc\"")
+            self.assertEqual(meta['size'], len(value))
+            self.assertEqual(unpack(value, meta), data)
+        self.assertRaises(ValueError, pack, data, "snappy")
+        pass  # void return
+
+    def test_Codec_passthrough(self):
+        value, meta = pack([1], "zlib")
+        # compressed values are stored as-is, regardless of the codec
+        value, meta = pack(value, "bz2", {"codec": "zlib"})
+        self.assertEqual(meta['codec'], "zlib")
+        self.assertEqual(unpack(value, meta), [1])
+        # unless compression is turned off
+        value, meta = pack(value, "identity", meta)
+        self.assertEqual((value, meta['codec']), (b"[1]", "identity"))
+        self.assertEqual(unpack(value, {}), [1])
+        pass  # void return
+
+    pass
+
+
+class TestSqliteCache(unittest.TestCase):
+
+    def make_cache(self, name, **kwds):
+        kwds.setdefault("persistent", False)
+        kwds.setdefault("codec", "identity")
+        return SqliteCache(
+            fs=os.path.join(config.TEMP_DIR, "{0}.sqlite".format(name)),
+            **kwds)
+
+    def test_SqliteCache_put_get(self):
+        cache = self.make_cache("put_get")
+        self.assertFalse(cache.exists("repo/Pardee"))
+        self.assertEqual(cache.get("repo/Pardee", 0), 0)
+        cache.put("repo/Pardee", {"kind": "datagator#Repo"})
+        cache.put("repo/Pardee/IGO", io.BytesIO(b'{"kind": "x"}'))
+        self.assertTrue(cache.exists("repo/Pardee"))
+        self.assertEqual(cache.get("repo/Pardee/IGO"), {"kind": "x"})
+        cache.delete("repo/Pardee")
+        self.assertFalse(cache.exists("repo/Pardee"))
+        self.assertEqual(cache.size, len(b'{"kind": "x"}'))
+        pass  # void return
+
+    def test_SqliteCache_meta(self):
+        cache = self.make_cache("meta", ttl=-1)
+        cache.put("repo/Pardee/IGO", [], {"etag": "\"abc\""})
+        cache.put("repo/Pardee/IGO.1", [])
+        meta = cache.meta("repo/Pardee/IGO")
+        self.assertEqual(meta['etag'], "\"abc\"")
+        self.assertFalse("last_modified" in meta)
+        # revision-pinned entries never expire
+        self.assertTrue(cache.stale("repo/Pardee/IGO"))
+        self.assertFalse(cache.stale("repo/Pardee/IGO.1"))
+        pass  # void return
+
+    def test_SqliteCache_touch(self):
+        cache = self.make_cache("touch", ttl=60)
+        cache.put("repo/Pardee/IGO", [])
+        self.assertFalse(cache.stale("repo/Pardee/IGO"))
+        expires = cache.meta("repo/Pardee/IGO")['expires']
+        time.sleep(0.01)
+        cache.touch("repo/Pardee/IGO")
+        self.assertTrue(cache.meta("repo/Pardee/IGO")['expires'] > expires)
+        pass  # void return
+
+    def test_SqliteCache_batch(self):
+        cache = self.make_cache("batch")
+        try:
+            with cache.batch():
+                cache.put("repo/Pardee/IGO", [1, 2, 3])
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertFalse(cache.exists("repo/Pardee/IGO"))
+        with cache.batch():
+            for i in range(10):
+                cache.put("repo/Pardee/IGO.{0}".format(i), [i])
+        self.assertEqual(cache.get("repo/Pardee/IGO.9"), [9])
+        self.assertEqual(cache.size, 30)
+        pass  # void return
+
+    def test_SqliteCache_evict(self):
+        cache = self.make_cache("evict", max_bytes=100)
+        for i in range(12):
+            cache.put("repo/Pardee/IGO.{0}".format(i), "{0:08d}".format(i))
+        for i in range(50):
+            if cache.size <= 100:
+                break
+            time.sleep(0.1)
+        self.assertTrue(cache.size <= 100)
+        # most recently written entry survives the eviction
+        self.assertTrue(cache.exists("repo/Pardee/IGO.11"))
+        pass  # void return
+
+    def test_SqliteCache_dedup(self):
+        cache = self.make_cache("dedup")
+        for i in range(3):
+            cache.put("repo/Pardee/IGO.{0}/UN".format(i), [1, 2, 3])
+        # identical content is stored once
+        self.assertEqual(cache.size, len(b"[1, 2, 3]"))
+        self.assertEqual(len(set([
+            cache.meta("repo/Pardee/IGO.{0}/UN".format(i))['digest']
+            for i in range(3)])), 1)
+        cache.put("repo/Pardee/IGO.2/UN", [4])
+        self.assertEqual(cache.size, len(b"[1, 2, 3]") + len(b"[4]"))
+        cache.delete("repo/Pardee/IGO.0/UN")
+        self.assertEqual(cache.get("repo/Pardee/IGO.1/UN"), [1, 2, 3])
+        # content is freed along with the last URI referring to it
+        cache.delete("repo/Pardee/IGO.1/UN")
+        self.assertEqual(cache.size, len(b"[4]"))
+        cache.put("repo/Pardee/IGO.2/UN", [4])
+        self.assertEqual(cache.get("repo/Pardee/IGO.2/UN"), [4])
+        self.assertEqual(cache.size, len(b"[4]"))
+        pass  # void return
+
+    def test_SqliteCache_codec(self):
+        cache = self.make_cache("codec", codec="zlib")
+        data = [["Country", 2010, 2011]] + [["Atlantis", 1, 1]] * 100
+        cache.put("repo/Pardee/IGO", data)
+        meta = cache.meta("repo/Pardee/IGO")
+        self.assertEqual(meta['codec'], "zlib")
+        self.assertTrue(meta['size'] * 10 < meta['length'])
+        self.assertEqual(cache.size, meta['size'])
+        self.assertEqual(cache.get("repo/Pardee/IGO"), data)
+        # compressed content (e.g. gzip-encoded response) is passed through
+        c = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        body = c.compress(b'{"kind": "x"}') + c.flush()
+        cache.put("repo/Pardee/IGO.1", body, {"codec": "gzip"})
+        self.assertEqual(cache.meta("repo/Pardee/IGO.1")['codec'], "gzip")
+        self.assertEqual(cache.get("repo/Pardee/IGO.1"), {"kind": "x"})
+        pass  # void return
+
+    pass
+
+
+@unittest.skipIf(LevelDbCache is None, "leveldb not available")
+class TestLevelDbCache(unittest.TestCase):
+
+    def make_cache(self, name, **kwds):
+        kwds.setdefault("persistent", False)
+        kwds.setdefault("codec", "identity")
+        return LevelDbCache(
+            fs=os.path.join(config.TEMP_DIR, "{0}.leveldb".format(name)),
+            **kwds)
+
+    def test_LevelDbCache_put_get(self):
+        cache = self.make_cache("put_get")
+        cache.put("repo/Pardee", {"kind": "datagator#Repo"})
+        cache.put("repo/Pardee/IGO", {"kind": "datagator#Repo"})
+        self.assertEqual(cache.get("repo/Pardee"), {"kind": "datagator#Repo"})
+        # identical content is stored once
+        self.assertEqual(cache.size, len(b'{"kind": "datagator#Repo"}'))
+        cache.delete("repo/Pardee")
+        cache.delete("repo/Pardee/IGO")
+        self.assertEqual(cache.get("repo/Pardee/IGO", 0), 0)
+        self.assertEqual(cache.size, 0)
+        pass  # void return
+
+    def test_LevelDbCache_accessed(self):
+        cache = self.make_cache("accessed")
+        cache.put("repo/Pardee", [1])
+        # metadata read by `get()` before a concurrent `put()` of new content
+        stale = dict(cache.meta("repo/Pardee"), accessed=0)
+        cache.put("repo/Pardee", [2])
+        cache._accessed("repo/Pardee", stale)
+        meta = cache.meta("repo/Pardee")
+        self.assertNotEqual(meta['digest'], stale['digest'])
+        self.assertEqual(cache.get("repo/Pardee"), [2])
+        # nor is a deleted entry brought back
+        cache.delete("repo/Pardee")
+        cache._accessed("repo/Pardee", stale)
+        self.assertEqual(cache.meta("repo/Pardee"), None)
+        self.assertEqual(cache.size, 0)
+        pass  # void return
+
+    def test_LevelDbCache_touch(self):
+        cache = self.make_cache("touch", ttl=60)
+        cache.put("repo/Pardee/IGO", [])
+        expires = cache.meta("repo/Pardee/IGO")['expires']
+        time.sleep(0.01)
+        cache.touch("repo/Pardee/IGO")
+        self.assertTrue(cache.meta("repo/Pardee/IGO")['expires'] > expires)
+        pass  # void return
+
+    def test_LevelDbCache_locked(self):
+        cache = self.make_cache("locked", persistent=True)
+        cache.put("repo/Pardee", [1])
+        # the database is locked by the first instance, so that the second
+        # one falls back to a private (temporary) cache
+        other = self.make_cache("locked", persistent=True)
+        self.assertEqual(other.get("repo/Pardee"), None)
+        other.put("repo/Pardee", [2])
+        self.assertEqual(other.get("repo/Pardee"), [2])
+        self.assertEqual(cache.get("repo/Pardee"), [1])
+        del other
+        del cache
+        # and the persistent one is intact
+        cache = self.make_cache("locked", persistent=True)
+        self.assertEqual(cache.get("repo/Pardee"), [1])
+        pass  # void return
+
+    pass
+
+
+class TestSegmentCache(unittest.TestCase):
+
+    def make_cache(self, name, **kwds):
+        kwds.setdefault("persistent", False)
+        kwds.setdefault("codec", "identity")
+        return SegmentCache(
+            fs=os.path.join(config.TEMP_DIR, "{0}.segments".format(name)),
+            **kwds)
+
+    def test_SegmentCache_view(self):
+        cache = self.make_cache("view")
+        self.assertEqual(cache.view("repo/Pardee/IGO"), None)
+        for i in range(3):
+            cache.put("repo/Pardee/IGO.{0}/UN".format(i), {"kind": "x"})
+        # content is mapped from the segment without copying
+        view = cache.view("repo/Pardee/IGO.1/UN")
+        self.assertTrue(isinstance(view, memoryview))
+        self.assertEqual(view.tobytes(), b'{"kind": "x"}')
+        self.assertEqual(cache.get("repo/Pardee/IGO.2/UN"), {"kind": "x"})
+        self.assertEqual(cache.size, len(b'{"kind": "x"}'))
+        cache.delete("repo/Pardee/IGO.1/UN")
+        self.assertFalse(cache.exists("repo/Pardee/IGO.1/UN"))
+        self.assertEqual(view.tobytes(), b'{"kind": "x"}')
+        pass  # void return
+
+    def test_SegmentCache_recover(self):
+        cache = self.make_cache("recover", persistent=True)
+        cache.put("repo/Pardee/IGO.1", [1])
+        cache.put("repo/Pardee/IGO.2", [2])
+        cache.delete("repo/Pardee/IGO.1")
+        del cache
+        fs = os.path.join(config.TEMP_DIR, "recover.segments")
+        # records after the checkpoint are replayed, up to a torn one
+        cache = self.make_cache("recover", persistent=True)
+        cache.put("repo/Pardee/IGO.3", [3])
+        with open(os.path.join(fs, "cache.seg"), "ab") as f:
+            f.write(b"DGCR\x00")
+        os.remove(os.path.join(fs, "cache.idx"))
+        cache = self.make_cache("recover")
+        self.assertFalse(cache.exists("repo/Pardee/IGO.1"))
+        self.assertEqual(cache.get("repo/Pardee/IGO.2"), [2])
+        self.assertEqual(cache.get("repo/Pardee/IGO.3"), [3])
+        cache.put("repo/Pardee/IGO.4", [4])
+        self.assertEqual(cache.get("repo/Pardee/IGO.4"), [4])
+        pass  # void return
+
+    def test_SegmentCache_compact(self):
+        cache = self.make_cache("compact", codec="zlib")
+        cache.put("repo/Pardee/IGO.1", [1])
+        for i in range(10):
+            cache.put("repo/Pardee/IGO", [i] * 100)
+        garbage = cache.garbage
+        cache.compact()
+        self.assertTrue(cache.garbage < garbage)
+        self.assertEqual(cache.get("repo/Pardee/IGO"), [9] * 100)
+        self.assertEqual(cache.get("repo/Pardee/IGO.1"), [1])
+        self.assertEqual(cache.meta("repo/Pardee/IGO")['codec'], "zlib")
+        pass  # void return
+
+    def test_SegmentCache_shared(self):
+        a = self.make_cache("shared", persistent=True)
+        b = self.make_cache("shared", persistent=True)
+        a.put("repo/Pardee/IGO.1", [1])
+        a.delete("repo/Pardee/IGO.1")
+        self.assertEqual(b.get("repo/Pardee/IGO.1"), None)
+        # unreferenced content is dropped by compaction in another instance,
+        # thus appended again rather than linked to
+        a.compact()
+        b.put("repo/Pardee/IGO.2", [1])
+        self.assertEqual(b.get("repo/Pardee/IGO.2"), [1])
+        self.assertEqual(a.get("repo/Pardee/IGO.2"), [1])
+        a.touch("repo/Pardee/IGO.2")
+        b.delete("repo/Pardee/IGO.2")
+        b.compact()
+        # touching an entry deleted (and compacted) by another instance
+        a.touch("repo/Pardee/IGO.2")
+        self.assertFalse(a.exists("repo/Pardee/IGO.2"))
+        pass  # void return
+
+    pass
+
+
+class TestTieredCache(unittest.TestCase):
+
+    def make_cache(self, name, max_bytes, snapshot=False, **kwds):
+        kwds.setdefault("persistent", False)
+        kwds.setdefault("codec", "identity")
+        backend = SqliteCache(
+            fs=os.path.join(config.TEMP_DIR, "{0}.sqlite".format(name)),
+            **kwds)
+        return TieredCache(backend, max_bytes, snapshot=snapshot)
+
+    def test_TieredCache_get(self):
+        cache = self.make_cache("tiered_get", 100)
+        cache.put("repo/Pardee/IGO", {"kind": "x"})
+        self.assertEqual(len(cache), 0)
+        data = cache.get("repo/Pardee/IGO")
+        self.assertEqual(data, {"kind": "x"})
+        # repeated access returns the very same decoded object
+        self.assertTrue(cache.get("repo/Pardee/IGO") is data)
+        self.assertEqual(cache.size, len(b'{"kind": "x"}'))
+        pass  # void return
+
+    def test_TieredCache_write_through(self):
+        cache = self.make_cache("tiered_write", 100)
+        cache.put("repo/Pardee/IGO", [1])
+        self.assertEqual(cache.get("repo/Pardee/IGO"), [1])
+        cache.put("repo/Pardee/IGO", io.BytesIO(b"[2]"))
+        self.assertEqual(cache.backend.get("repo/Pardee/IGO"), [2])
+        self.assertEqual(cache.get("repo/Pardee/IGO"), [2])
+        cache.delete("repo/Pardee/IGO")
+        self.assertFalse(cache.exists("repo/Pardee/IGO"))
+        self.assertEqual(cache.get("repo/Pardee/IGO"), None)
+        self.assertEqual(cache.size, 0)
+        pass  # void return
+
+    def test_TieredCache_evict(self):
+        cache = self.make_cache("tiered_evict", 25)
+        for i in range(4):
+            cache.put("repo/Pardee/IGO.{0}".format(i), "x" * 8)
+            cache.get("repo/Pardee/IGO.{0}".format(i))
+        # least recently used objects are dropped from memory only
+        self.assertEqual(len(cache), 2)
+        self.assertTrue(cache.size <= 25)
+        self.assertEqual(cache.get("repo/Pardee/IGO.0"), "x" * 8)
+        pass  # void return
+
+    def test_TieredCache_stale(self):
+        cache = self.make_cache("tiered_stale", 100, ttl=-1)
+        cache.put("repo/Pardee/IGO", [])
+        data = cache.get("repo/Pardee/IGO")
+        self.assertTrue(cache.stale("repo/Pardee/IGO"))
+        # revalidated object is not decoded again
+        cache.touch("repo/Pardee/IGO")
+        self.assertTrue(cache.get("repo/Pardee/IGO") is data)
+        pass  # void return
+
+    def test_TieredCache_snapshot(self):
+        cache = self.make_cache("tiered_snapshot", 2 ** 20, snapshot=True)
+        backend = cache.backend
+        data = [[i, "Atlantis"] for i in range(10000)]
+        cache.put("repo/Pardee/IGO", data)
+        self.assertEqual(cache.get("repo/Pardee/IGO"), data)
+        # snapshot is left behind for later runs (i.e. new memory tiers)
+        self.assertTrue(backend.exists("repo/Pardee/IGO#snapshot"))
+        self.assertEqual(backend.get("repo/Pardee/IGO#snapshot"), data)
+        later = TieredCache(backend, 2 ** 20, snapshot=True)
+        self.assertEqual(later.get("repo/Pardee/IGO"), data)
+        # snapshot of former content is ignored, and replaced
+        backend.put("repo/Pardee/IGO", data[:-1])
+        later = TieredCache(backend, 2 ** 20, snapshot=True)
+        self.assertEqual(later.get("repo/Pardee/IGO"), data[:-1])
+        self.assertEqual(backend.get("repo/Pardee/IGO#snapshot"), data[:-1])
+        later.delete("repo/Pardee/IGO")
+        self.assertFalse(backend.exists("repo/Pardee/IGO#snapshot"))
+        pass  # void return
+
+    def test_TieredCache_codec(self):
+        cache = self.make_cache("tiered_codec", 2 ** 20, codec="zlib")
+        cache.put("repo/Pardee/IGO", "x" * 1000)
+        self.assertEqual(cache.get("repo/Pardee/IGO"), "x" * 1000)
+        # memory budget accounts for decoded (rather than compressed) size
+        self.assertEqual(cache.size, 1002)
+        self.assertTrue(cache.backend.size < 100)
+        pass  # void return
+
+    pass
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_SingleFlight_shared(self):
+        flights = SingleFlight()
+        calls = []
+        results = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.1)
+            return {"kind": "datagator#Repo"}
+
+        threads = [threading.Thread(target=lambda: results.append(
+            flights.do("repo/Pardee", fetch))) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all([r is results[0] for r in results]))
+        self.assertEqual(len(flights), 0)
+        pass  # void return
+
+    def test_SingleFlight_error(self):
+        flights = SingleFlight()
+
+        def fail():
+            raise RuntimeError("invalid response from backend service")
+
+        self.assertRaises(RuntimeError, flights.do, "repo/Pardee", fail)
+        # failures are not remembered
+        self.assertEqual(flights.do("repo/Pardee", lambda: 1), 1)
+        pass  # void return
+
+    def test_SingleFlight_independent(self):
+        flights = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+            return 1
+
+        t = threading.Thread(target=flights.do, args=("repo/A", slow))
+        t.start()
+        started.wait(5)
+        # unrelated keys are not blocked by an in-flight call
+        self.assertEqual(flights.do("repo/B", lambda: 2), 2)
+        release.set()
+        t.join()
+        pass  # void return
+
+    pass
+
+
+def test_suite():
+    return unittest.TestSuite([
+        unittest.TestLoader().loadTestsFromTestCase(eval(c)) for c in __all__])
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest=to_native("test_suite"))
@@ -0,0 +1,480 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    tests.test_changeset
+    ~~~~~~~~~~~~~~~~~~~~
+
+    Offline tests of :class:`ChangeSet` against a stand-in backend service.
+
+    :copyright: 2015 by `University of Denver <http://pardee.du.edu/>`_
+    :license: Apache 2.0, see LICENSE for more details.
+
+    :author: `LIU Yu <liuyu@opencps.net>`_
+    :date: 2015/12/27
+"""
+
+from __future__ import unicode_literals
+
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+
+try:
+    from . import config
+    from .config import *
+except (ValueError, ImportError):
+    import config
+    from config import *
+
+from datagator.api.client import environ
+from datagator.api.client._entity import Entity
+from datagator.api.client._records import RecordStore
+from datagator.api.client.repo import ChangeSet, DataSet
+
+from concurrent.futures import Future, TimeoutError
+
+
+__all__ = ['TestChangeSet', 'TestChangeSetAdapt', ]
+__all__ = [to_native(n) for n in __all__]
+
+
+_log = logging.getLogger("datagator.{0}".format(__name__))
+
+
+class Response(object):
+    """
+    Stand-in of a (non-streamed) response from the backend service
+    """
+
+    def __init__(self, url, status_code, data, headers={}):
+        self.status_code = status_code
+        self.headers = {"Content-Type": "application/json"}
+        self.headers.update(headers)
+        self.url = url
+        self.elapsed = datetime.timedelta(0)
+        self.content = to_bytes(json.dumps(data))
+        pass
+
+    pass
+
+
+class Service(object):
+    """
+    Stand-in of :class:`DataGatorService` recording the uploaded payloads,
+    each of which is committed as a new HEAD revision
+    """
+
+    def __init__(self):
+        self.auth = None
+        self.payloads = []
+        # HEAD revision of the data sets, `None` if not yet created
+        self.rev = None
+        # uploads wait for the gate to open
+        self.gate = threading.Event()
+        self.gate.set()
+        # set upon each upload
+        self.received = threading.Event()
+        # offsets of uploads (in the order of arrival) failing with `IOError`
+        self.failures = set()
+        pass
+
+    def patch(self, path, data, headers={}):
+        n = len(self.payloads)
+        self.payloads.append(json.loads(to_unicode(data.read())))
+        self.received.set()
+        self.gate.wait()
+        if n in self.failures:
+            raise IOError("failed upload {0}".format(n))
+        self.rev = (self.rev or 0) + 1
+        return Response(path, 202, {
+            "kind": "datagator#Status", "code": 202, "message": "ok"}, {
+            "Location": "task/{0}".format(n)})
+
+    def get(self, path, headers={}, stream=False):
+        if self.rev is None:
+            return Response(path, 404, {
+                "kind": "datagator#Error", "code": 404, "message": "n/a"})
+        repo, _, name = path.rpartition("/")
+        return Response(path, 200, {
+            "kind": "datagator#DataSet", "name": name, "rev": self.rev,
+            "repo": {"kind": "datagator#Repo", "name": "Pardee"},
+            "items": [], "itemsCount": 0}, {
+            "X-DataGator-Entity": "DataSet"})
+
+    pass
+
+
+class Watcher(object):
+    """
+    Stand-in of :class:`TaskWatcher` completing each task immediately
+    """
+
+    def watch(self, url, repo=None, timeout=None):
+        future = Future()
+        future.set_result({"kind": "datagator#Task", "status": "SUC"})
+        return future
+
+    pass
+
+
+class PendingWatcher(object):
+    """
+    Stand-in of :class:`TaskWatcher` completing the tasks upon request
+    """
+
+    def __init__(self):
+        self.futures = []
+        pass
+
+    def watch(self, url, repo=None, timeout=None):
+        future = Future()
+        self.futures.append(future)
+        return future
+
+    def complete(self):
+        for future in self.futures:
+            future.set_result({"kind": "datagator#Task", "status": "SUC"})
+        pass
+
+    pass
+
+
+class Repo(object):
+    """
+    Stand-in of a ``Repo`` (which would be loaded from the backend service)
+    """
+
+    name = "Pardee"
+    uri = "repo/Pardee"
+    ref = Entity.Ref([("kind", "datagator#Repo"), ("name", "Pardee"), ])
+
+    pass
+
+
+def matrix(n):
+    return {"kind": "datagator#Matrix", "columnHeaders": 0, "rowHeaders": 0,
+            "rows": [[n]], "rowsCount": 1, "columnsCount": 1}
+
+
+class TestChangeSet(unittest.TestCase):
+
+    def setUp(self):
+        self.service, self.watcher = Entity.service, Entity.watcher
+        self.records = Entity.records
+        self.payload_bytes = ChangeSet._payload_bytes
+        Entity.service = Service()
+        Entity.watcher = Watcher()
+        Entity.records = RecordStore(os.path.join(
+            config.TEMP_DIR, "{0}.records".format(self.id()),
+            "records.sqlite"))
+        pass  # void return
+
+    def tearDown(self):
+        Entity.service, Entity.watcher = self.service, self.watcher
+        Entity.records = self.records
+        ChangeSet._payload_bytes = self.payload_bytes
+        pass  # void return
+
+    def make_changeset(self, name):
+        # every entry is committed as a revision of its own
+        return ChangeSet(DataSet(Repo(), name), min_payload_bytes=1,
+                         max_payload_bytes=1)
+
+    def wait_recorded(self, cs, key):
+        # digests are recorded in the background, after the commits
+        cs.wait(5)
+        record = Entity.records.get(cs._digest_key(key)) or {}
+        self.assertEqual(record.get("rev"), Entity.service.rev)
+        return record
+
+    def test_ChangeSet_order(self):
+        cs = self.make_changeset("Order")
+        for i in range(6):
+            cs["K{0}".format(i)] = matrix(i)
+        cs.commit()
+        self.assertEqual(Entity.service.payloads, [
+            {"K{0}".format(i): matrix(i)} for i in range(6)])
+        self.assertEqual(len(cs.tasks), 6)
+        self.wait_recorded(cs, "K5")
+        pass  # void return
+
+    def test_ChangeSet_backpressure(self):
+        cs = self.make_changeset("Backpressure")
+        written = []
+
+        def write():
+            for i in range(5):
+                cs["K{0}".format(i)] = matrix(i)
+                written.append(i)
+            pass
+
+        Entity.service.gate.clear()
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            self.assertTrue(Entity.service.received.wait(5))
+            time.sleep(0.2)
+            # one payload is being uploaded, and another one is queued,
+            # before the writer blocks on committing the third one
+            self.assertEqual(
+                len(written), ChangeSet.MAX_PENDING_PAYLOADS)
+        finally:
+            Entity.service.gate.set()
+            writer.join()
+        cs.commit()
+        self.assertEqual(written, list(range(5)))
+        self.assertEqual(len(Entity.service.payloads), 5)
+        self.wait_recorded(cs, "K4")
+        pass  # void return
+
+    def test_ChangeSet_failure(self):
+        cs = self.make_changeset("Failure")
+        Entity.service.failures.add(1)
+        cs["K0"] = matrix(0)
+        cs["K1"] = matrix(1)
+        while len(Entity.service.payloads) < 2 or not all(
+                [f.done() for f in cs.tasks]):
+            time.sleep(0.01)
+        time.sleep(0.1)
+        # the failure is re-raised by the next write
+        self.assertRaises(IOError, cs.__setitem__, "K2", matrix(2))
+        cs.commit()
+        self.assertEqual(len(cs.tasks), 1)
+        pass  # void return
+
+    def test_ChangeSet_abort(self):
+        cs = self.make_changeset("Abort")
+        Entity.service.failures.add(0)
+        Entity.service.gate.clear()
+        cs["K0"] = matrix(0)
+        cs["K1"] = matrix(1)
+        Entity.service.gate.set()
+        # the failure is re-raised by the commit, and the upload queued after
+        # the failed one is aborted
+        self.assertRaises(IOError, cs.commit)
+        self.assertEqual(list(Entity.service.payloads), [{"K0": matrix(0)}])
+        self.assertEqual(cs.tasks, [])
+        # values of failed (or aborted) uploads are not taken as sent
+        cs["K1"] = matrix(1)
+        cs.commit()
+        self.assertEqual(Entity.service.payloads[-1], {"K1": matrix(1)})
+        self.assertEqual(cs.stats.items_skipped, 0)
+        self.wait_recorded(cs, "K1")
+        pass  # void return
+
+    def test_ChangeSet_exit(self):
+        Entity.watcher = PendingWatcher()
+        cs = self.make_changeset("Exit")
+        cs["K0"] = matrix(0)
+        cs.commit()
+        # no thread blocks the exit of the interpreter, while the task is
+        # still in progress
+        deadline = time.time() + 5
+        while time.time() < deadline and [
+                t for t in threading.enumerate() if not t.daemon and
+                t is not threading.current_thread()]:
+            time.sleep(0.01)
+        self.assertEqual([t for t in threading.enumerate() if not t.daemon and
+                          t is not threading.current_thread()], [])
+        self.assertRaises(TimeoutError, cs.wait, 0.1)
+        Entity.watcher.complete()
+        self.wait_recorded(cs, "K0")
+        pass  # void return
+
+    def test_ChangeSet_skip(self):
+        cs = self.make_changeset("Skip")
+        cs["K0"] = matrix(0)
+        cs["K1"] = matrix(1)
+        cs.commit()
+        record = self.wait_recorded(cs, "K1")
+        self.assertEqual(record["rev"], 2)
+        # unchanged values of the recorded HEAD revision are skipped
+        cs = self.make_changeset("Skip")
+        cs["K0"] = matrix(0)
+        cs["K1"] = matrix(-1)
+        cs.commit()
+        self.assertEqual(cs.stats.items_skipped, 1)
+        self.assertEqual(Entity.service.payloads[-1], {"K1": matrix(-1)})
+        self.wait_recorded(cs, "K1")
+        # (recorded) values sent by the same change set are compared with
+        # the latest one, regardless of the recorded HEAD revision
+        cs["K1"] = matrix(-1)
+        cs["K1"] = matrix(1)
+        cs.commit()
+        self.assertEqual(cs.stats.items_skipped, 2)
+        self.assertEqual(Entity.service.payloads[-1], {"K1": matrix(1)})
+        self.wait_recorded(cs, "K1")
+        pass  # void return
+
+    def test_ChangeSet_send(self):
+        cs = self.make_changeset("Send")
+        cs["K0"] = matrix(0)
+        cs.commit()
+        self.wait_recorded(cs, "K0")
+        # a revision committed by another client (i.e. unrecorded) may have
+        # changed the value, which is sent again
+        Entity.service.rev += 1
+        cs = self.make_changeset("Send")
+        cs["K0"] = matrix(0)
+        cs.commit()
+        self.assertEqual(cs.stats.items_skipped, 0)
+        self.assertEqual(Entity.service.payloads[-1], {"K0": matrix(0)})
+        self.wait_recorded(cs, "K0")
+        pass  # void return
+
+    def test_ChangeSet_scope(self):
+        cs = self.make_changeset("Scope")
+        cs["K0"] = matrix(0)
+        cs.commit()
+        self.wait_recorded(cs, "K0")
+        # recorded values of another user (or backend service) do not count
+        Entity.service.auth = ("Other", "secret")
+        cs = self.make_changeset("Scope")
+        cs["K0"] = matrix(0)
+        cs.commit()
+        self.assertEqual(cs.stats.items_skipped, 0)
+        self.wait_recorded(cs, "K0")
+        host = environ.DATAGATOR_API_HOST
+        try:
+            environ.DATAGATOR_API_HOST = "staging.data-gator.com"
+            cs = self.make_changeset("Scope")
+            cs["K0"] = matrix(0)
+            cs.commit()
+            self.assertEqual(cs.stats.items_skipped, 0)
+            self.wait_recorded(cs, "K0")
+        finally:
+            environ.DATAGATOR_API_HOST = host
+        self.assertEqual(len(Entity.service.payloads), 3)
+        pass  # void return
+
+    def test_ChangeSet_reuse(self):
+        cs = self.make_changeset("Reuse")
+        with cs:
+            cs["K0"] = matrix(0)
+        self.wait_recorded(cs, "K0")
+        # values sent by an earlier `with` block are sent again, once they
+        # may have been changed by another client
+        Entity.service.rev += 1
+        with cs:
+            cs["K0"] = matrix(0)
+        self.assertEqual(cs.stats.items_skipped, 0)
+        self.assertEqual(len(Entity.service.payloads), 2)
+        self.wait_recorded(cs, "K0")
+        # otherwise, they are skipped as recorded
+        with cs:
+            cs["K0"] = matrix(0)
+        self.assertEqual(cs.stats.items_skipped, 1)
+        self.assertEqual(len(Entity.service.payloads), 2)
+        pass  # void return
+
+    def test_ChangeSet_delete(self):
+        cs = self.make_changeset("Delete")
+        cs["K0"] = matrix(0)
+        cs["K1"] = None
+        cs.commit()
+        self.wait_recorded(cs, "K1")
+        # deletion is recorded as (the digest of) a `null` value
+        cs = self.make_changeset("Delete")
+        cs["K1"] = None
+        cs["K0"] = None
+        cs.commit()
+        self.assertEqual(cs.stats.items_skipped, 1)
+        self.assertEqual(Entity.service.payloads[-1], {"K0": None})
+        self.wait_recorded(cs, "K0")
+        # the deleted item is written again
+        cs = self.make_changeset("Delete")
+        cs["K1"] = None
+        cs["K0"] = matrix(0)
+        cs.commit()
+        self.assertEqual(cs.stats.items_skipped, 1)
+        self.assertEqual(Entity.service.payloads[-1], {"K0": matrix(0)})
+        self.wait_recorded(cs, "K0")
+        pass  # void return
+
+    pass
+
+
+class TestChangeSetAdapt(unittest.TestCase):
+
+    MB = 2 ** 20
+
+    def setUp(self):
+        self.payload_bytes = ChangeSet._payload_bytes
+        ChangeSet._payload_bytes = None
+        pass  # void return
+
+    def tearDown(self):
+        ChangeSet._payload_bytes = self.payload_bytes
+        pass  # void return
+
+    def make_changeset(self, **kwargs):
+        kwargs.setdefault("initial_payload_bytes", 4 * self.MB)
+        return ChangeSet(DataSet(Repo(), "Adapt"), **kwargs)
+
+    def test_adapt_grow(self):
+        cs = self.make_changeset()
+        t = ChangeSet.TARGET_COMMIT_SECONDS
+        # at most doubled at a time
+        cs._adapt(4 * self.MB, t / 4.0)
+        self.assertEqual(cs.stats.payload_bytes, 8 * self.MB)
+        cs._adapt(8 * self.MB, t * 0.8)
+        self.assertEqual(cs.stats.payload_bytes, 10 * self.MB)
+        # and carried over to later change sets
+        self.assertEqual(ChangeSet._payload_bytes, 10 * self.MB)
+        cs = ChangeSet(DataSet(Repo(), "Adapt"))
+        self.assertEqual(cs.stats.payload_bytes, 10 * self.MB)
+        pass  # void return
+
+    def test_adapt_shrink(self):
+        cs = self.make_changeset()
+        t = ChangeSet.TARGET_COMMIT_SECONDS
+        cs._adapt(4 * self.MB, t * 1.6)
+        self.assertEqual(cs.stats.payload_bytes, int(2.5 * self.MB))
+        # at most halved at a time
+        cs._adapt(int(2.5 * self.MB), t * 10)
+        self.assertEqual(cs.stats.payload_bytes, int(1.25 * self.MB))
+        pass  # void return
+
+    def test_adapt_clamp(self):
+        cs = self.make_changeset(
+            min_payload_bytes=2 * self.MB, max_payload_bytes=6 * self.MB)
+        t = ChangeSet.TARGET_COMMIT_SECONDS
+        cs._adapt(4 * self.MB, t / 4.0)
+        self.assertEqual(cs.stats.payload_bytes, 6 * self.MB)
+        cs._adapt(6 * self.MB, t * 10)
+        self.assertEqual(cs.stats.payload_bytes, 3 * self.MB)
+        cs._adapt(3 * self.MB, t * 10)
+        self.assertEqual(cs.stats.payload_bytes, 2 * self.MB)
+        # so is the initial (or carried over) threshold
+        cs = self.make_changeset(initial_payload_bytes=self.MB,
+                                 min_payload_bytes=2 * self.MB)
+        self.assertEqual(cs.stats.payload_bytes, 2 * self.MB)
+        self.assertRaises(ValueError, self.make_changeset,
+                          min_payload_bytes=2 * self.MB,
+                          max_payload_bytes=self.MB)
+        pass  # void return
+
+    def test_adapt_on_time(self):
+        cs = self.make_changeset()
+        t = ChangeSet.TARGET_COMMIT_SECONDS
+        # small payloads committed in time (at low throughput) never shrink
+        # the threshold
+        cs._adapt(2 ** 10, t * 0.5)
+        self.assertEqual(cs.stats.payload_bytes, 4 * self.MB)
+        cs._adapt(4 * self.MB, t)
+        self.assertEqual(cs.stats.payload_bytes, 4 * self.MB)
+        pass  # void return
+
+    pass
+
+
+def test_suite():
+    return unittest.TestSuite([
+        unittest.TestLoader().loadTestsFromTestCase(eval(c)) for c in __all__])
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest=to_native("test_suite"))
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    tests.test_dgml
+    ~~~~~~~~~~~~~~~
+
+    :copyright: 2015 by `University of Denver <http://pardee.du.edu/>`_
+    :license: Apache 2.0, see LICENSE for more details.
+
+    :author: `LIU Yu <liuyu@opencps.net>`_
+    :date: 2015/12/22
+"""
+
+from __future__ import unicode_literals
+
+import json
+import logging
+import os
+import sys
+
+try:
+    from . import config
+    from .config import *
+except (ValueError, ImportError):
+    import config
+    from config import *
+
+from datagator.api.client._dgml import Bakery, dependencies, parse
+
+
+__all__ = ['TestParser',
+           'TestBakery', ]
+__all__ = [to_native(n) for n in __all__]
+
+
+_log = logging.getLogger("datagator.{0}".format(__name__))
+
+
+class TestParser(unittest.TestCase):
+
+    def test_Parser_recipe(self):
+        dgml = to_unicode(load_data(
+            os.path.join("raw", "Bakery", "US_Membership.dgml")))
+        recipe = json.loads(to_unicode(load_data(
+            os.path.join("json", "Bakery", "US_Membership.json"))))
+        self.assertEqual(json.loads(json.dumps(parse(dgml))), recipe)
+        pass  # void return
+
+    def test_Parser_nodes(self):
+        dgml = to_unicode(load_data(
+            os.path.join("raw", "Bakery", "Workflow_Example.dgml")))
+        recipe = parse(dgml)
+        self.assertEqual(list(recipe['routine']), ["NodeA", "NodeB"])
+        self.assertEqual(recipe['context']['items'][1]['from'],
+                         {"$ref": "#/routine/NodeA"})
+        self.assertEqual(Bakery(recipe).graph, {
+            None: ["NodeA"], "NodeA": ["NodeB"], "NodeB": ["NodeA"]})
+        pass  # void return
+
+    def test_Parser_dependencies(self):
+        dgml = to_unicode(load_data(
+            os.path.join("raw", "Bakery", "Workflow_Example.dgml")))
+        # node references are not dependencies on data sets
+        self.assertEqual(sorted(dependencies(dgml), key=repr), [
+            ("TestYX", "IGO_Members", 1, "UN"),
+            ("TestYX", "IGO_Members", None, None)])
+        pass  # void return
+
+    def test_Parser_malformed(self):
+        for dgml in ("yield", "for x in D:", "else:\n    pass",
+                     "load Repo as D", "yield 1\n    yield 2"):
+            self.assertRaises(ValueError, parse, dgml)
+        pass  # void return
+
+    pass
+
+
+class TestBakery(unittest.TestCase):
+
+    MEMBERS = "\n".join([
+        "node Members():",
+        "    yield \"Country\", 2010, 2011, 2012",
+        "    yield \"China\", None, 1, 1",
+        "    yield \"United States\", 1, 1, 1",
+        "    layout 1, 1", ])
+
+    def test_Bakery_cycle(self):
+        dgml = to_unicode(load_data(
+            os.path.join("raw", "Bakery", "Workflow_Example.dgml")))
+        # detected before loading anything from the backend service
+        self.assertRaises(ValueError, Bakery(dgml).bake)
+        self.assertRaises(ValueError, Bakery(
+            "load .Node() as D\nnode Node():\n    load .Node() as D").bake)
+        self.assertRaises(ValueError, Bakery("load .Node() as D").bake)
+        pass  # void return
+
+    def test_Bakery_index(self):
+        data = Bakery("\n".join([
+            "load .Members() as M",
+            "yield \"Country\", Range(2010, 2013)",
+            "index M by \"Country\"",
+            "for c in (\"Canada\", \"China\", \"United States\"):",
+            "    if c not in M:",
+            "        continue",
+            "    yield c, M[c].body",
+            "layout 1, 1",
+            self.MEMBERS, ])).bake()
+        self.assertEqual(data['rows'], [
+            ["Country", 2010, 2011, 2012],
+            ["China", None, 1, 1],
+            ["United States", 1, 1, 1]])
+        self.assertEqual((data['rowsCount'], data['columnsCount']), (3, 4))
+        self.assertEqual((data['columnHeaders'], data['rowHeaders']), (1, 1))
+        pass  # void return
+
+    def test_Bakery_memoize(self):
+        data = Bakery("\n".join([
+            "load .Members() as A",
+            "load .Members() as B",
+            "yield A is B",
+            "for row in B.rows:",
+            "    if row[0] == \"China\":",
+            "        continue",
+            "    yield row",
+            self.MEMBERS, ])).bake()
+        # each node is executed (at most) once per bake
+        self.assertEqual(data['rows'], [
+            [True, None, None, None],
+            ["United States", 1, 1, 1]])
+        pass  # void return
+
+    pass
+
+
+def test_suite():
+    return unittest.TestSuite([
+        unittest.TestLoader().loadTestsFromTestCase(eval(c)) for c in __all__])
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest=to_native("test_suite"))
@@ -13,6 +13,7 @@
 
 from __future__ import unicode_literals
 
+import datetime
 import io
 import json
 import jsonschema
@@ -20,6 +21,7 @@ import logging
 import os
 import sys
 import time
+import zlib
 
 try:
     from . import config
@@ -30,9 +32,14 @@ except (ValueError, ImportError):
 
 from datagator.api.client import environ
 from datagator.api.client import Repo, DataSet
+from datagator.api.client._entity import Entity, validated
 
+import requests
+import urllib3
 
-__all__ = ['TestRepo',
+
+__all__ = ['TestValidated',
+           'TestRepo',
            'TestDataSet']
 __all__ = [to_native(n) for n in __all__]
 
@@ -40,6 +47,85 @@ __all__ = [to_native(n) for n in __all__]
 _log = logging.getLogger("datagator.{0}".format(__name__))
 
 
+def make_response(body, encoding=None, length=True):
+    """
+    Streamed response of ``body`` (without network I/O)
+    """
+    headers = {"Content-Type": "application/json"}
+    if length:
+        headers['Content-Length'] = "{0}".format(len(body))
+    if encoding is not None:
+        headers['Content-Encoding'] = encoding
+    r = requests.Response()
+    r.raw = urllib3.HTTPResponse(
+        body=io.BytesIO(body), headers=headers, preload_content=False)
+    r.headers = requests.structures.CaseInsensitiveDict(headers)
+    r.status_code = 200
+    r.url = "repo/Pardee/IGO_Members.1/UN"
+    r.elapsed = datetime.timedelta(0)
+    return r
+
+
+class TestValidated(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # highly compressible, i.e. decoded far beyond `Content-Length`
+        cls.data = {"kind": "datagator#Matrix", "rows": [[0] * 100] * 1000}
+        cls.body = to_bytes(json.dumps(cls.data))
+        pass  # void return
+
+    def compress(self, wbits):
+        c = zlib.compressobj(6, zlib.DEFLATED, wbits)
+        return c.compress(self.body) + c.flush()
+
+    def test_validated_identity(self):
+        with validated(make_response(self.body)) as v:
+            self.assertEqual(v.json(validate_schema=False), self.data)
+            self.assertEqual(v.encoded, None)
+        pass  # void return
+
+    def test_validated_gzip(self):
+        body = self.compress(16 + zlib.MAX_WBITS)
+        with validated(make_response(body, "gzip")) as v:
+            self.assertEqual(v.json(validate_schema=False), self.data)
+            self.assertEqual(v.encoded, ("gzip", body))
+        pass  # void return
+
+    def test_validated_deflate(self):
+        # zlib-wrapped as well as raw deflate streams
+        for wbits in (zlib.MAX_WBITS, -zlib.MAX_WBITS):
+            body = self.compress(wbits)
+            with validated(make_response(body, "deflate")) as v:
+                self.assertEqual(v.json(validate_schema=False), self.data)
+                self.assertEqual(v.encoded, None)
+        pass  # void return
+
+    def test_validated_unknown_length(self):
+        # the buffer grows (from a small one) beyond `MIN_BUFFER_SIZE`
+        self.assertTrue(len(self.body) > validated.MIN_BUFFER_SIZE)
+        with validated(make_response(self.body, length=False)) as v:
+            self.assertEqual(v.json(validate_schema=False), self.data)
+        pass  # void return
+
+    def test_validated_consumed(self):
+        # the body of a non-streamed response has been read already
+        r = make_response(self.body)
+        self.assertEqual(r.content, self.body)
+        with validated(r) as v:
+            self.assertEqual(v.json(validate_schema=False), self.data)
+        pass  # void return
+
+    def test_validated_malformed(self):
+        for body, encoding in ((self.body, "gzip"), (self.body, "deflate"),
+                               (self.body, "br")):
+            self.assertRaises(RuntimeError, validated(
+                make_response(body, encoding)).__enter__)
+        pass  # void return
+
+    pass
+
+
 @unittest.skipIf(
     not os.environ.get('DATAGATOR_CREDENTIALS', None) and
     os.environ.get('TRAVIS', False),
@@ -150,6 +236,39 @@ class TestDataSet(unittest.TestCase):
 
         pass  # void return
 
+    def test_DataSet_revalidate(self):
+        repo = Repo(self.repo)
+
+        # the first lookup caches the validators along with the content
+        ds = repo['IGO_Members']
+        uri = "{0}/{1}".format(repo.uri, ds.name)
+        meta = Entity.store.meta(uri)
+        self.assertTrue(meta.get("etag") or meta.get("last_modified"))
+
+        # consecutive lookups revalidate (rather than discard) the content
+        ds = repo['IGO_Members']
+        self.assertEqual(Entity.store.meta(uri), meta)
+        self.assertTrue(ds.rev > 0)
+
+        pass  # void return
+
+    def test_DataSet_prefetch(self):
+        repo = Repo(self.repo)
+        ds = DataSet(repo, "IGO_Members", 1)
+        for key in ds:
+            del ds[key].cache
+
+        # cold items are fetched concurrently into the cache
+        keys = ds.prefetch()
+        self.assertEqual(sorted(keys), sorted(ds))
+        for key in ds:
+            self.assertTrue(Entity.store.exists(ds[key].uri))
+
+        # cached items are not fetched again
+        self.assertEqual(ds.prefetch(), [])
+
+        pass  # void return
+
     pass
 
 
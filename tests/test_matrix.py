@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    tests.test_matrix
+    ~~~~~~~~~~~~~~~~~
+
+    :copyright: 2015 by `University of Denver <http://pardee.du.edu/>`_
+    :license: Apache 2.0, see LICENSE for more details.
+
+    :author: `LIU Yu <liuyu@opencps.net>`_
+    :date: 2015/12/21
+"""
+
+from __future__ import unicode_literals
+
+import contextlib
+import json
+import logging
+import os
+import sys
+
+try:
+    from . import config
+    from .config import *
+except (ValueError, ImportError):
+    import config
+    from config import *
+
+from datagator.api.client._matrix import Column, ColumnarMatrix
+from datagator.api.client._matrix import RowIndex, SparseMatrix
+from datagator.api.client._stream import ObjectReader
+from datagator.api.client.data import Matrix
+
+
+__all__ = ['TestColumn',
+           'TestColumnarMatrix',
+           'TestSparseMatrix',
+           'TestRowIndex',
+           'TestMatrix', ]
+__all__ = [to_native(n) for n in __all__]
+
+
+_log = logging.getLogger("datagator.{0}".format(__name__))
+
+
+def load_matrix(name):
+    return json.loads(to_unicode(load_data(os.path.join("json", name))))
+
+
+class TestColumn(unittest.TestCase):
+
+    def test_Column_typecode(self):
+        self.assertEqual(Column([None, 1, 2]).typecode, "b")
+        self.assertTrue(Column([None, 1, 2 ** 40]).typecode in "lq")
+        self.assertEqual(Column([1, 2.5]).typecode, "d")
+        self.assertEqual(Column(["A", 1]).typecode, None)
+        self.assertEqual(Column([True, None]).typecode, None)
+        pass  # void return
+
+    def test_Column_mask(self):
+        values = [None] * 9 + [3]
+        column = Column(values)
+        self.assertEqual(list(column), values)
+        self.assertEqual(bytes(column.mask), b"\x00\x02")
+        self.assertEqual(column[-1], 3)
+        self.assertEqual(list(column.view(8)), [None, 3])
+        pass  # void return
+
+    pass
+
+
+class TestColumnarMatrix(unittest.TestCase):
+
+    def test_ColumnarMatrix_rows(self):
+        data = load_matrix(os.path.join("IGO_Members", "UN.json"))
+        m = ColumnarMatrix.from_rows(
+            data['rows'], data['columnHeaders'], data['rowHeaders'])
+        self.assertEqual(m.to_rows(), data['rows'])
+        layout = dict([(k, v) for k, v in data.items()
+                       if k not in ("kind", "rows")])
+        self.assertEqual(m.layout, layout)
+        pass  # void return
+
+    def test_ColumnarMatrix_blocks(self):
+        rows = [["Country", 2010, 2011, 2012],
+                ["China", None, 1, None],
+                ["United States", None, 1, 1]]
+        m = ColumnarMatrix.from_rows(rows, 1, 1)
+        self.assertEqual(m.preamble.to_rows(), [["Country"]])
+        self.assertEqual(m.column_headers.to_rows(), rows[:1])
+        self.assertEqual(m.row_headers.to_rows(), [r[:1] for r in rows])
+        self.assertEqual(m.body.to_rows(), [r[1:] for r in rows[1:]])
+        # the blocks are self-similar, see `docs/model.rst`
+        self.assertEqual(m.column_headers.row_headers.to_rows(),
+                         m.preamble.to_rows())
+        self.assertEqual(m.row_headers.column_headers.to_rows(),
+                         m.preamble.to_rows())
+        self.assertEqual(list(m.body.column(2)), [None, 1])
+        self.assertEqual(m.body.column(2).typecode, "b")
+        self.assertEqual(m.body[1, 1], 1)
+        self.assertRaises(IndexError, m.body.cell, 2, 0)
+        pass  # void return
+
+    pass
+
+
+class TestSparseMatrix(unittest.TestCase):
+
+    def test_SparseMatrix_rows(self):
+        data = load_matrix(os.path.join("IGO_Members", "UN.json"))
+        m = SparseMatrix.from_rows(
+            data['rows'], data['columnHeaders'], data['rowHeaders'])
+        self.assertEqual(m.to_rows(), data['rows'])
+        self.assertTrue(m.density < 0.1)
+        # JSON-serialized runs are much smaller than the content
+        runs = json.dumps(m.to_json())
+        self.assertTrue(len(runs) * 10 < len(json.dumps(data)))
+        m = SparseMatrix.from_json(json.loads(runs))
+        self.assertEqual(m.to_rows(), data['rows'])
+        pass  # void return
+
+    def test_SparseMatrix_runs(self):
+        rows = [["Country", 2010, 2011, 2012, 2013],
+                ["China", None, 1, 1, 1.0],
+                ["United States", None, None, 1, 1]]
+        m = SparseMatrix.from_rows(rows, 1, 1)
+        self.assertEqual(m.to_rows(), rows)
+        self.assertEqual(type(m.cell(1, 4)), float)
+        self.assertEqual(m.body.to_rows(), [r[1:] for r in rows[1:]])
+        self.assertEqual(m.column(2, 1), [1, None])
+        pass  # void return
+
+    def test_SparseMatrix_get(self):
+        rows = [["Country", 2010, 2011],
+                ["China", None, 1],
+                ["United States", 1, 1]]
+        m = SparseMatrix.from_rows(rows, 1, 1)
+        self.assertEqual(m.get("China", 2011), 1)
+        self.assertEqual(m.get("China", 2010), None)
+        self.assertEqual(m.get("Canada", 2010, 0), 0)
+        pass  # void return
+
+    pass
+
+
+class TestRowIndex(unittest.TestCase):
+
+    def test_RowIndex_single(self):
+        data = load_matrix(os.path.join("IGO_Members", "UN.json"))
+        index = RowIndex.from_rows(data['rows'], (0, ), 1)
+        self.assertTrue("United States" in index)
+        self.assertFalse("Country" in index)
+        offset, = index["United States"]
+        self.assertEqual(data['rows'][offset][0], "United States")
+        self.assertEqual(len(index), len(data['rows']) - 1)
+        pass  # void return
+
+    def test_RowIndex_multiple(self):
+        data = load_matrix(os.path.join("Embassies", "2010.json"))
+        index = RowIndex.from_rows(data['rows'], (0, 1), 1)
+        offsets = index[("Afghanistan", "Canada")]
+        self.assertEqual(data['rows'][offsets[0]][:2],
+                         ["Afghanistan", "Canada"])
+        # duplicate keys map to all matching rows
+        index = RowIndex.from_rows(data['rows'], (0, ), 1)
+        self.assertTrue(len(index["Afghanistan"]) > 1)
+        index = RowIndex.from_json(json.loads(json.dumps(index.to_json())))
+        self.assertTrue(len(index["Afghanistan"]) > 1)
+        self.assertEqual(index.get("Atlantis"), None)
+        self.assertRaises(KeyError, index.__getitem__, "Atlantis")
+        pass  # void return
+
+    pass
+
+
+class TestMatrix(unittest.TestCase):
+
+    class DataSet(object):
+        # stand-in of a (HEAD revision of) data set, not cached
+        uri = "repo/Pardee/IGO_Members"
+        pass
+
+    def test_Matrix_index_by(self):
+        raw = load_data(os.path.join("json", "IGO_Members", "UN.json"))
+        requests = []
+
+        @contextlib.contextmanager
+        def reader(matrix):
+            requests.append(matrix.uri)
+            yield ObjectReader([raw])
+
+        _reader = Matrix._reader
+        Matrix._reader = reader
+        try:
+            m = Matrix("datagator#Matrix", self.DataSet(), "UN_index_by")
+            index = m.index_by("Country")
+            count = len(requests)
+            # neither the column headers nor the rows are read again
+            self.assertTrue(m.index_by("Country") is index)
+            self.assertTrue(m.index_by(("Country", )) is index)
+            self.assertEqual(len(requests), count + 1)
+            self.assertTrue(m.index_by(("Country", )) is index)
+            self.assertEqual(len(requests), count + 1)
+        finally:
+            Matrix._reader = _reader
+        pass  # void return
+
+    pass
+
+
+def test_suite():
+    return unittest.TestSuite([
+        unittest.TestLoader().loadTestsFromTestCase(eval(c)) for c in __all__])
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest=to_native("test_suite"))
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    tests.test_ratelimit
+    ~~~~~~~~~~~~~~~~~~~~
+
+    :copyright: 2015 by `University of Denver <http://pardee.du.edu/>`_
+    :license: Apache 2.0, see LICENSE for more details.
+
+    :author: `LIU Yu <liuyu@opencps.net>`_
+    :date: 2015/12/15
+"""
+
+from __future__ import unicode_literals
+
+import logging
+import os
+import sys
+import time
+
+try:
+    from . import config
+    from .config import *
+except (ValueError, ImportError):
+    import config
+    from config import *
+
+from datagator.api.client._backend.ratelimit import TokenBucket
+from datagator.api.client._backend.ratelimit import SharedTokenBucket
+
+
+__all__ = ['TestTokenBucket',
+           'TestSharedTokenBucket', ]
+__all__ = [to_native(n) for n in __all__]
+
+
+_log = logging.getLogger("datagator.{0}".format(__name__))
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def make_bucket(self, limit):
+        bucket = TokenBucket(limit)
+        bucket.MIN_INTERVAL = 0
+        return bucket
+
+    def test_TokenBucket_reserve(self):
+        bucket = self.make_bucket(3)
+        self.assertEqual([bucket.reserve() for i in range(3)], [0, 0, 0])
+        self.assertTrue(bucket.reserve() > 0)
+        pass  # void return
+
+    def test_TokenBucket_update(self):
+        bucket = self.make_bucket(200)
+        reset = int(time.time()) + 60
+        bucket.update(200, {
+            "X-RateLimit-Limit": "2000",
+            "X-RateLimit-Remaining": "1",
+            "X-RateLimit-Reset": "{0}".format(reset)})
+        self.assertEqual(bucket.remaining, 1)
+        self.assertEqual(bucket.reserve(), 0)
+        # exhausted quota is not restored until the window resets
+        delay = bucket.reserve()
+        self.assertTrue(50 < delay <= 60)
+        pass  # void return
+
+    def test_TokenBucket_retry_after(self):
+        bucket = self.make_bucket(200)
+        bucket.update(429, {"Retry-After": "30"})
+        self.assertTrue(25 < bucket.reserve() <= 30)
+        pass  # void return
+
+    pass
+
+
+class TestSharedTokenBucket(unittest.TestCase):
+
+    def test_SharedTokenBucket_reserve(self):
+        path = os.path.join(config.TEMP_DIR, "ratelimit.json")
+        buckets = [SharedTokenBucket(4, path) for i in range(2)]
+        for bucket in buckets:
+            bucket.MIN_INTERVAL = 0
+        granted = [b.reserve() == 0 for i in range(3) for b in buckets]
+        self.assertEqual(granted.count(True), 4)
+        pass  # void return
+
+    pass
+
+
+def test_suite():
+    return unittest.TestSuite([
+        unittest.TestLoader().loadTestsFromTestCase(eval(c)) for c in __all__])
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest=to_native("test_suite"))
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    tests.test_records
+    ~~~~~~~~~~~~~~~~~~
+
+    :copyright: 2015 by `University of Denver <http://pardee.du.edu/>`_
+    :license: Apache 2.0, see LICENSE for more details.
+
+    :author: `LIU Yu <liuyu@opencps.net>`_
+    :date: 2015/12/27
+"""
+
+from __future__ import unicode_literals
+
+import logging
+import os
+import threading
+
+try:
+    from . import config
+    from .config import *
+except (ValueError, ImportError):
+    import config
+    from config import *
+
+from datagator.api.client._records import RecordStore
+
+
+__all__ = ['TestRecordStore', ]
+__all__ = [to_native(n) for n in __all__]
+
+
+_log = logging.getLogger("datagator.{0}".format(__name__))
+
+
+class TestRecordStore(unittest.TestCase):
+
+    def make_store(self, name):
+        return RecordStore(os.path.join(
+            config.TEMP_DIR, "{0}.records".format(name), "records.sqlite"))
+
+    def test_RecordStore_get_put(self):
+        store = self.make_store("get_put")
+        key = "repo/Pardee/Bakery/US#fingerprint"
+        self.assertEqual(store.get(key), None)
+        self.assertEqual(store.get(key, {}), {})
+        store.put(key, {"fingerprint": "abc"})
+        self.assertEqual(store.get(key), {"fingerprint": "abc"})
+        store.put(key, {"fingerprint": "def"})
+        self.assertEqual(store.get(key), {"fingerprint": "def"})
+        store.delete(key)
+        self.assertEqual(store.get(key), None)
+        pass  # void return
+
+    def test_RecordStore_put_many(self):
+        store = self.make_store("put_many")
+        store.put("a", 0)
+        store.put_many(dict([("{0}".format(i), i) for i in range(3)]))
+        self.assertEqual([store.get("{0}".format(i)) for i in range(3)],
+                         list(range(3)))
+        self.assertEqual(store.get("a"), 0)
+        pass  # void return
+
+    def test_RecordStore_durable(self):
+        store = self.make_store("durable")
+        store.put("a", [1, "b"])
+        del store
+        # records outlive the store (e.g. the process) writing them
+        store = self.make_store("durable")
+        self.assertEqual(store.get("a"), [1, "b"])
+        pass  # void return
+
+    def test_RecordStore_threads(self):
+        store = self.make_store("threads")
+        threads = [threading.Thread(target=store.put, args=(
+            "{0}".format(i), i)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual([store.get("{0}".format(i)) for i in range(4)],
+                         list(range(4)))
+        pass  # void return
+
+    pass
+
+
+def test_suite():
+    return unittest.TestSuite([
+        unittest.TestLoader().loadTestsFromTestCase(eval(c)) for c in __all__])
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest=to_native("test_suite"))
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    tests.test_service
+    ~~~~~~~~~~~~~~~~~~
+
+    :copyright: 2015 by `University of Denver <http://pardee.du.edu/>`_
+    :license: Apache 2.0, see LICENSE for more details.
+
+    :author: `LIU Yu <liuyu@opencps.net>`_
+    :date: 2015/12/27
+"""
+
+from __future__ import unicode_literals
+
+import io
+import json
+import logging
+import zlib
+
+try:
+    from . import config
+    from .config import *
+except (ValueError, ImportError):
+    import config
+    from config import *
+
+from datagator.api.client._backend.service import DataGatorService, \
+    ThrottleAdapter, gzip_payload
+
+from requests import PreparedRequest
+from requests.adapters import HTTPAdapter
+
+
+__all__ = ['TestGzipPayload', 'TestDataGatorService',
+           'TestThrottleAdapter', ]
+__all__ = [to_native(n) for n in __all__]
+
+
+_log = logging.getLogger("datagator.{0}".format(__name__))
+
+
+def gunzip(data):
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+class Session(object):
+    """
+    Stand-in of ``requests.Session`` replying with canned responses
+    """
+
+    class Response(object):
+
+        def __init__(self, status_code, message=""):
+            self.status_code = status_code
+            self.text = json.dumps({
+                "kind": "datagator#Error" if status_code >= 400 else
+                "datagator#Status", "code": status_code, "message": message})
+            pass
+
+        def close(self):
+            pass
+
+        pass
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        # `(<headers>, <body>)` of each request
+        self.requests = []
+        pass
+
+    def request(self, method, url, data, headers):
+        body = data.read() if hasattr(data, "read") else data
+        self.requests.append((headers, body))
+        return self.responses.pop(0)
+
+    pass
+
+
+class TestGzipPayload(unittest.TestCase):
+
+    def test_gzip_payload_bytes(self):
+        payload = to_bytes(json.dumps(dict([
+            ("K{0}".format(i), i) for i in range(1000)])))
+        f = gzip_payload(payload)
+        compressed = f.read()
+        f.close()
+        self.assertTrue(len(compressed) < len(payload))
+        self.assertEqual(gunzip(compressed), payload)
+        pass  # void return
+
+    def test_gzip_payload_chunked(self):
+        payload = to_bytes("[{0}]".format(", ".join(
+            ["{0}".format(i) for i in range(2 ** 16)])))
+        f = gzip_payload(io.BytesIO(payload), chunk_size=1000)
+        self.assertEqual(f.tell(), 0)
+        self.assertEqual(gunzip(f.read()), payload)
+        f.close()
+        pass  # void return
+
+    pass
+
+
+class TestDataGatorService(unittest.TestCase):
+
+    def make_service(self, *responses):
+        service = DataGatorService(gzip=True)
+        service.http = Session(*[Session.Response(*r) for r in responses])
+        return service
+
+    def make_payload(self):
+        return dict([("K{0}".format(i), i) for i in range(1000)])
+
+    def test_compressed(self):
+        service = self.make_service((202, ))
+        payload = self.make_payload()
+        r = service.patch("repo/Pardee/Test/data/", payload)
+        self.assertEqual(r.status_code, 202)
+        (headers, body), = service.http.requests
+        self.assertEqual(headers.get("Content-Encoding"), "gzip")
+        self.assertEqual(json.loads(to_unicode(gunzip(body))), payload)
+        # small payloads are not compressed
+        service.http.responses.append(Session.Response(202))
+        service.patch("repo/Pardee/Test/data/", {"K": 0})
+        headers, body = service.http.requests[-1]
+        self.assertFalse("Content-Encoding" in headers)
+        self.assertEqual(json.loads(to_unicode(body)), {"K": 0})
+        self.assertTrue(service.gzip)
+        pass  # void return
+
+    def test_fallback_unsupported(self):
+        service = self.make_service((415, ), (202, ))
+        payload = self.make_payload()
+        r = service.patch("repo/Pardee/Test/data/", io.BytesIO(
+            to_bytes(json.dumps(payload))))
+        self.assertEqual(r.status_code, 202)
+        # the (rewound) file is sent again uncompressed
+        (h1, b1), (h2, b2) = service.http.requests
+        self.assertEqual(h1.get("Content-Encoding"), "gzip")
+        self.assertFalse("Content-Encoding" in h2)
+        self.assertEqual(json.loads(to_unicode(b2)), payload)
+        # and compression is disabled from then on
+        self.assertFalse(service.gzip)
+        service.http.responses.append(Session.Response(202))
+        service.put("repo/Pardee/Test", payload)
+        self.assertFalse("Content-Encoding" in service.http.requests[-1][0])
+        pass  # void return
+
+    def test_no_fallback_bad_request(self):
+        # a 400 response is about the payload (even if it names the
+        # encoding), and is not a reason to disable compression
+        service = self.make_service(
+            (400, "unsupported content encoding 'gzip'"), (202, ))
+        r = service.post("repo/Pardee/Test", self.make_payload())
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual(len(service.http.requests), 1)
+        self.assertTrue(service.gzip)
+        pass  # void return
+
+    def test_no_fallback(self):
+        # nor is a 415 response the uncompressed body fails as well
+        service = self.make_service((415, ), (400, "invalid data"))
+        r = service.patch("repo/Pardee/Test/data/", self.make_payload())
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual(len(service.http.requests), 2)
+        self.assertTrue(service.gzip)
+        pass  # void return
+
+    pass
+
+
+class Limiter(object):
+    """
+    Stand-in of ``RateLimiter`` admitting every request without delay
+    """
+
+    def acquire(self, cost=1, timeout=None):
+        return True
+
+    def update(self, status_code, headers, cost=1):
+        pass
+
+    def block(self, seconds):
+        pass
+
+    pass
+
+
+class Transport(HTTPAdapter):
+    """
+    Stand-in of ``HTTPAdapter`` replying with canned status codes
+    """
+
+    def __init__(self, *status_codes):
+        self.status_codes = list(status_codes)
+        # bodies of sent requests
+        self.bodies = []
+        super(Transport, self).__init__()
+        pass
+
+    def send(self, request, **kwargs):
+        body = request.body
+        self.bodies.append(body.read() if hasattr(body, "read") else body)
+        r = Session.Response(self.status_codes.pop(0))
+        r.headers = {"Retry-After": "0"}
+        return r
+
+    pass
+
+
+class TestThrottleAdapter(unittest.TestCase):
+
+    class Adapter(ThrottleAdapter, Transport):
+
+        def __init__(self, *status_codes):
+            self.limiter = Limiter()
+            Transport.__init__(self, *status_codes)
+            pass
+
+        pass
+
+    def make_request(self, body):
+        request = PreparedRequest()
+        request.prepare(
+            method="PATCH", url="http://localhost/repo/Pardee", data=body)
+        return request
+
+    def test_retry_bytes(self):
+        adapter = self.Adapter(429, 202)
+        r = adapter.send(self.make_request(b'{"kind": "x"}'))
+        self.assertEqual(r.status_code, 202)
+        self.assertEqual(adapter.bodies, [b'{"kind": "x"}'] * 2)
+        pass  # void return
+
+    def test_retry_file(self):
+        # the file-like body is rewound before being sent again
+        adapter = self.Adapter(429, 429, 202)
+        f = io.BytesIO(b'{"kind": "x"}')
+        r = adapter.send(self.make_request(f))
+        self.assertEqual(r.status_code, 202)
+        self.assertEqual(adapter.bodies, [b'{"kind": "x"}'] * 3)
+        pass  # void return
+
+    def test_no_retry_stream(self):
+        # while a generator cannot be replayed
+        adapter = self.Adapter(429, 202)
+        r = adapter.send(self.make_request(iter([b'{"kind": "x"}'])))
+        self.assertEqual(r.status_code, 429)
+        self.assertEqual(len(adapter.bodies), 1)
+        pass  # void return
+
+    pass
+
+
+def test_suite():
+    return unittest.TestSuite([
+        unittest.TestLoader().loadTestsFromTestCase(eval(c)) for c in __all__])
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest=to_native("test_suite"))
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    tests.test_stream
+    ~~~~~~~~~~~~~~~~~
+
+    :copyright: 2015 by `University of Denver <http://pardee.du.edu/>`_
+    :license: Apache 2.0, see LICENSE for more details.
+
+    :author: `LIU Yu <liuyu@opencps.net>`_
+    :date: 2015/12/19
+"""
+
+from __future__ import unicode_literals
+
+import io
+import json
+import logging
+import os
+import sys
+
+try:
+    from . import config
+    from .config import *
+except (ValueError, ImportError):
+    import config
+    from config import *
+
+from datagator.api.client._stream import MatrixWriter, ObjectReader
+
+
+__all__ = ['TestObjectReader', 'TestMatrixWriter', ]
+__all__ = [to_native(n) for n in __all__]
+
+
+_log = logging.getLogger("datagator.{0}".format(__name__))
+
+
+def chunked(raw, size):
+    for i in range(0, len(raw), size):
+        yield raw[i:i + size]
+    pass
+
+
+class TestObjectReader(unittest.TestCase):
+
+    def test_ObjectReader_Matrix(self):
+        raw = load_data(os.path.join("json", "IGO_Members", "UN.json"))
+        data = json.loads(to_unicode(raw))
+        rows = data.pop("rows")
+        # chunk boundaries may split tokens and multi-byte characters
+        for size in (1, 7, 4096):
+            reader = ObjectReader(chunked(raw, size))
+            self.assertEqual(list(reader), rows)
+            self.assertEqual(reader.members, data)
+        pass  # void return
+
+    def test_ObjectReader_early_stop(self):
+        consumed = []
+
+        def chunks():
+            for chunk in chunked(b'{"rows": [[1], [2], [3], [4]]}', 4):
+                consumed.append(chunk)
+                yield chunk
+            pass
+
+        reader = iter(ObjectReader(chunks()))
+        self.assertEqual([next(reader), next(reader)], [[1], [2]])
+        self.assertTrue(len(consumed) < 8)
+        pass  # void return
+
+    def test_ObjectReader_members(self):
+        reader = ObjectReader([b'{"a": 12', b'3, "rows": [], "b": "\xc3',
+                               b'\xa9"}'])
+        self.assertEqual(list(reader), [])
+        self.assertEqual(reader.members, {"a": 123, "b": "é"})
+        pass  # void return
+
+    def test_ObjectReader_malformed(self):
+        for raw in (b'{"rows": [[1], [2]', b'[]', b'{"rows": [1 2]}'):
+            self.assertRaises(ValueError, list, ObjectReader([raw]))
+        pass  # void return
+
+    pass
+
+
+class TestMatrixWriter(unittest.TestCase):
+
+    def test_MatrixWriter_Matrix(self):
+        raw = load_data(os.path.join("json", "IGO_Members", "UN.json"))
+        data = json.loads(to_unicode(raw))
+        rows = data['rows']
+        writer = MatrixWriter(
+            (row for row in rows), data['columnHeaders'], data['rowHeaders'])
+        f = io.BytesIO()
+        self.assertEqual(writer.write(f), len(f.getvalue()))
+        self.assertEqual(json.loads(to_unicode(f.getvalue())), data)
+        self.assertEqual(writer.shape, (len(rows), len(rows[0])))
+        # rows of a generator cannot be written twice
+        self.assertRaises(ValueError, writer.write, io.BytesIO())
+        pass  # void return
+
+    def test_MatrixWriter_ObjectReader(self):
+        rows = [["", "a", "b"], ["x", 1, 2.5], ["y", None, "\u00e9"]]
+        reader = ObjectReader(MatrixWriter(iter(rows), 1, 1))
+        self.assertEqual(list(reader), rows)
+        self.assertEqual(reader.members['rowsCount'], 3)
+        self.assertEqual(reader.members['columnsCount'], 3)
+        pass  # void return
+
+    def test_MatrixWriter_empty(self):
+        f = io.BytesIO()
+        writer = MatrixWriter([])
+        writer.write(f)
+        data = json.loads(to_unicode(f.getvalue()))
+        self.assertEqual(data['rows'], [])
+        self.assertEqual(writer.shape, (0, 0))
+        pass  # void return
+
+    def test_MatrixWriter_malformed(self):
+        self.assertRaises(ValueError, MatrixWriter, [], -1)
+        for rows, ch, rh in (([[1, 2], [3]], 0, 0),
+                             ([[1, 2], [3, 4, 5]], 0, 0),
+                             ([[1, 2]], 2, 0),
+                             ([[1, 2]], 0, 3)):
+            writer = MatrixWriter(rows, ch, rh)
+            self.assertRaises(ValueError, writer.write, io.BytesIO())
+            self.assertEqual(writer.shape, None)
+        pass  # void return
+
+    pass
+
+
+def test_suite():
+    return unittest.TestSuite([
+        unittest.TestLoader().loadTestsFromTestCase(eval(c)) for c in __all__])
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest=to_native("test_suite"))
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    tests.test_task
+    ~~~~~~~~~~~~~~~
+
+    :copyright: 2015 by `University of Denver <http://pardee.du.edu/>`_
+    :license: Apache 2.0, see LICENSE for more details.
+
+    :author: `LIU Yu <liuyu@opencps.net>`_
+    :date: 2015/12/23
+"""
+
+from __future__ import unicode_literals
+
+import logging
+import os
+import sys
+
+try:
+    from . import config
+    from .config import *
+except (ValueError, ImportError):
+    import config
+    from config import *
+
+from datagator.api.client._task import TaskWatcher
+
+
+__all__ = ['TestTaskWatcher', ]
+__all__ = [to_native(n) for n in __all__]
+
+
+_log = logging.getLogger("datagator.{0}".format(__name__))
+
+
+class TaskService(object):
+    """
+    Backend service where each task completes after a number of polls
+    """
+
+    class Response(object):
+
+        def __init__(self, data):
+            self.status_code = 200
+            self.data = data
+            pass
+
+        def json(self):
+            return self.data
+
+        pass
+
+    def __init__(self, tasks, errors=(), malformed=(), listing=True):
+        self.tasks = dict(tasks)
+        self.paths = []
+        # tasks failing to be polled (one at a time)
+        self.errors = set(errors)
+        # tasks polled as something else than a `Task`
+        self.malformed = set(malformed)
+        # whether the task listing endpoint is available
+        self.listing = listing
+        pass
+
+    def task(self, task_id):
+        self.tasks[task_id] -= 1
+        return {"kind": "datagator#Task", "id": task_id,
+                "status": "RUN" if self.tasks[task_id] > 0 else "SUC"}
+
+    def get(self, path):
+        self.paths.append(path)
+        prefix, _, suffix = path.rpartition("/")
+        if suffix in self.errors:
+            raise IOError("failed to poll task '{0}'".format(suffix))
+        elif suffix in self.malformed:
+            return self.Response({"kind": "datagator#Status", "code": 200})
+        elif suffix in self.tasks:
+            return self.Response(self.task(suffix))
+        elif not self.listing:
+            raise IOError("task listing not available")
+        start = int(suffix)
+        ids = sorted(self.tasks)[start:start + 10]
+        return self.Response({
+            "kind": "datagator#Page", "startIndex": start,
+            "itemsPerPage": 10, "itemsCount": len(self.tasks),
+            "items": [self.task(task_id) for task_id in ids]})
+
+    pass
+
+
+class TestTaskWatcher(unittest.TestCase):
+
+    def make_watcher(self, service):
+
+        class FastTaskWatcher(TaskWatcher):
+            MIN_INTERVAL = 0.01
+            MAX_INTERVAL = 0.02
+
+        return FastTaskWatcher(service)
+
+    def test_TaskWatcher_single(self):
+        service = TaskService({"T1": 3})
+        watcher = self.make_watcher(service)
+        task = watcher.watch("task/T1").result(timeout=5)
+        self.assertEqual(task['status'], "SUC")
+        self.assertEqual(service.paths, ["task/T1"] * 3)
+        self.assertEqual(len(watcher), 0)
+        pass  # void return
+
+    def test_TaskWatcher_batch(self):
+        tasks = dict([("T{0:02d}".format(i), 3) for i in range(25)])
+        service = TaskService(tasks)
+        watcher = self.make_watcher(service)
+        futures = [watcher.watch("task/{0}".format(task_id), "Pardee")
+                   for task_id in sorted(tasks)]
+        for f in futures:
+            self.assertEqual(f.result(timeout=5)['status'], "SUC")
+        # one page per 10 tasks and round, instead of one call per task
+        self.assertTrue(watcher.polls < 3 * len(tasks))
+        self.assertTrue(all([p.startswith("task/Pardee/")
+                             for p in service.paths]))
+        pass  # void return
+
+    def test_TaskWatcher_pages(self):
+        # the pending tasks are listed beyond the first pages
+        tasks = dict([("T{0:02d}".format(i), 1) for i in range(30)])
+        service = TaskService(tasks)
+        watcher = self.make_watcher(service)
+        futures = [watcher.watch("task/T{0}".format(i), "Pardee")
+                   for i in range(25, 30)]
+        for f in futures:
+            self.assertEqual(f.result(timeout=5)['status'], "SUC")
+        self.assertEqual(service.paths, [
+            "task/Pardee/0", "task/Pardee/10", "task/Pardee/20"])
+        pass  # void return
+
+    def test_TaskWatcher_errors(self):
+        service = TaskService({"T1": 2, "T2": 2, "T3": 2}, errors=["T2"],
+                              malformed=["T3"])
+        watcher = self.make_watcher(service)
+        futures = [watcher.watch("task/T{0}".format(i)) for i in (1, 2, 3)]
+        # a failed (or malformed) poll only fails the future of its task
+        self.assertEqual(futures[0].result(timeout=5)['status'], "SUC")
+        self.assertRaises(IOError, futures[1].result, 5)
+        self.assertRaises(RuntimeError, futures[2].result, 5)
+        self.assertEqual(len(watcher), 0)
+        pass  # void return
+
+    def test_TaskWatcher_listing_error(self):
+        # tasks are polled one at a time, if the listing fails
+        service = TaskService({"T1": 2, "T2": 2}, listing=False)
+        watcher = self.make_watcher(service)
+        futures = [watcher.watch("task/T{0}".format(i), "Pardee")
+                   for i in (1, 2)]
+        for f in futures:
+            self.assertEqual(f.result(timeout=5)['status'], "SUC")
+        pass  # void return
+
+    def test_TaskWatcher_timeout(self):
+        service = TaskService({"T1": 10 ** 6})
+        watcher = self.make_watcher(service)
+        future = watcher.watch("task/T1", timeout=0.05)
+        self.assertRaises(RuntimeError, future.result, 5)
+        pass  # void return
+
+    pass
+
+
+def test_suite():
+    return unittest.TestSuite([
+        unittest.TestLoader().loadTestsFromTestCase(eval(c)) for c in __all__])
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest=to_native("test_suite"))